@@ -0,0 +1,201 @@
+"""Versioned JSON API (``/api/v1``) over the same data as the HTML pages.
+
+Every endpoint takes ``fields=a,b,c`` to pick the keys it returns; only
+the columns those keys need are selected. ``/bounties`` and ``/users``
+also take ``ids=1,2,3`` to fetch up to ``API_MAX_BATCH`` records in one
+query, returned in the order asked for, with unknown or hidden ids left
+out. Money is in cents.
+
+Listings are public, like /bounties; single records and batches need a
+logged-in session, like the detail and profile pages. Bounties still
+being validated, or rejected, are only shown to their poster.
+"""
+import functools
+
+from flask import Blueprint, jsonify, request, session, url_for
+
+import httpcache
+from helpers import calculate_success_rate, decode_cursor, encode_cursor
+from images import image_src
+from listing import page_limit, pending_bounties
+
+API_MAX_BATCH = 100
+
+# Public bounty fields and the columns (over ``bounties b``) each one needs
+BOUNTY_FIELDS = {
+    "id": ["b.id"],
+    "item_name": ["b.item_name"],
+    "category": ["b.category"],
+    "price": ["b.price"],
+    "reward_fee": ["b.reward_fee"],
+    "description": ["b.description"],
+    "dispatch_box": ["b.dispatch_box"],
+    "status": ["b.status"],
+    "created_at": ["b.created_at"],
+    "poster_id": ["b.poster_id"],
+    "poster_name": ["(SELECT username FROM users WHERE id = b.poster_id) AS poster_name"],
+    "traveler_id": ["b.traveler_id"],
+    "image": ["b.img_url", "b.image_key"],
+    "thumbnail": ["b.img_url", "b.image_key"],
+}
+
+# Public user fields and the columns (over ``users u``) each one needs
+USER_FIELDS = {
+    "id": ["u.id"],
+    "username": ["u.username"],
+    "total_posted": ["u.total_posted"],
+    "completed_posted": ["u.completed_posted"],
+    "total_claimed": ["u.total_claimed"],
+    "completed_orders": ["u.completed_orders"],
+    "shopper_rate": ["u.total_posted", "u.completed_posted"],
+    "traveler_rate": ["u.total_claimed", "u.completed_orders"],
+}
+
+# Bounties anyone may read; the rest only their poster
+_VISIBLE = "(b.status IN ('pending', 'claimed', 'completed') OR b.poster_id = ?)"
+
+_COMPUTED = {
+    "image": lambda row: image_src(row),
+    "thumbnail": lambda row: image_src(row, thumbnail=True),
+    "shopper_rate": lambda row: calculate_success_rate(row["completed_posted"] or 0, row["total_posted"] or 0),
+    "traveler_rate": lambda row: calculate_success_rate(row["completed_orders"] or 0, row["total_claimed"] or 0),
+}
+
+
+class ApiError(Exception):
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def select_fields(available):
+    """Requested field names and the SELECT list that covers them."""
+    requested = request.args.get("fields")
+    if requested:
+        fields = list(dict.fromkeys(f.strip() for f in requested.split(",") if f.strip()))
+        unknown = [f for f in fields if f not in available]
+        if unknown:
+            raise ApiError(f"Unknown field(s): {', '.join(unknown)}")
+    else:
+        fields = list(available)
+
+    # id is always selected; batches are reordered by it
+    columns = [available["id"][0]]
+    for field in fields:
+        columns.extend(c for c in available[field] if c not in columns)
+    return fields, ", ".join(columns)
+
+
+def serialize(row, fields):
+    return {f: _COMPUTED[f](row) if f in _COMPUTED else row[f] for f in fields}
+
+
+def batch_ids():
+    """The ``ids`` query parameter as a list of ints, or None when absent."""
+    raw = request.args.get("ids")
+    if raw is None:
+        return None
+    try:
+        ids = list(dict.fromkeys(int(i) for i in raw.split(",") if i.strip()))
+    except ValueError:
+        raise ApiError("ids must be a comma-separated list of integers")
+    if not ids or len(ids) > API_MAX_BATCH:
+        raise ApiError(f"Between 1 and {API_MAX_BATCH} ids are allowed")
+    return ids
+
+
+def _in_order(rows, ids):
+    by_id = {row["id"]: row for row in rows}
+    return [by_id[i] for i in ids if i in by_id]
+
+
+def _placeholders(values):
+    return ", ".join("?" * len(values))
+
+
+def create_api(get_db):
+    api = Blueprint("api", __name__, url_prefix="/api/v1")
+
+    def login_required(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if session.get("user_id") is None:
+                raise ApiError("Login required", 401)
+            return view(*args, **kwargs)
+        return wrapper
+
+    @api.errorhandler(ApiError)
+    def api_error(e):
+        return jsonify({"error": e.message}), e.status
+
+    @api.errorhandler(404)
+    def not_found(e):
+        return jsonify({"error": "Not found"}), 404
+
+    @api.errorhandler(429)
+    def too_many_requests(e):
+        return jsonify({"error": "Too many requests"}), 429
+
+    @api.route("/bounties")
+    @httpcache.versioned(get_db)
+    def bounties():
+        ids = batch_ids()
+        if ids is not None:
+            return bounties_batch(ids)
+
+        fields, columns = select_fields(BOUNTY_FIELDS)
+        after = decode_cursor(request.args.get("after"))
+        before = decode_cursor(request.args.get("before"))
+        page = pending_bounties(get_db(), columns, search_query=request.args.get("search_query"),
+                                category=request.args.get("category"),
+                                dispatch_box=request.args.get("dispatch_box"),
+                                after=after, before=before, limit=page_limit(request.args.get("limit")))
+
+        rows = page.rows
+        args = {k: v for k, v in request.args.items() if k not in ("after", "before")}
+        links = {}
+        if rows and page.has_next:
+            links["next"] = url_for("api.bounties", after=encode_cursor(rows[-1]["sort_key"], rows[-1]["id"]), **args)
+        if rows and page.has_prev:
+            links["prev"] = url_for("api.bounties", before=encode_cursor(rows[0]["sort_key"], rows[0]["id"]), **args)
+        return jsonify({"data": [serialize(row, fields) for row in rows], "links": links})
+
+    @login_required
+    def bounties_batch(ids):
+        fields, columns = select_fields(BOUNTY_FIELDS)
+        rows = get_db().execute(f"SELECT {columns} FROM bounties b WHERE b.id IN ({_placeholders(ids)}) AND {_VISIBLE}",
+                                *ids, session["user_id"])
+        return jsonify({"data": [serialize(row, fields) for row in _in_order(rows, ids)]})
+
+    @api.route("/bounties/<int:bounty_id>")
+    @login_required
+    def bounty(bounty_id):
+        fields, columns = select_fields(BOUNTY_FIELDS)
+        rows = get_db().execute(f"SELECT {columns} FROM bounties b WHERE b.id = ? AND {_VISIBLE}",
+                                bounty_id, session["user_id"])
+        if not rows:
+            raise ApiError("Bounty not found", 404)
+        return jsonify({"data": serialize(rows[0], fields)})
+
+    @api.route("/users")
+    @login_required
+    def users():
+        ids = batch_ids()
+        if ids is None:
+            raise ApiError("ids is required")
+        fields, columns = select_fields(USER_FIELDS)
+        rows = get_db().execute(f"SELECT {columns} FROM users u WHERE u.id IN ({_placeholders(ids)})", *ids)
+        return jsonify({"data": [serialize(row, fields) for row in _in_order(rows, ids)]})
+
+    @api.route("/users/<int:user_id>")
+    @login_required
+    def user(user_id):
+        fields, columns = select_fields(USER_FIELDS)
+        rows = get_db().execute(f"SELECT {columns} FROM users u WHERE u.id = ?", user_id)
+        if not rows:
+            raise ApiError("User not found", 404)
+        return jsonify({"data": serialize(rows[0], fields)})
+
+    return api
@@ -1,15 +1,8 @@
 import os
 
-from cs50 import SQL
-from flask import Flask, flash, redirect, render_template, request, session, jsonify
-from flask_session import Session
-try:
-    from cachelib.file import FileSystemCache
-    from flask_session.cachelib.cachelib import CacheLibSessionInterface
-except Exception:
-    FileSystemCache = None
-    CacheLibSessionInterface = None
-from werkzeug.security import check_password_hash, generate_password_hash
+from flask import Flask, Response, flash, g, redirect, render_template, request, send_from_directory, session, jsonify, url_for
+from flask.sessions import SecureCookieSessionInterface
+from flask_session.cachelib.cachelib import CacheLibSessionInterface
 from flask_wtf import CSRFProtect
 from flask_wtf.csrf import generate_csrf
 from flask_limiter import Limiter
@@ -18,16 +11,48 @@ from dotenv import load_dotenv
 import urllib.parse
 import socket
 import ipaddress
-from datetime import datetime, timedelta, timezone
-
-from helpers import apology, login_required, get_product_info, validate_city, calculate_success_rate, to_cents, format_currency
+import threading
+import time
+import hmac
+
+from helpers import apology, login_required, get_product_info, geocode_city, calculate_success_rate, to_cents, format_currency, encode_cursor, decode_cursor
+from database import Database
+from migrations import migrate
+from listing import BOUNTIES_PAGE_SIZE, page_limit, pending_bounties
+from geocache import GeocodeCache, normalize_location
+from facets import FacetCache
+from fetcher import FETCH_CACHE_TTL
+from jobs import JobQueue, latest_job
+from images import IMAGES_DIR, IMMUTABLE, AccessLog, ImageError, ImageStore, image_src, link as link_image
+from api import create_api
+from passwords import HasherBusy, PasswordHasher
+from users import UserCache
+from replicas import ReplicaRouter
+from idempotency import FIELD as IDEMPOTENCY_FIELD, idempotent, new_key
+import feed
+import users
+import bounty_state
+import queries
+import storage
+import httpcache
+import instrumentation
 
 load_dotenv()  # Load environment variables from .env file
 
 app = Flask(__name__)
 
+# Request/query/outbound timings for /metrics and the slow-request log
+instrumentation.init_app(app)
+
 db_url = os.getenv("DATABASE_URL", "sqlite:///bounty.db")
 
+# Outbound-lookup endpoints; asgi.py applies the same limits to its native handlers
+FETCH_URL_LIMIT = os.getenv("FETCH_URL_LIMIT", "10 per minute")
+VALIDATE_CITY_LIMIT = os.getenv("VALIDATE_CITY_LIMIT", "30 per minute")
+# Connections to asgi.py's /events stream. The WSGI view is exempt: it is
+# polled every feed.FEED_RETRY_MS, and EventSource gives up for good on a 429
+EVENTS_LIMIT = os.getenv("EVENTS_LIMIT", "30 per minute")
+
 # Ensure a secret key is set for securely signing the session cookie
 secret = os.environ.get("SECRET_KEY")
 if not secret:
@@ -56,35 +81,141 @@ def inject_csrf_token():
 
 app.config["SESSION_PERMANENT"] = False
 
-# Prefer CacheLib backend (FileSystemCache) to avoid deprecated FileSystemSessionInterface
-if FileSystemCache is not None and CacheLibSessionInterface is not None:
-    cache_dir = os.path.join(os.getcwd(), 'flask_session_cache')
-    os.makedirs(cache_dir, exist_ok=True)
-    cache = FileSystemCache(cache_dir)
-    # Use CacheLibSessionInterface directly to avoid setting an unsupported SESSION_TYPE
-    app.session_interface = CacheLibSessionInterface(client=cache)
+# Sessions and rate-limit counters live in the STORAGE_URI backend so every
+# worker (and every host behind the load balancer) sees the same state.
+# SESSION_BACKEND=cookie keeps the session in Flask's signed cookie instead:
+# no storage round trip per request, but a copied cookie stays valid after
+# logout until the browser session ends.
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "server")
+if SESSION_BACKEND == "cookie":
+    app.session_interface = SecureCookieSessionInterface()
 else:
-    # Fallback to filesystem (may be deprecated depending on flask-session version)
-    app.config["SESSION_TYPE"] = "filesystem"
-    Session(app)
+    app.session_interface = CacheLibSessionInterface(client=storage.session_cache(storage.STORAGE_URI))
 
 
 db = None
+replica_router = None
+_db_lock = threading.Lock()
+
+# Nominatim lookups are cached in memory and in the geocode_cache table
+geocoder = GeocodeCache(geocode_city, lambda: db)
+
+# Filter dropdowns on /bounties, kept current by bounty_state change events
+facet_cache = FacetCache(lambda: db)
+bounty_state.on_change(facet_cache.handle)
+
+# Rendered home page blocks, rebuilt when the bounties table version moves
+fragments = httpcache.FragmentCache()
+
+# Geocoding and product scraping for new bounties run off the request thread
+job_queue = JobQueue(lambda: db)
+
+# Signed-in users, cached per process; bounty_state events drop the ones
+# whose counters changed
+user_cache = UserCache(lambda: db)
+bounty_state.on_change(user_cache.handle)
+
+# Public bounty changes for the /events stream
+event_log = feed.EventLog(lambda: db)
+bounty_state.record_with(event_log.record)
+
+# Password hashing runs in a small process pool, off the request threads
+passwords = PasswordHasher()
+
+# Local copies of product images, downloaded by the store_image job
+image_store = ImageStore()
+image_access = AccessLog(lambda: db)
+
+
+@job_queue.handler("validate_bounty", on_failure=bounty_state.reject)
+def validate_bounty(db, bounty_id, dispatch_box, product_url=None):
+    key = normalize_location(dispatch_box)
+    # Network errors propagate so the job is retried with backoff
+    full_name = geocoder.lookup(key) if key else None
+    if full_name is None:
+        bounty_state.reject(db, bounty_id)
+        return
+    img_url = get_product_info(product_url).get("image") if product_url else None
+    with db.transaction():
+        if bounty_state.publish(db, bounty_id, full_name, img_url):
+            job_queue.enqueue(db, "store_image", bounty_id)
+
+
+@job_queue.handler("store_image")
+def store_image(db, bounty_id):
+    rows = db.execute("SELECT img_url, image_key FROM bounties WHERE id = ?", bounty_id)
+    if not rows or rows[0]["image_key"] or not rows[0]["img_url"].startswith(("http://", "https://")):
+        return
+    img_url = rows[0]["img_url"]
+    try:
+        # Network errors propagate so the job is retried with backoff
+        image_key = image_store.fetch(img_url)
+    except ImageError as e:
+        # Not an image we can use; keep linking to the original
+        app.logger.info(f"Not storing image for bounty {bounty_id}: {e}")
+        return
+    link_image(db, image_store, bounty_id, img_url, image_key)
+
 
 @app.before_request
 def init_db():
     """Lazy initialize the DB to avoid side effects at import time."""
-    global db
+    global db, replica_router
     if db is None:
-        db = SQL(db_url)
+        with _db_lock:
+            if db is None:
+                database = Database(db_url)
+                instrumentation.instrument_engine(database.engine)
+                migrate(database)
+                replica_router = ReplicaRouter(
+                    database, on_connect=lambda replica: instrumentation.instrument_engine(replica.engine))
+                db = database
+                job_queue.start()
+                replica_router.start()
+
+
+@app.before_request
+def load_user():
+    user_id = session.get("user_id")
+    g.user = user_cache.get(user_id) if user_id is not None else None
+
+
+def read_db():
+    """Database for this request's reads: a replica (DATABASE_REPLICA_URLS),
+    unless the signed-in user changed something moments ago."""
+    if "read_db" not in g:
+        g.read_db = replica_router.reader(session.get("wrote_at"))
+    return g.read_db
+
+
+@app.after_request
+def remember_write(response):
+    # Keeps the user's reads on the primary until replicas have their change
+    if (replica_router and replica_router.replicas and request.method == "POST" and response.status_code < 400
+            and request.endpoint not in ("bounties", "login") and session.get("user_id")):
+        session["wrote_at"] = time.time()
+    return response
+
+
+# RATELIMIT_ENABLED=0 turns every limit off (load tests drive the app from one address)
+app.config.setdefault("RATELIMIT_ENABLED", os.getenv("RATELIMIT_ENABLED", "1") == "1")
 
 limiter = Limiter(
     get_remote_address,
     app=app,
     default_limits=["200 per day", "50 per hour"],
-    storage_uri="memory://",
+    storage_uri=storage.STORAGE_URI,
 )
 
+# JSON API for script.js and the mobile client
+api = create_api(read_db)
+limiter.limit(os.getenv("API_LIMIT", "120 per minute"))(api)
+app.register_blueprint(api)
+
+
+app.add_template_global(image_src)
+app.add_template_global(new_key, "idempotency_key")
+
 
 @app.template_filter('currency')
 def currency_filter(cents):
@@ -95,25 +226,86 @@ def currency_filter(cents):
 
 @app.after_request
 def after_request(response):
-    """Ensure responses aren't cached"""
-    response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-    response.headers["Expires"] = 0
-    response.headers["Pragma"] = "no-cache"
+    """Responses aren't cached unless the route set its own policy"""
+    if "Cache-Control" not in response.headers:
+        response.headers["Cache-Control"] = httpcache.NO_STORE
+        response.headers["Expires"] = 0
+        response.headers["Pragma"] = "no-cache"
     return response
 
 
+@app.route("/images/<name>")
+@limiter.exempt
+def stored_image(name):
+    """Content-addressed images never change, so browsers and CDNs keep them for good."""
+    response = send_from_directory(IMAGES_DIR, name, max_age=31536000)
+    response.headers["Cache-Control"] = IMMUTABLE
+    # Feeds the least-recently-used order of scripts/cleanup_images.py
+    image_access.touch(name)
+    return response
+
+
+def _metrics_forbidden():
+    """404 response while METRICS_TOKEN is unset, 403 unless the request carries it.
+
+    Metrics name every endpoint and normalized SQL statement, so they are
+    never served without a token.
+    """
+    token = os.getenv("METRICS_TOKEN")
+    if not token:
+        return Response("Not Found\n", status=404, mimetype="text/plain")
+    if not hmac.compare_digest(request.headers.get("Authorization", "").encode(), f"Bearer {token}".encode()):
+        return Response("Forbidden\n", status=403, mimetype="text/plain")
+    return None
+
+
+@app.route("/events")
+@limiter.exempt
+def events():
+    """Bounty changes since the browser's Last-Event-ID as Server-Sent Events.
+
+    Under WSGI this is polling: it answers and closes instead of holding a
+    thread per browser, and EventSource asks again after feed.FEED_RETRY_MS.
+    Every open tab polls, unthrottled, so the polls read from a replica when
+    there is one. A lagging replica only delays events: ids only grow, so
+    the next poll picks up where this one stopped. asgi.py serves this path
+    as a long-lived stream instead.
+    """
+    after = feed.last_event_id(request.headers.get("Last-Event-ID") or request.args.get("after"))
+    return Response(feed.replay(read_db(), after), mimetype="text/event-stream")
+
+
+@app.route("/metrics")
+@limiter.exempt
+def metrics():
+    """Prometheus scrape target; needs METRICS_TOKEN, sent as a bearer token."""
+    return _metrics_forbidden() or Response(
+        db.metrics_text() + replica_router.metrics_text() + instrumentation.metrics_text(),
+        mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/metrics/profile")
+@limiter.exempt
+def metrics_profile():
+    """Sample all threads for ?seconds=N (max 60); needs PROFILING_ENABLED=1."""
+    if not instrumentation.PROFILING_ENABLED:
+        return Response("Not Found\n", status=404, mimetype="text/plain")
+    seconds = max(1, min(request.args.get("seconds", 10, type=int), 60))
+    return _metrics_forbidden() or Response(instrumentation.sample_profile(seconds), mimetype="text/plain")
+
+
 @app.route("/")
+@httpcache.versioned(read_db)
 @limiter.limit("10 per second")
 def index():
     # Home page route
     try:
-        featured_bounties = db.execute(
-            "SELECT * FROM bounties WHERE status = 'pending' ORDER BY reward_fee DESC LIMIT 4"
-        )
-
+        featured_html = fragments.get_or_render("featured_bounties", httpcache.table_version(read_db())[0], lambda: render_template(
+            "_featured_bounties.html",
+            featured_bounties=read_db().execute(queries.FEATURED_BOUNTIES)))
     except Exception:
-        featured_bounties = []  
-    return render_template("index.html", featured_bounties=featured_bounties)
+        featured_html = ""
+    return render_template("index.html", featured_html=featured_html)
 
 
 @app.route("/login", methods=["GET", "POST"])
@@ -130,11 +322,25 @@ def login():
         if not username or not password or not email_val:
             return apology("Please provide both username, password and email.", 400)
 
-        rows = db.execute("SELECT * FROM users WHERE username = ? AND email = ?", username, email_val)
-        if len(rows) != 1 or not check_password_hash(rows[0]["password_hash"], password):
+        rows = db.execute("SELECT id, password_hash FROM users WHERE username = ? AND email = ?", username, email_val)
+        if len(rows) != 1:
+            passwords.reject()
             return apology("Invalid username, password and email")
 
-        session["user_id"] = rows[0]["id"]
+        user = rows[0]
+        try:
+            matches, new_hash = passwords.verify(user["password_hash"], password)
+        except HasherBusy:
+            return apology("Too many sign-ins right now, please try again.", 503)
+        if not matches:
+            return apology("Invalid username, password and email")
+
+        # Stored with outdated hash parameters; upgrade while we have the password
+        if new_hash:
+            db.execute("UPDATE users SET password_hash = ? WHERE id = ? AND password_hash = ?",
+                       new_hash, user["id"], user["password_hash"])
+
+        session["user_id"] = user["id"]
         return redirect("/")
 
     else:
@@ -152,6 +358,7 @@ def logout():
 
 @app.route("/register", methods=["GET", "POST"])
 @limiter.limit("10 per hour")
+@idempotent(lambda: db)
 def register():
     
     session.clear() # Clear any existing session data
@@ -176,15 +383,13 @@ def register():
         if password != confirmation:
             return apology("Passwords do not match.", 400)
 
-        # Check if username or email already exists
-        existing_user = db.execute("SELECT id FROM users WHERE username = ? OR email = ?", name, email_val)
-        if existing_user:
-            return apology("Username or email already exists.", 400)
-
-        hash_password = generate_password_hash(password)
+        try:
+            hash_password = passwords.hash(password)
+        except HasherBusy:
+            return apology("Too many sign-ups right now, please try again.", 503)
 
-        db.execute("INSERT INTO users (username, password_hash, email) VALUES(?, ?, ?)", 
-                name, hash_password, email_val)
+        if users.create(db, name, email_val, hash_password) is None:
+            return apology("Username or email already exists.", 400)
 
         return redirect("/")
     else:
@@ -194,13 +399,9 @@ def register():
 @app.route("/order", methods=["GET", "POST"])
 @limiter.limit("10 per hour")
 @login_required
+@idempotent(lambda: db)
 def order():
     if request.method == "POST":
-        if session.get('is_processing_order'):
-            return apology("Your request is being processed. Please wait.", 429)
-        
-        user_id = session.get("user_id")
-
         item_name = request.form.get("item_name")
         category = request.form.get("category")
         price = request.form.get("price")
@@ -208,13 +409,16 @@ def order():
         description = request.form.get("description")
         img_url = request.form.get("img_url")
         dispatch_box = request.form.get("dispatch_box") or request.form.get("location")
+        product_url = request.form.get("product_url")
         if not all([item_name, price, reward, description, dispatch_box]):
             return apology("All fields are required", 400)
-        
-        is_real, full_name = validate_city(dispatch_box)
-        if not is_real:
-            return apology("The city does not exist. Please check again!", 400)
-        
+
+        # Only look for an image when the poster did not supply one
+        if img_url and img_url != bounty_state.DEFAULT_IMAGE:
+            product_url = None
+        elif product_url and urllib.parse.urlparse(product_url).scheme not in ("http", "https"):
+            product_url = None
+
         try:
             price_cents = to_cents(price)
             reward_cents = to_cents(reward)
@@ -223,159 +427,159 @@ def order():
         except ValueError:
             return apology("Price and reward must be numbers", 400)
         
-        last_order = db.execute("SELECT created_at FROM bounties WHERE poster_id = ? ORDER BY created_at DESC LIMIT 1", user_id)
-        if last_order:
-            try:
-                last_time = datetime.strptime(last_order[0]['created_at'], '%Y-%m-%d %H:%M:%S')
-
-                now = datetime.now()
-                diff = (now - last_time).total_seconds()
-
-                if 0 <= diff < 15:
-                    return apology(f"Please wait {int(15 - diff)}s...", 400)
-            except (ValueError, TypeError):
-                pass
-        
-        session['is_processing_order'] = True
         try:
-            db.execute("INSERT INTO bounties (poster_id, item_name, category, price, reward_fee, description, img_url, dispatch_box) VALUES(?, ?, ?, ?, ?, ?, ?, ?)",
-                    session["user_id"], item_name, category, price_cents, reward_cents, description, img_url, full_name)
-            flash("Bounty successfully posted!")
-            return redirect("/")
+            # The dispatch box is geocoded by a background job, which lists
+            # the bounty once the city checks out
+            key = request.form.get(IDEMPOTENCY_FIELD)
+            with db.transaction():
+                bounty_id = bounty_state.create(db, session["user_id"], item_name, category, price_cents, reward_cents,
+                                                description, img_url, dispatch_box.strip(), status="validating",
+                                                idempotency_key=key)
+                if bounty_id is None:
+                    # A copy of this submission that arrived at the same time posted it
+                    rows = db.execute("SELECT id FROM bounties WHERE idempotency_key = ? AND poster_id = ?",
+                                      key, session["user_id"])
+                    if not rows:
+                        return apology("This form was already submitted.", 409)
+                    return redirect(f"/bounties/{rows[0]['id']}")
+                job_queue.enqueue(db, "validate_bounty", bounty_id, dispatch_box=dispatch_box, product_url=product_url)
+            flash("Bounty received! It will be listed as soon as the delivery city is verified.")
+            return redirect(f"/bounties/{bounty_id}")
         except Exception as e:
             return apology("An error occurred during save.", 500)
-        finally:
-            session.pop('is_processing_order', None)
 
     else:
         return render_template("order.html")
     
 
+def preview_error(url):
+    """/fetch_url body for a URL that must not be fetched, else None.
+    Shared with the async handler in asgi.py, as is product_preview."""
+    placeholder = bounty_state.DEFAULT_IMAGE
+    if not url:
+        return {"title": "Unknown Product", "image": placeholder, "description": ""}
+    # Basic validation: require scheme; private addresses are refused at connect time
+    parsed = urllib.parse.urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.netloc:
+        return {"title": "Invalid URL", "image": placeholder, "description": ""}
+    return None
+
+
+def product_preview(data):
+    """/fetch_url body and browser cache lifetime for fetched metadata."""
+    if not data:
+        return {"title": "Unknown Product", "image": bounty_state.DEFAULT_IMAGE, "description": ""}, None
+    if not data.get("image"):
+        data["image"] = bounty_state.DEFAULT_IMAGE
+    # Let the browser reuse a successful lookup as long as the fetcher's own cache would
+    return data, FETCH_CACHE_TTL if data.get("title") else None
+
+
 @app.route("/fetch_url")
-@limiter.limit("10 per minute")
+@limiter.limit(FETCH_URL_LIMIT)
 def fetch_url():
     url = request.args.get("url")
-    # Basic validation: require scheme and prevent SSRF to private IPs
-    placeholder = "/static/Bountygo.png"
-    if not url:
-        return jsonify({"title": "Unknown Product", "image": placeholder, "description": ""})
-
+    data, max_age = preview_error(url), None
     try:
-        parsed = urllib.parse.urlparse(url)
-        if parsed.scheme not in ("http", "https") or not parsed.netloc:
-            raise ValueError("Invalid URL scheme or host")
-        
-        data = get_product_info(url)
-        if not data:
-            data = {"title": "Unknown Product", "image": placeholder, "description": ""}
-        elif not data.get("image"):
-            data["image"] = placeholder
-
-        return jsonify(data)
+        if data is None:
+            data, max_age = product_preview(get_product_info(url))
     except Exception as e:
         app.logger.error(f"Fetch URL error: {e}")
-        return jsonify({"title": "Invalid URL", "image": placeholder, "description": ""})
+        data = {"title": "Invalid URL", "image": bounty_state.DEFAULT_IMAGE, "description": ""}
+
+    response = jsonify(data)
+    if max_age:
+        response.cache_control.private = True
+        response.cache_control.max_age = max_age
+    return response
+
+
+@app.route("/validate_city")
+@limiter.limit(VALIDATE_CITY_LIMIT)
+def validate_city():
+    """Live check for the location field of the order and edit forms."""
+    is_real, full_name = geocoder.validate(request.args.get("location"))
+    return jsonify({"valid": is_real, "full_name": full_name})
 
 
 @app.route("/bounties", methods=["GET", "POST"])
 @limiter.limit("10 per second")
+@httpcache.versioned(read_db, private=True)
 def bounties():
-    base_query = "SELECT * FROM bounties WHERE status = 'pending'"
-    params = []
-    categories = db.execute("SELECT DISTINCT category FROM bounties")
-    dispatch_boxes = db.execute("SELECT DISTINCT dispatch_box FROM bounties")
+    facets = facet_cache.get()
+
+    # Filters arrive from the search form (POST) or from pagination links (GET)
+    search_query = request.values.get("search_query")
+    category = request.values.get("category")
+    dispatch_box = request.values.get("dispatch_box")
+
+    limit = page_limit(request.args.get("limit"))
+    after = decode_cursor(request.args.get("after"))
+    before = decode_cursor(request.args.get("before"))
 
     try:
-        if request.method == "POST":
-            
-            search_query = request.form.get("search_query")
-            category = request.form.get("category")
-            dispatch_box = request.form.get("dispatch_box")
-            
-            query = base_query
-            if search_query:
-                query += " AND item_name ILIKE ?"
-                params.append(f"%{search_query}%")
+        page = pending_bounties(read_db(), search_query=search_query, category=category, dispatch_box=dispatch_box,
+                                after=after, before=before, limit=limit)
+    except Exception:
+        return apology("Database busy, please refresh.", 500)
+    rows = page.rows
 
-            if category:
-                query += " AND category = ?"
-                params.append(category)
+    if request.method == "POST" and not rows:
+        flash("No bounties found.")
+        return redirect("/bounties")
 
-            if dispatch_box:
-                query += " AND dispatch_box = ?"
-                params.append(dispatch_box)
+    filters = {k: v for k, v in (("search_query", search_query), ("category", category), ("dispatch_box", dispatch_box)) if v}
+    if limit != BOUNTIES_PAGE_SIZE:
+        filters["limit"] = limit
 
-            query += " ORDER BY price DESC"
-            bounties = db.execute(query, *params)
+    next_url = prev_url = None
+    if rows and page.has_next:
+        next_url = url_for("bounties", after=encode_cursor(rows[-1]["sort_key"], rows[-1]["id"]), **filters)
+    if rows and page.has_prev:
+        prev_url = url_for("bounties", before=encode_cursor(rows[0]["sort_key"], rows[0]["id"]), **filters)
+
+    return render_template("bounties.html", bounties=rows, categories=facets["category"], dispatch_boxes=facets["dispatch_box"],
+                           next_url=next_url, prev_url=prev_url)
 
-            if not bounties:
-                flash("No bounties found.")
-                return redirect("/bounties")
-            
-            return render_template("bounties.html", bounties=bounties, categories=categories, dispatch_boxes=dispatch_boxes)
-        
-        else:
-            bounties = db.execute(base_query + "ORDER BY price DESC")
-            return render_template("bounties.html", bounties=bounties, categories=categories, dispatch_boxes=dispatch_boxes)
-    except Exception as e:
-        return apology("Database busy, please refresh.", 500)
-    
 
 @app.route("/bounties/<int:bounty_id>")
 @limiter.limit("5 per second")
 @login_required
 def bounty_details(bounty_id):
-    rows = db.execute("""
-        SELECT b.*, u.username AS poster_name, u.id AS poster_id
-        FROM bounties b
-        JOIN users u ON b.poster_id = u.id
-        WHERE b.id = ?
-    """, bounty_id)
-    
+    rows = read_db().execute(queries.BOUNTY_DETAILS, session["user_id"], bounty_id)
+
     if not rows:
         return apology("Bounty not found", 404)
-    
-    current_bounty = rows[0]
-    
-    bounty_requests = db.execute("""
-        SELECT r.id AS req_id, r.traveler_id, u.username, u.completed_orders, u.total_claimed
-        FROM bounty_requests r 
-        JOIN users u ON r.traveler_id = u.id 
-        WHERE r.bounty_id = ? AND r.status = 'pending'
-    """, bounty_id)
 
-    for req in bounty_requests:
-        claimed = req["total_claimed"] or 0
-        completed = req["completed_orders"] or 0
-        req["rate"] = calculate_success_rate(completed, claimed)
+    current_bounty = {k: v for k, v in rows[0].items() if not k.startswith("req_")}
+    has_requested = bool(current_bounty.pop("has_requested"))
+    bounty_requests = [
+        {"req_id": row["req_id"], "traveler_id": row["req_traveler_id"], "username": row["req_username"],
+         "completed_orders": row["req_completed_orders"], "rate": row["req_rate"]}
+        for row in rows if row["req_id"] is not None
+    ]
 
+    job = latest_job(read_db(), bounty_id) if current_bounty["status"] in ("validating", "rejected") else None
 
-    check = db.execute("SELECT id FROM bounty_requests WHERE bounty_id = ? AND traveler_id = ?", 
-                       bounty_id, session["user_id"])
-    
-    has_requested = len(check) > 0
-    
     return render_template("details.html", 
                            bounty=current_bounty, 
                            requests=bounty_requests, 
-                           has_requested=has_requested)
+                           has_requested=has_requested,
+                           job=job)
 
 
 @app.route("/request_bounty", methods=["POST"])
 @limiter.limit("10 per hour")
 @login_required
+@idempotent(lambda: db)
 def request_bounty():
-    bounty_id = request.form.get("bounty_id")
-    traveler_id = session["user_id"]
+    bounty_id = request.form.get("bounty_id", type=int)
     if not bounty_id:
         return apology("Invalid bounty ID", 400)
 
-    exists = db.execute("SELECT id FROM bounty_requests WHERE bounty_id = ? AND traveler_id = ?", 
-                        bounty_id, traveler_id)
-    if exists:
-        return apology("You have already requested this bounty", 400)
-    
-    db.execute("INSERT INTO bounty_requests (bounty_id, traveler_id) VALUES(?, ?)", bounty_id, traveler_id)
+    if bounty_state.add_request(db, bounty_id, session["user_id"]) is None:
+        return apology("You have already requested this bounty, or it is no longer open", 400)
+
     flash("Bounty request submitted successfully!")
     return redirect(f"/bounties/{bounty_id}")
 
@@ -383,41 +587,28 @@ def request_bounty():
 @app.route("/accept_traveler", methods=["POST"])
 @limiter.limit("10 per hour")
 @login_required
+@idempotent(lambda: db)
 def accept_traveler():
-    request_id = request.form.get("request_id")
-
-    query = """
-            SELECT r.id, r.bounty_id, r.traveler_id 
-            FROM bounty_requests r
-            JOIN bounties b ON r.bounty_id = b.id
-            WHERE r.id = ? AND b.poster_id = ? AND b.status = 'pending'
-        """
-    req = db.execute(query, request_id, session["user_id"])
-    if not req:
+    request_id = request.form.get("request_id", type=int)
+    if not request_id:
         return apology("No permission or request not found.", 403)
-    
-    target = req[0]
 
-    db.execute("UPDATE bounties SET traveler_id = ?, status = 'claimed' WHERE id = ?", 
-               target["traveler_id"], target["bounty_id"])
-    db.execute("UPDATE bounty_requests SET status = 'accepted' WHERE id = ?", request_id)
-    db.execute("UPDATE bounty_requests SET status = 'rejected' WHERE bounty_id = ? AND id != ?", 
-               target["bounty_id"], request_id)
+    bounty_id = bounty_state.claim(db, request_id, session["user_id"])
+    if bounty_id is None:
+        return apology("No permission or request not found.", 403)
 
     flash("Traveler accepted!")
-    return redirect(f"/bounties/{target['bounty_id']}")
+    return redirect(f"/bounties/{bounty_id}")
 
 
 @app.route("/profile", methods=["POST", "GET"])
 @login_required
 def profile():
 
-    rows = db.execute("SELECT * FROM users WHERE id = ?", session["user_id"])
-    if not rows:
+    user = g.user
+    if user is None:
         return apology("User not found", 404)
 
-    user = rows[0]
-
     s_total = (user.get("total_posted") or 0)
     s_completed = (user.get("completed_posted") or 0)
     shopper_rate = calculate_success_rate(s_completed, s_total)
@@ -426,21 +617,8 @@ def profile():
     t_completed = (user.get("completed_orders") or 0)
     traveler_rate = calculate_success_rate(t_completed, t_total)
 
-    orders = db.execute("""
-        SELECT bounties.*, users.username AS traveler_name, users.id AS traveler_id
-        FROM bounties
-        LEFT JOIN users ON bounties.traveler_id = users.id
-        WHERE poster_id = ?
-        ORDER BY bounties.id DESC
-    """, session["user_id"])
-
-    claims = db.execute("""
-        SELECT bounties.*, users.username AS poster_name, users.id AS poster_id
-        FROM bounties
-        JOIN users ON bounties.poster_id = users.id
-        WHERE traveler_id = ?
-        ORDER BY bounties.id DESC
-    """, session["user_id"])
+    orders = read_db().execute(queries.PROFILE_ORDERS, session["user_id"])
+    claims = read_db().execute(queries.PROFILE_CLAIMS, session["user_id"])
 
     return render_template("profile.html", user=user,
                             shopper_rate=shopper_rate,
@@ -452,18 +630,15 @@ def profile():
 @app.route("/delete_bounty", methods=["POST"])
 @limiter.limit("10 per hour")
 @login_required
+@idempotent(lambda: db)
 def delete_bounty():
-    bounty_id = request.form.get("bounty_id")
+    bounty_id = request.form.get("bounty_id", type=int)
     if not bounty_id:
         return apology("Invalid bounty ID", 400)
 
-    bounty = db.execute("SELECT * FROM bounties WHERE id = ? AND poster_id = ? AND status = 'pending'", 
-                        bounty_id, session["user_id"])
-    
-    if not bounty:
+    if bounty_state.delete(db, bounty_id, session["user_id"]) is None:
         return apology("Bounty not found or unauthorized", 404)  
 
-    db.execute("DELETE FROM bounties WHERE id = ?", bounty_id)
     flash("Bounty deleted successfully!")
 
     return redirect("/profile")
@@ -472,6 +647,7 @@ def delete_bounty():
 @app.route("/edit_bounty/<int:bounty_id>", methods=["GET", "POST"])
 @limiter.limit("10 per hour")
 @login_required
+@idempotent(lambda: db)
 def update_bounty(bounty_id):
     bounty = db.execute("SELECT * FROM bounties WHERE id = ? AND poster_id = ?", bounty_id, session["user_id"])
 
@@ -492,7 +668,7 @@ def update_bounty(bounty_id):
         description = request.form.get("description")
         dispatch_box = request.form.get("dispatch_box") or request.form.get("location")
 
-        is_real, full_name = validate_city(dispatch_box)
+        is_real, full_name = geocoder.validate(dispatch_box)
 
         if not is_real:
             return apology("The city does not exist. Please check again!", 400)
@@ -500,24 +676,19 @@ def update_bounty(bounty_id):
         if not item_name or not price or not reward or not description or not dispatch_box:
             return apology("All fields are required", 400)
         
-        if bounty["status"] != "pending":
-            return apology("Only pending bounties can be edited.", 400)
-
         try:
-            price = int(round(float(request.form.get("price")) * 100))
-            reward = int(round(float(request.form.get("reward")) * 100))
+            price = to_cents(price)
+            reward = to_cents(reward)
 
             if price < 0 or reward < 0:
                 return apology("Price and reward must be positive", 400)
             
         except ValueError:
             return apology("Price and reward must be numbers", 400)
-        
 
+        if bounty_state.update(db, bounty_id, session["user_id"], item_name, price, reward, description, full_name) is None:
+            return apology("Only pending bounties can be edited.", 400)
 
-        db.execute("UPDATE bounties SET item_name = ?, price = ?, reward_fee = ?, description = ?, dispatch_box = ? WHERE id = ?",
-                   item_name, price, reward, description, full_name, bounty_id)
-        
         flash("Bounty updated successfully!")
         return redirect("/profile")
 
@@ -525,21 +696,14 @@ def update_bounty(bounty_id):
 @app.route("/completed_bounty", methods=["POST"])
 @limiter.limit("20 per hour")
 @login_required
+@idempotent(lambda: db)
 def completed_bounty():
-    bounty_id = request.form.get("bounty_id")
-    user_id = session["user_id"]
+    bounty_id = request.form.get("bounty_id", type=int)
+    if not bounty_id:
+        return apology("Invalid bounty ID", 400)
 
-    bounty = db.execute("SELECT * FROM bounties WHERE id = ? AND poster_id = ? AND status = 'claimed'", 
-                        bounty_id, user_id)
-    
-    if not bounty:
+    if bounty_state.complete(db, bounty_id, session["user_id"]) is None:
         return apology("Bounty not found or unauthorized", 404)
-    
-    if bounty[0]["poster_id"] != session["user_id"]:
-        return apology("You cannot mark this bounty as completed", 400)
-    
-    db.execute("UPDATE bounties SET status = 'completed' WHERE id = ?", bounty_id)
-    db.execute("DELETE FROM bounty_requests WHERE bounty_id = ?", bounty_id)
 
     flash("Bounty marked as completed! Thank you.")
     return redirect("/profile")
@@ -549,14 +713,9 @@ def completed_bounty():
 @limiter.limit("5 per minute")
 @login_required
 def view_public_profile(user_id):
-    rows = db.execute("""SELECT username, email, 
-                      total_posted, completed_posted, 
-                      total_claimed, completed_orders 
-                      FROM users 
-                      WHERE id = ?""", user_id)
-    if not rows:
+    target_user = user_cache.get(user_id)
+    if target_user is None:
         return apology("User not found", 404)
-    target_user = rows[0]
 
     s_total = target_user["total_posted"] or 0
     s_completed = target_user["completed_posted"] or 0
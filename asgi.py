@@ -0,0 +1,212 @@
+"""ASGI entry point (``SERVER_MODE=asgi`` in gunicorn_config.py, or
+``uvicorn asgi:app``).
+
+``/fetch_url`` and ``/validate_city`` spend nearly all their time waiting on
+upstream sites, so here they run as coroutines on the event loop with the
+SSRF-guarded httpx client from ``asyncfetch``: a slow upstream holds a
+socket, not a thread. ``/events`` is a long-lived Server-Sent Events
+stream fed by one ``feed.Broadcaster`` per worker, so thousands of idle
+browsers cost a socket and a queue each. Every other path is the
+unchanged Flask app, run on a pool of ``ASGI_THREADS`` threads through
+asgiref's WSGI adapter.
+
+Needs the packages in requirements-async.txt.
+"""
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+from limits import parse
+
+import app as flask_module
+import feed
+import helpers
+import instrumentation
+from asyncfetch import AsyncProductFetcher, avalidate_city, safe_client
+from httpcache import NO_STORE
+
+ASGI_THREADS = int(os.getenv("ASGI_THREADS", "8"))
+# Comment line sent on a quiet stream so proxies do not time it out
+FEED_KEEPALIVE = float(os.getenv("FEED_KEEPALIVE", "15"))
+
+flask_app = flask_module.app
+wsgi = WsgiToAsgi(flask_app)
+
+_clients = {}
+_broadcaster = feed.Broadcaster(lambda: flask_module.db)
+
+
+async def _json(send, status, payload, headers=()):
+    body = json.dumps(payload).encode()
+    await send({"type": "http.response.start", "status": status, "headers": [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode()),
+        *headers,
+    ]})
+    await send({"type": "http.response.body", "body": body})
+
+
+def _no_store():
+    return [(b"cache-control", NO_STORE.encode()), (b"expires", b"0"), (b"pragma", b"no-cache")]
+
+
+def _allowed(scope, limit):
+    """Apply a Flask-Limiter style limit on the limiter's shared storage."""
+    client = (scope.get("client") or ("unknown",))[0]
+    return flask_module.limiter.limiter.hit(parse(limit), "asgi", scope["path"], client)
+
+
+async def fetch_url(scope, query):
+    if not await asyncio.to_thread(_allowed, scope, flask_module.FETCH_URL_LIMIT):
+        return 429, {"error": "Too many requests"}, _no_store()
+
+    url = query.get("url", [None])[0]
+    data, max_age = flask_module.preview_error(url), None
+    try:
+        if data is None:
+            data, max_age = flask_module.product_preview(await _clients["products"].fetch(url))
+    except Exception as e:
+        flask_app.logger.error(f"Fetch URL error: {e}")
+        data = {"title": "Invalid URL", "image": flask_module.bounty_state.DEFAULT_IMAGE, "description": ""}
+
+    headers = [(b"cache-control", f"private, max-age={max_age}".encode())] if max_age else _no_store()
+    return 200, data, headers
+
+
+async def validate_city(scope, query):
+    if not await asyncio.to_thread(_allowed, scope, flask_module.VALIDATE_CITY_LIMIT):
+        return 429, {"error": "Too many requests"}, _no_store()
+
+    is_real, full_name = await avalidate_city(flask_module.geocoder, _clients["geocode"],
+                                              query.get("location", [None])[0])
+    return 200, {"valid": is_real, "full_name": full_name}, _no_store()
+
+
+async def _stream(send, after):
+    await send({"type": "http.response.start", "status": 200, "headers": [
+        (b"content-type", b"text/event-stream"),
+        (b"x-accel-buffering", b"no"),
+        *_no_store(),
+    ]})
+
+    async def write(text):
+        await send({"type": "http.response.body", "body": text.encode(), "more_body": True})
+
+    db = flask_module.db
+
+    async def catch_up(after):
+        while True:
+            rows = await asyncio.to_thread(feed.since, db, after)
+            for row in rows:
+                await write(feed.format_event(row))
+                after = row["id"]
+            if len(rows) < feed.FEED_BATCH:
+                return after
+
+    if after is None:
+        after = await asyncio.to_thread(feed.latest_id, db)
+        await write(f"retry: {feed.FEED_RETRY_MS}\nid: {after}\n\n")
+    else:
+        await write(f"retry: {feed.FEED_RETRY_MS}\n\n")
+        after = await catch_up(after)
+    queue = _broadcaster.subscribe(after)
+    try:
+        # Rows added between the backlog and the subscription
+        after = await catch_up(after)
+        while True:
+            try:
+                row = await asyncio.wait_for(queue.get(), FEED_KEEPALIVE)
+            except asyncio.TimeoutError:
+                await write(":\n\n")
+                continue
+            if row is None:
+                return
+            # Rows catch_up already sent
+            if row["id"] > after:
+                await write(feed.format_event(row))
+                after = row["id"]
+    finally:
+        _broadcaster.unsubscribe(queue)
+
+
+async def events(scope, receive, send):
+    if not await asyncio.to_thread(_allowed, scope, flask_module.EVENTS_LIMIT):
+        await _json(send, 429, {"error": "Too many requests"}, _no_store())
+        return
+    headers = dict(scope.get("headers") or [])
+    after = feed.last_event_id(headers.get(b"last-event-id", b"").decode("latin-1")
+                               or parse_qs(scope.get("query_string", b"").decode("latin-1")).get("after", [None])[0])
+
+    async def disconnected():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    stream = asyncio.ensure_future(_stream(send, after))
+    watcher = asyncio.ensure_future(disconnected())
+    try:
+        await asyncio.wait({stream, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        ended = stream.done()
+        stream.cancel()
+        watcher.cancel()
+        # Let the stream's finally unsubscribe before returning
+        error, _ = await asyncio.gather(stream, watcher, return_exceptions=True)
+    if ended:
+        if isinstance(error, Exception):
+            flask_app.logger.error(f"Event stream error: {error}")
+        else:
+            # Fell behind; closing makes the browser reconnect and replay
+            await send({"type": "http.response.body", "body": b""})
+
+
+NATIVE_ROUTES = {
+    "/fetch_url": fetch_url,
+    "/validate_city": validate_city,
+}
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(ASGI_THREADS))
+            # Same lazy init Flask runs before its first request; the native
+            # routes need the geocode table tier too
+            await asyncio.to_thread(flask_module.init_db)
+            _clients["products"] = AsyncProductFetcher(helpers._product_fetcher)
+            _clients["geocode"] = safe_client()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await _clients["products"].aclose()
+            await _clients["geocode"].aclose()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+
+    if scope["type"] == "http" and scope["method"] == "GET" and scope["path"] == "/events":
+        # Not timed: a stream lasts as long as the browser keeps the page open
+        await events(scope, receive, send)
+        return
+
+    handler = NATIVE_ROUTES.get(scope["path"]) if scope["type"] == "http" and scope["method"] == "GET" else None
+    if handler is None:
+        await wsgi(scope, receive, send)
+        return
+
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    stats, token = instrumentation.start_request()
+    status = 500
+    try:
+        status, payload, headers = await handler(scope, query)
+        await _json(send, status, payload, headers)
+    finally:
+        # Same series as the Flask views of the same name
+        instrumentation.finish_request(stats, token, handler.__name__, "GET", status)
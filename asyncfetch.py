@@ -0,0 +1,109 @@
+"""Non-blocking outbound HTTP for the ASGI entry point (``asgi.py``).
+
+``SafeAsyncTransport`` gives httpx the same guarantee ``SafeHTTPAdapter``
+gives requests: after every TCP connect (redirect hops included) the peer
+address is checked with ``security.is_disallowed_ip`` and the connection is
+dropped if it points inside the network. ``AsyncProductFetcher`` shares the
+cache of a ``fetcher.ProductFetcher`` and ``avalidate_city`` the tiers of a
+``geocache.GeocodeCache``, so both serving modes see the same results.
+
+Needs the packages in requirements-async.txt.
+"""
+import httpcore
+import httpx
+
+import security
+from fetcher import BROWSER_HEADERS, CHUNK_SIZE, EMPTY_RESULT, FETCH_POOL_SIZE, BodyExtractor, normalize_url
+from geocache import normalize_location
+from helpers import NOMINATIM_HEADERS, NOMINATIM_SEARCH_URL, nominatim_params, parse_nominatim
+from instrumentation import outbound
+
+
+class SafeAsyncNetworkBackend(httpcore.AsyncNetworkBackend):
+
+    def __init__(self, backend):
+        self._backend = backend
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        stream = await self._backend.connect_tcp(host, port, timeout=timeout, local_address=local_address,
+                                                 socket_options=socket_options)
+        # Check who we actually reached so DNS tricks cannot smuggle a
+        # private address past URL validation
+        peer = stream.get_extra_info("server_addr")
+        if not peer or security.is_disallowed_ip(peer[0]):
+            await stream.aclose()
+            raise httpcore.ConnectError(f"SSRF Detected: Connection to {peer[0] if peer else host} is blocked")
+        return stream
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        raise httpcore.ConnectError("Unix sockets are not allowed")
+
+    async def sleep(self, seconds):
+        await self._backend.sleep(seconds)
+
+
+class SafeAsyncTransport(httpx.AsyncHTTPTransport):
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # httpx has no public hook for the network backend; wrap the one its pool uses
+        self._pool._network_backend = SafeAsyncNetworkBackend(self._pool._network_backend)
+
+
+def safe_client(pool_size=FETCH_POOL_SIZE, **kwargs):
+    """httpx.AsyncClient that never connects to private addresses or proxies."""
+    transport = SafeAsyncTransport(limits=httpx.Limits(max_connections=pool_size * 10,
+                                                       max_keepalive_connections=pool_size))
+    return httpx.AsyncClient(transport=transport, trust_env=False, timeout=5, follow_redirects=True, **kwargs)
+
+
+class AsyncProductFetcher:
+    """``ProductFetcher.fetch`` with non-blocking I/O over the same cache."""
+
+    def __init__(self, fetcher, client=None):
+        self.fetcher = fetcher
+        self.client = client or safe_client(headers=BROWSER_HEADERS)
+
+    async def fetch(self, url):
+        key = normalize_url(url)
+        entry, headers = self.fetcher.cached(key)
+        if headers is None:
+            return dict(entry["data"])
+
+        try:
+            with outbound("product_page"):
+                async with self.client.stream("GET", url, headers=headers) as response:
+                    if response.status_code == 304 and entry:
+                        return self.fetcher.revalidated(key, entry)
+                    response.raise_for_status()
+                    body = BodyExtractor(str(response.url), response.charset_encoding, self.fetcher.max_bytes)
+                    async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                        if body.feed(chunk):
+                            break
+                    return self.fetcher.store(key, response.headers, body.result())
+        except httpx.HTTPError:
+            return dict(EMPTY_RESULT)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+async def ageocode_city(client, location_input):
+    """``helpers.geocode_city`` over httpx; network errors raise httpx.HTTPError."""
+    with outbound("nominatim"):
+        response = await client.get(NOMINATIM_SEARCH_URL, params=nominatim_params(location_input),
+                                    headers=NOMINATIM_HEADERS)
+    response.raise_for_status()
+    return parse_nominatim(response.json())
+
+
+async def avalidate_city(cache, client, location):
+    """``GeocodeCache.validate`` for the event loop: (is_real, full_name)."""
+    key = normalize_location(location)
+    if not key:
+        return False, None
+    try:
+        full_name = await cache.alookup(key, lambda k: ageocode_city(client, k))
+    except httpx.HTTPError:
+        return False, None
+    return full_name is not None, full_name
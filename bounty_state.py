@@ -0,0 +1,346 @@
+"""Bounty lifecycle transitions.
+
+Each transition runs in one transaction and is guarded by a conditional
+write (``... WHERE status = 'pending'``) whose row count decides whether it
+happened, so concurrent clicks cannot both succeed and no separate
+permission SELECT is needed. Every function returns a truthy value on
+success and None when the bounty is missing, not owned by the caller, or
+no longer in the expected state.
+
+    (new) --create--> pending --claim--> claimed --complete--> completed
+                      pending --delete--> (removed)
+    (new) --create--> validating --publish--> pending
+                      validating --reject--> rejected --delete--> (removed)
+
+Bounties posted from the order form start out ``validating`` while a
+background job resolves the dispatch box (see ``jobs``).
+
+The reputation counters on ``users`` (total_posted, completed_posted,
+total_claimed, completed_orders) are adjusted inside the same transaction
+as the transition; ``reconcile_counters`` recomputes them from scratch.
+
+Code that caches bounty-derived data registers with ``on_change`` and is
+called after each successful commit with the event name ("created",
+"published", "rejected", "updated", "requested", "claimed", "completed",
+"deleted") and
+a dict that always has ``bounty_id`` plus whatever columns the transition
+already had in hand. When a transition runs inside a caller's transaction
+the listeners wait for that outer commit. Code that must write alongside
+the transition (the /events log) registers with ``record_with`` instead and
+is called with the same arguments plus ``db``, inside the transaction.
+Each transition also bumps the ``table_versions`` row for bounties, which
+other workers use to tell their cached pages are stale.
+
+``image_files.refs`` counts the bounties pointing at each stored image
+(``set_image`` adds one, ``delete`` takes it back) so image cleanup can
+find unreferenced files without listing the directory.
+"""
+import logging
+import time
+
+DEFAULT_IMAGE = "/static/Bountygo.png"
+
+_listeners = []
+_recorders = []
+
+
+def on_change(listener):
+    """Register ``listener(event, bounty)``; usable as a decorator."""
+    _listeners.append(listener)
+    return listener
+
+
+def record_with(recorder):
+    """Register ``recorder(db, event, bounty)``, run inside the transition's
+    transaction; if it raises, the transition rolls back. Usable as a decorator."""
+    _recorders.append(recorder)
+    return recorder
+
+
+def _notify(db, event, **bounty):
+    for recorder in _recorders:
+        recorder(db, event, bounty)
+
+    def dispatch():
+        for listener in _listeners:
+            try:
+                listener(event, bounty)
+            except Exception:
+                # A stale cache must never turn a committed write into an error page
+                logging.getLogger(__name__).exception("bounty %s listener failed", event)
+    db.after_commit(dispatch)
+
+
+def _touch(db):
+    db.execute("UPDATE table_versions SET version = version + 1, updated_at = ? WHERE name = 'bounties'",
+               int(time.time()))
+
+
+_CLAIM = """
+    UPDATE bounties
+    SET status = 'claimed',
+        traveler_id = (SELECT traveler_id FROM bounty_requests WHERE id = {req} AND status = 'pending')
+    WHERE id = (SELECT bounty_id FROM bounty_requests WHERE id = {req} AND status = 'pending')
+      AND poster_id = {poster} AND status = 'pending'
+"""
+# claim(request id, bounty id): the accepted request and its rejected rivals;
+# queryplans.py EXPLAINs it
+SETTLE_REQUESTS = """
+    UPDATE bounty_requests
+    SET status = CASE WHEN id = ? THEN 'accepted' ELSE 'rejected' END
+    WHERE bounty_id = ? AND status = 'pending'
+"""
+_CLAIMED_COLUMNS = "id, traveler_id, category, dispatch_box"
+_COMPLETE = """
+    UPDATE bounties SET status = 'completed'
+    WHERE id = {bounty} AND poster_id = {poster} AND status = 'claimed'
+"""
+_DELETABLE = "('pending', 'validating', 'rejected')"
+
+_CREATE = """
+    INSERT INTO bounties (poster_id, item_name, category, price, reward_fee, description, img_url, dispatch_box, status,
+                          idempotency_key)
+    VALUES ({}, {}, {}, {}, {}, {}, {}, {}, {}, {})
+    ON CONFLICT (idempotency_key) DO NOTHING
+"""
+
+# The unique (bounty_id, traveler_id) index turns a repeat request into a no-op
+_REQUEST = """
+    INSERT INTO bounty_requests (bounty_id, traveler_id)
+    SELECT id, {traveler} FROM bounties WHERE id = {bounty} AND status = 'pending' AND poster_id != {traveler}
+    ON CONFLICT (bounty_id, traveler_id) DO NOTHING
+"""
+
+
+def create(db, poster_id, item_name, category, price, reward_fee, description, img_url, dispatch_box,
+           status="pending", idempotency_key=None):
+    """Insert a bounty (``pending``, or ``validating`` until a job publishes it) and return its id.
+
+    The unique ``idempotency_key`` column makes a repeated form submission
+    a no-op: it returns None when a bounty with that key already exists.
+    """
+    with db.transaction():
+        params = dict(poster_id=poster_id, item_name=item_name, category=category, price=price, reward_fee=reward_fee,
+                      description=description, img_url=img_url or DEFAULT_IMAGE, dispatch_box=dispatch_box,
+                      status=status, idempotency_key=idempotency_key)
+        if db.supports_returning:
+            rows = db.query(_CREATE.format(*(f":{name}" for name in params)) + " RETURNING id", **params)
+            bounty_id = rows[0]["id"] if rows else None
+        else:
+            bounty_id = db.execute(_CREATE.format(*("?" * len(params))), *params.values())
+        if bounty_id is None:
+            return None
+        db.execute("UPDATE users SET total_posted = total_posted + 1 WHERE id = ?", poster_id)
+        _touch(db)
+        _notify(db, "created", bounty_id=bounty_id, poster_id=poster_id, status=status, category=category,
+                dispatch_box=dispatch_box)
+    return bounty_id
+
+
+def publish(db, bounty_id, dispatch_box, img_url=None):
+    """Make a validated bounty visible, storing the normalized dispatch box
+    and, when given, an image found for it."""
+    with db.transaction():
+        if db.execute("""
+            UPDATE bounties SET status = 'pending', dispatch_box = ?, img_url = COALESCE(?, img_url)
+            WHERE id = ? AND status = 'validating'
+        """, dispatch_box, img_url, bounty_id) != 1:
+            return None
+        bounty = db.execute("SELECT poster_id, category FROM bounties WHERE id = ?", bounty_id)[0]
+        _touch(db)
+        _notify(db, "published", bounty_id=bounty_id, poster_id=bounty["poster_id"], category=bounty["category"],
+                dispatch_box=dispatch_box)
+    return bounty_id
+
+
+def reject(db, bounty_id):
+    """Park a bounty whose dispatch box could not be validated."""
+    with db.transaction():
+        if db.execute("UPDATE bounties SET status = 'rejected' WHERE id = ? AND status = 'validating'",
+                      bounty_id) != 1:
+            return None
+        _notify(db, "rejected", bounty_id=bounty_id)
+    return bounty_id
+
+
+def update(db, bounty_id, poster_id, item_name, price, reward_fee, description, dispatch_box):
+    """Edit the user-facing fields of a pending bounty."""
+    with db.transaction():
+        if db.execute("""
+            UPDATE bounties SET item_name = ?, price = ?, reward_fee = ?, description = ?, dispatch_box = ?
+            WHERE id = ? AND poster_id = ? AND status = 'pending'
+        """, item_name, price, reward_fee, description, dispatch_box, bounty_id, poster_id) != 1:
+            return None
+        _touch(db)
+        _notify(db, "updated", bounty_id=bounty_id, poster_id=poster_id, dispatch_box=dispatch_box)
+    return bounty_id
+
+
+def _image_hash(image_key):
+    # image_files is keyed by the content hash that names the stored file
+    return image_key.rsplit(".", 1)[0]
+
+
+def set_image(db, bounty_id, img_url, image_key, size):
+    """Point a bounty at its stored copy of ``img_url`` (see ``images``),
+    unless the image was changed in the meantime, and count the reference."""
+    with db.transaction():
+        if db.execute("UPDATE bounties SET image_key = ? WHERE id = ? AND img_url = ? AND image_key IS NULL",
+                      image_key, bounty_id, img_url) != 1:
+            return None
+        db.execute("""
+            INSERT INTO image_files (hash, name, size, refs, last_access) VALUES (?, ?, ?, 1, ?)
+            ON CONFLICT (hash) DO UPDATE SET refs = image_files.refs + 1
+        """, _image_hash(image_key), image_key, size, int(time.time()))
+        _touch(db)
+    return bounty_id
+
+
+def drop_image(db, image_key):
+    """Send every bounty using a stored image that is about to be evicted
+    back to its original ``img_url``."""
+    with db.transaction():
+        dropped = db.execute("UPDATE bounties SET image_key = NULL WHERE image_key = ?", image_key)
+        if dropped:
+            _touch(db)
+    return dropped
+
+
+def add_request(db, bounty_id, traveler_id):
+    """Ask to deliver a pending bounty someone else posted.
+
+    Returns the request id; None when the bounty is not open to this
+    traveler or they already asked.
+    """
+    with db.transaction():
+        if db.supports_returning:
+            rows = db.query(_REQUEST.format(bounty=":bounty_id", traveler=":traveler_id") + " RETURNING id",
+                            bounty_id=bounty_id, traveler_id=traveler_id)
+            request_id = rows[0]["id"] if rows else None
+        else:
+            request_id = db.execute(_REQUEST.format(bounty="?", traveler="?"), traveler_id, bounty_id, traveler_id)
+        if request_id:
+            _notify(db, "requested", bounty_id=bounty_id, traveler_id=traveler_id, request_id=request_id)
+    return request_id
+
+
+def claim(db, request_id, poster_id):
+    """Accept one traveler's request; every other pending request is rejected.
+
+    Returns the bounty id.
+    """
+    with db.transaction():
+        if db.supports_returning:
+            rows = db.query(_CLAIM.format(req=":request_id", poster=":poster_id") + " RETURNING " + _CLAIMED_COLUMNS,
+                            request_id=request_id, poster_id=poster_id)
+            if not rows:
+                return None
+        else:
+            if db.execute(_CLAIM.format(req="?", poster="?"), request_id, request_id, poster_id) != 1:
+                return None
+            rows = db.execute(f"""
+                SELECT {_CLAIMED_COLUMNS} FROM bounties
+                WHERE id = (SELECT bounty_id FROM bounty_requests WHERE id = ?)
+            """, request_id)
+        bounty = rows[0]
+        bounty_id = bounty["id"]
+
+        db.execute(SETTLE_REQUESTS, request_id, bounty_id)
+        db.execute("""
+            UPDATE users SET total_claimed = total_claimed + 1
+            WHERE id = ?
+        """, bounty["traveler_id"])
+        _touch(db)
+        _notify(db, "claimed", bounty_id=bounty_id, poster_id=poster_id, request_id=request_id,
+                traveler_id=bounty["traveler_id"], category=bounty["category"], dispatch_box=bounty["dispatch_box"])
+    return bounty_id
+
+
+def complete(db, bounty_id, poster_id):
+    """Mark a claimed bounty completed and drop its request history."""
+    with db.transaction():
+        if db.supports_returning:
+            rows = db.query(_COMPLETE.format(bounty=":bounty_id", poster=":poster_id") + " RETURNING traveler_id",
+                            bounty_id=bounty_id, poster_id=poster_id)
+            if not rows:
+                return None
+        else:
+            if db.execute(_COMPLETE.format(bounty="?", poster="?"), bounty_id, poster_id) != 1:
+                return None
+            rows = db.execute("SELECT traveler_id FROM bounties WHERE id = ?", bounty_id)
+        traveler_id = rows[0]["traveler_id"]
+
+        db.execute("DELETE FROM bounty_requests WHERE bounty_id = ?", bounty_id)
+        db.execute("UPDATE users SET completed_posted = completed_posted + 1 WHERE id = ?", poster_id)
+        db.execute("UPDATE users SET completed_orders = completed_orders + 1 WHERE id = ?", traveler_id)
+        _touch(db)
+        _notify(db, "completed", bounty_id=bounty_id, poster_id=poster_id, traveler_id=traveler_id)
+    return bounty_id
+
+
+def delete(db, bounty_id, poster_id):
+    """Remove an unclaimed bounty together with its requests."""
+    with db.transaction():
+        image = db.execute("SELECT image_key FROM bounties WHERE id = ?", bounty_id)
+        # Requests go first so the bounties foreign key is satisfied
+        db.execute(f"""
+            DELETE FROM bounty_requests WHERE bounty_id = ? AND EXISTS (
+                SELECT 1 FROM bounties WHERE id = ? AND poster_id = ? AND status IN {_DELETABLE}
+            )
+        """, bounty_id, bounty_id, poster_id)
+        if db.execute(f"DELETE FROM bounties WHERE id = ? AND poster_id = ? AND status IN {_DELETABLE}",
+                      bounty_id, poster_id) != 1:
+            return None
+        db.execute("UPDATE users SET total_posted = total_posted - 1 WHERE id = ?", poster_id)
+        if image[0]["image_key"]:
+            db.execute("UPDATE image_files SET refs = refs - 1 WHERE hash = ? AND refs > 0",
+                       _image_hash(image[0]["image_key"]))
+        _touch(db)
+        _notify(db, "deleted", bounty_id=bounty_id, poster_id=poster_id)
+    return bounty_id
+
+
+_COUNTERS = ("total_posted", "completed_posted", "total_claimed", "completed_orders")
+
+
+def reconcile_counters(db, dry_run=False):
+    """Recompute every user's counters from ``bounties`` and fix any drift.
+
+    One grouped query produces the expected values for all users; only rows
+    that differ are written. Returns the drifted rows (current and expected
+    values) so callers can report them.
+    """
+    rows = db.execute("""
+        SELECT u.id, u.username,
+               u.total_posted, u.completed_posted, u.total_claimed, u.completed_orders,
+               COALESCE(s.total_posted, 0) AS expected_total_posted,
+               COALESCE(s.completed_posted, 0) AS expected_completed_posted,
+               COALESCE(s.total_claimed, 0) AS expected_total_claimed,
+               COALESCE(s.completed_orders, 0) AS expected_completed_orders
+        FROM users u
+        LEFT JOIN (
+            SELECT user_id,
+                   SUM(posted) AS total_posted, SUM(posted_done) AS completed_posted,
+                   SUM(claimed) AS total_claimed, SUM(claimed_done) AS completed_orders
+            FROM (
+                SELECT poster_id AS user_id, 1 AS posted,
+                       CASE WHEN status = 'completed' THEN 1 ELSE 0 END AS posted_done,
+                       0 AS claimed, 0 AS claimed_done
+                FROM bounties
+                UNION ALL
+                SELECT traveler_id, 0, 0, 1, CASE WHEN status = 'completed' THEN 1 ELSE 0 END
+                FROM bounties WHERE traveler_id IS NOT NULL
+            ) AS roles
+            GROUP BY user_id
+        ) AS s ON s.user_id = u.id
+    """)
+    drifted = [r for r in rows if any((r[c] or 0) != r[f"expected_{c}"] for c in _COUNTERS)]
+
+    if drifted and not dry_run:
+        with db.transaction():
+            for r in drifted:
+                db.execute("""
+                    UPDATE users SET total_posted = ?, completed_posted = ?, total_claimed = ?, completed_orders = ?
+                    WHERE id = ?
+                """, *(r[f"expected_{c}"] for c in _COUNTERS), r["id"])
+    return drifted
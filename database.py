@@ -0,0 +1,216 @@
+"""Database access layer.
+
+``Database`` keeps the cs50 ``db.execute(sql, *args)`` API the views are
+written against, but:
+
+* every thread gets its own cs50 handle on a shared engine, so one thread's
+  ``BEGIN`` can no longer flip autocommit off for another thread;
+* connections come from a sized QueuePool (``DB_POOL_*`` env vars) that
+  counts checkouts, waits and timeouts for ``/metrics``;
+* SQLite connections get WAL, busy_timeout, synchronous and cache pragmas
+  (``SQLITE_*`` env vars) when they are opened.
+"""
+import copy
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import cs50.sql
+import sqlalchemy
+from cs50 import SQL
+from sqlalchemy.pool import QueuePool
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-20000")),  # negative = KiB
+    "foreign_keys": "ON",
+}
+
+
+def ensure_sqlite_file(url):
+    """cs50.SQL refuses to open a SQLite file that does not exist yet."""
+    match = re.match(r"^sqlite:///(.+)$", url)
+    if match and not os.path.exists(match.group(1)):
+        open(match.group(1), "a").close()
+
+
+class PoolMetrics:
+
+    FIELDS = ("connects", "checkouts", "checkins", "waits", "wait_seconds", "timeouts")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        for name in self.FIELDS:
+            setattr(self, name, 0)
+
+    def add(self, name, amount=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def snapshot(self):
+        with self._lock:
+            return {name: getattr(self, name) for name in self.FIELDS}
+
+
+class _MeteredQueuePool(QueuePool):
+    """QueuePool that records when a checkout had to wait for a free slot."""
+
+    metrics = None
+
+    def _do_get(self):
+        saturated = (self.checkedin() == 0 and self._max_overflow > -1
+                     and self.overflow() >= self._max_overflow)
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except sqlalchemy.exc.TimeoutError:
+            self.metrics.add("timeouts")
+            raise
+        finally:
+            if saturated:
+                self.metrics.add("waits")
+                self.metrics.add("wait_seconds", time.perf_counter() - start)
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+class Database:
+
+    def __init__(self, url):
+        ensure_sqlite_file(url)
+        self.url = url
+        self.metrics = PoolMetrics()
+
+        # Keep the pool under the "sqlalchemy.pool" logger hierarchy so it
+        # stays as quiet as SQLAlchemy's own QueuePool
+        pool_class = type("MeteredQueuePool", (_MeteredQueuePool,),
+                          {"metrics": self.metrics, "__module__": QueuePool.__module__})
+        options = dict(poolclass=pool_class, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW,
+                       pool_timeout=DB_POOL_TIMEOUT, pool_recycle=DB_POOL_RECYCLE, pool_pre_ping=True)
+        if url.startswith("sqlite"):
+            options["connect_args"] = {"check_same_thread": False,
+                                       "timeout": SQLITE_PRAGMAS["busy_timeout"] / 1000}
+            options["pool_pre_ping"] = False
+
+        self._sql = SQL(url, **options)
+        self.engine = self._sql._engine
+        self.backend = self.engine.url.get_backend_name()
+        self.supports_returning = self.backend == "postgresql" or (
+            self.backend == "sqlite" and sqlite3.sqlite_version_info >= (3, 35))
+
+        if self.backend == "sqlite":
+            sqlalchemy.event.listen(self.engine, "connect", _apply_sqlite_pragmas)
+        sqlalchemy.event.listen(self.engine, "connect", lambda *a: self.metrics.add("connects"))
+        sqlalchemy.event.listen(self.engine, "checkout", lambda *a: self.metrics.add("checkouts"))
+        sqlalchemy.event.listen(self.engine, "checkin", lambda *a: self.metrics.add("checkins"))
+        # Drop the probe connection cs50 opened before our listeners existed
+        self.engine.dispose()
+
+        self._local = threading.local()
+
+    def _handle(self):
+        handle = getattr(self._local, "sql", None)
+        if handle is None:
+            handle = copy.copy(self._sql)
+            handle._autocommit = True
+            self._local.sql = handle
+        return handle
+
+    def execute(self, sql, *args, **kwargs):
+        return self._handle().execute(sql, *args, **kwargs)
+
+    def query(self, sql, **params):
+        """Run a statement cs50 cannot return rows for (``RETURNING``,
+        ``EXPLAIN``, ``PRAGMA``) and return its rows as dicts.
+
+        Uses SQLAlchemy ``:name`` parameters. Inside ``transaction()`` it runs
+        on the transaction's connection.
+        """
+        handle = self._handle()
+        statement = sqlalchemy.text(sql)
+        connection = getattr(cs50.sql._data, handle._name(), None)
+        if not handle._autocommit and connection is not None:
+            return [dict(row) for row in connection.execute(statement, params).mappings()]
+        with self.engine.connect() as connection:
+            return [dict(row) for row in connection.execute(statement, params).mappings()]
+
+    @contextmanager
+    def transaction(self):
+        """Run the block in one transaction; nested blocks join the outer one.
+
+        SQLite takes the write lock up front (BEGIN IMMEDIATE) so two
+        writers queue on busy_timeout instead of failing on lock upgrade.
+        """
+        handle = self._handle()
+        if not handle._autocommit:
+            yield self
+            return
+
+        self._local.after_commit = []
+        handle.execute("BEGIN IMMEDIATE" if self.backend == "sqlite" else "BEGIN")
+        try:
+            yield self
+        except BaseException:
+            self._local.after_commit = []
+            try:
+                handle.execute("ROLLBACK")
+            except RuntimeError:
+                # cs50 already dropped the connection (and with it the
+                # transaction) after an OperationalError
+                pass
+            self._end_transaction(handle)
+            raise
+        handle.execute("COMMIT")
+        self._end_transaction(handle)
+        callbacks, self._local.after_commit = self._local.after_commit, []
+        for callback in callbacks:
+            callback()
+
+    @staticmethod
+    def _end_transaction(handle):
+        # cs50 recognises BEGIN but not COMMIT/ROLLBACK, so it would stay in
+        # "transaction" mode (no autocommit, connection held) for good
+        handle._autocommit = True
+        handle._disconnect()
+
+    def after_commit(self, callback):
+        """Call ``callback()`` once the current transaction commits, or right
+        away outside one. Callbacks of a rolled back transaction are dropped."""
+        if self._handle()._autocommit:
+            callback()
+        else:
+            self._local.after_commit.append(callback)
+
+    def pool_stats(self):
+        stats = self.metrics.snapshot()
+        pool = self.engine.pool
+        stats.update(size=pool.size(), checked_out=pool.checkedout(), overflow=max(pool.overflow(), 0))
+        return stats
+
+    def metrics_text(self):
+        """Pool metrics in Prometheus text exposition format."""
+        stats = self.pool_stats()
+        lines = []
+        for name in PoolMetrics.FIELDS:
+            metric = f"bountygo_db_pool_{name}_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {stats[name]}"]
+        for name in ("size", "checked_out", "overflow"):
+            metric = f"bountygo_db_pool_{name}"
+            lines += [f"# TYPE {metric} gauge", f"{metric} {stats[name]}"]
+        return "\n".join(lines) + "\n"
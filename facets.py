@@ -0,0 +1,77 @@
+"""Category / dispatch box filter facets with pending-bounty counts.
+
+The listing page used to run two ``SELECT DISTINCT`` scans over the whole
+bounties table per request. ``FacetCache`` loads both facets with one
+grouped query over pending bounties, keeps them in process memory and is
+kept current by ``bounty_state`` change events: new pending bounties and
+claims adjust the counts in place, edits and deletes (which do not carry
+the old values) drop the cache so the next request reloads it. ``FACET_CACHE_TTL`` bounds
+how stale a worker can get when another process did the write.
+"""
+import os
+import threading
+import time
+
+FACET_CACHE_TTL = int(os.getenv("FACET_CACHE_TTL", "60"))
+
+FIELDS = ("category", "dispatch_box")
+
+
+class FacetCache:
+
+    def __init__(self, get_db, ttl=FACET_CACHE_TTL):
+        self.get_db = get_db
+        self.ttl = ttl
+        self._counts = None
+        self._expires_at = 0
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Return ``{"category": [...], "dispatch_box": [...]}``; each entry
+        is ``{<field>: value, "count": n}`` sorted by value."""
+        with self._lock:
+            if self._counts is None or self._expires_at <= time.time():
+                self._counts = self._load()
+                self._expires_at = time.time() + self.ttl
+            return {field: [{field: value, "count": count} for value, count in sorted(counts.items())]
+                    for field, counts in self._counts.items()}
+
+    def _load(self):
+        rows = self.get_db().execute("""
+            SELECT category, dispatch_box, COUNT(*) AS count
+            FROM bounties WHERE status = 'pending'
+            GROUP BY category, dispatch_box
+        """)
+        counts = {field: {} for field in FIELDS}
+        for row in rows:
+            for field in FIELDS:
+                if row[field]:
+                    counts[field][row[field]] = counts[field].get(row[field], 0) + row["count"]
+        return counts
+
+    def adjust(self, bounty, delta):
+        with self._lock:
+            if self._counts is None:
+                return
+            for field in FIELDS:
+                value = bounty.get(field)
+                if not value:
+                    continue
+                count = self._counts[field].get(value, 0) + delta
+                if count > 0:
+                    self._counts[field][value] = count
+                else:
+                    self._counts[field].pop(value, None)
+
+    def invalidate(self):
+        with self._lock:
+            self._counts = None
+
+    def handle(self, event, bounty):
+        """``bounty_state.on_change`` listener."""
+        if event == "published" or (event == "created" and bounty["status"] == "pending"):
+            self.adjust(bounty, 1)
+        elif event == "claimed":
+            self.adjust(bounty, -1)
+        elif event in ("updated", "deleted"):
+            self.invalidate()
@@ -0,0 +1,149 @@
+"""Live bounty changes for the ``/events`` Server-Sent Events stream.
+
+``EventLog.record`` is a bounty_state recorder. When a public change
+happens (a bounty listed, edited, requested, claimed, completed or
+deleted), it appends a row to bounty_events in the same transaction, so
+the event is kept exactly when the change commits. That table is what
+carries events between processes. Whichever web worker or job runner
+made the change, every worker reads the same rows, in id order.
+
+Under ASGI (asgi.py), each worker runs one ``Broadcaster``. While anyone
+is listening, it polls the table every ``FEED_POLL_INTERVAL`` seconds and
+copies new rows into one asyncio queue per connection. An idle
+subscriber therefore costs a socket and a queue, not a thread or a
+query. Under plain WSGI there is no stream: the /events view answers
+with whatever happened since the browser's ``Last-Event-ID`` and closes,
+and EventSource asks again after ``FEED_RETRY_MS``. That is polling, so
+changes arrive up to ``FEED_RETRY_MS`` late.
+
+Rows older than ``FEED_RETENTION`` seconds are deleted at most once per
+``FEED_SWEEP_INTERVAL`` seconds.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+
+FEED_POLL_INTERVAL = float(os.getenv("FEED_POLL_INTERVAL", "1"))
+FEED_RETRY_MS = int(os.getenv("FEED_RETRY_MS", "5000"))
+FEED_RETENTION = int(os.getenv("FEED_RETENTION", "3600"))
+FEED_SWEEP_INTERVAL = int(os.getenv("FEED_SWEEP_INTERVAL", "300"))
+FEED_QUEUE_SIZE = int(os.getenv("FEED_QUEUE_SIZE", "100"))
+FEED_BATCH = 500
+
+# Bounties still validating or rejected are not listed anywhere, so their
+# events stay private
+PUBLIC_EVENTS = {"created", "published", "updated", "requested", "claimed", "completed", "deleted"}
+
+logger = logging.getLogger(__name__)
+
+
+class EventLog:
+
+    def __init__(self, get_db, retention=FEED_RETENTION, sweep_interval=FEED_SWEEP_INTERVAL):
+        self.get_db = get_db
+        self.retention = retention
+        self.sweep_interval = sweep_interval
+        self._next_sweep = 0
+        self._lock = threading.Lock()
+
+    def record(self, db, event, bounty):
+        """bounty_state.record_with recorder; runs in the transition's transaction."""
+        if event not in PUBLIC_EVENTS or (event == "created" and bounty.get("status") != "pending"):
+            return
+        if db.backend == "postgresql":
+            # Ids are handed out on insert but become visible on commit.
+            # Committing one writer at a time keeps them visible in id order,
+            # so a reader past id n never misses a smaller id committed later
+            db.query("SELECT pg_advisory_xact_lock(hashtext('bounty_events'))")
+        db.execute("INSERT INTO bounty_events (event, bounty_id, created_at) VALUES (?, ?, ?)",
+                   event, bounty["bounty_id"], int(time.time()))
+        db.after_commit(self._sweep)
+
+    def _sweep(self):
+        now = int(time.time())
+        with self._lock:
+            if now < self._next_sweep:
+                return
+            self._next_sweep = now + self.sweep_interval
+        try:
+            self.get_db().execute("DELETE FROM bounty_events WHERE created_at < ?", now - self.retention)
+        except Exception:
+            logger.exception("bounty event sweep failed")
+
+
+def last_event_id(value):
+    """The id a client has seen up to, from a Last-Event-ID header or ?after=; None if absent."""
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+def latest_id(db):
+    return db.execute("SELECT MAX(id) AS id FROM bounty_events")[0]["id"] or 0
+
+
+def since(db, after, limit=FEED_BATCH):
+    return db.execute("SELECT id, event, bounty_id FROM bounty_events WHERE id > ? ORDER BY id LIMIT ?",
+                      after, limit)
+
+
+def format_event(row):
+    data = json.dumps({"event": row["event"], "bounty_id": row["bounty_id"]})
+    return f"id: {row['id']}\nevent: bounty\ndata: {data}\n\n"
+
+
+def replay(db, after, retry_ms=FEED_RETRY_MS):
+    """One short SSE response: the events after ``after``, or just the
+    current position for a client that has none yet."""
+    if after is None:
+        return f"retry: {retry_ms}\nid: {latest_id(db)}\n\n"
+    return f"retry: {retry_ms}\n\n" + "".join(format_event(row) for row in since(db, after))
+
+
+class Broadcaster:
+    """Fans bounty_events rows out to the open streams of one worker."""
+
+    def __init__(self, get_db, poll_interval=FEED_POLL_INTERVAL, queue_size=FEED_QUEUE_SIZE):
+        self.get_db = get_db
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size
+        self._queues = set()
+        self._last_id = 0
+        self._task = None
+
+    def subscribe(self, after):
+        """A queue of the rows added from now on, or after id ``after`` if
+        nobody was listening. ``None`` in it means the reader fell too far
+        behind and should close, so the browser reconnects and replays."""
+        queue = asyncio.Queue(self.queue_size)
+        self._queues.add(queue)
+        if self._task is None or self._task.done():
+            self._last_id = after
+            self._task = asyncio.ensure_future(self._poll())
+        return queue
+
+    def unsubscribe(self, queue):
+        self._queues.discard(queue)
+
+    async def _poll(self):
+        while self._queues:
+            try:
+                rows = await asyncio.to_thread(since, self.get_db(), self._last_id)
+            except Exception:
+                logger.exception("bounty event poll failed")
+                rows = []
+            for row in rows:
+                self._last_id = row["id"]
+                for queue in list(self._queues):
+                    try:
+                        queue.put_nowait(row)
+                    except asyncio.QueueFull:
+                        self._queues.discard(queue)
+                        queue.get_nowait()
+                        queue.put_nowait(None)
+            if len(rows) < FEED_BATCH:
+                await asyncio.sleep(self.poll_interval)
@@ -0,0 +1,170 @@
+"""Pooled, cached fetcher for product page metadata (/fetch_url).
+
+One long-lived ``requests.Session`` keeps TCP/TLS connections alive across
+calls, every connection still goes through ``SafeHTTPAdapter``. Results are
+cached per normalized URL and revalidated with ETag / Last-Modified once
+stale. Bodies are streamed into ``metadata.MetadataExtractor`` and reading
+stops as soon as it has resolved every field, capped at ``FETCH_MAX_BYTES``.
+"""
+import codecs
+import os
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
+
+import requests
+
+from instrumentation import outbound
+from metadata import MetadataExtractor
+from security import SafeHTTPAdapter
+
+FETCH_CACHE_SIZE = int(os.getenv("FETCH_CACHE_SIZE", "512"))
+FETCH_CACHE_TTL = int(os.getenv("FETCH_CACHE_TTL", "3600"))
+FETCH_MAX_BYTES = int(os.getenv("FETCH_MAX_BYTES", str(1024 * 1024)))
+FETCH_POOL_SIZE = int(os.getenv("FETCH_POOL_SIZE", "10"))
+CHUNK_SIZE = 16384
+
+BROWSER_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Accept-Encoding': 'gzip, deflate',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1',
+    'Sec-Fetch-Dest': 'document',
+    'Sec-Fetch-Mode': 'navigate',
+    'Sec-Fetch-Site': 'none',
+    'Sec-Fetch-User': '?1',
+    'Cache-Control': 'max-age=0',
+}
+
+EMPTY_RESULT = {"title": None, "image": None, "description": None}
+
+_TRACKING_PARAMS = ("utm_", "fbclid", "gclid", "mc_", "_trkparms", "_trksid")
+
+
+def normalize_url(url):
+    """Cache key: lowercase scheme/host, no fragment, default port or tracking params."""
+    parts = urllib.parse.urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and (scheme, parts.port) not in (("http", 80), ("https", 443)):
+        host = f"{host}:{parts.port}"
+    query = sorted(
+        (k, v) for k, v in urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith(_TRACKING_PARAMS)
+    )
+    return urllib.parse.urlunsplit((scheme, host, parts.path or "/", urllib.parse.urlencode(query), ""))
+
+
+class BodyExtractor:
+    """Feed body chunks to the metadata extractor until it is done or max_bytes.
+
+    Transport-agnostic so the requests path here and the httpx path in
+    ``asyncfetch`` share it.
+    """
+
+    def __init__(self, url, charset, max_bytes):
+        self.extractor = MetadataExtractor(url)
+        try:
+            self.decoder = codecs.getincrementaldecoder(charset or "utf-8")(errors="replace")
+        except LookupError:
+            self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.remaining = max_bytes
+
+    def feed(self, chunk):
+        """Returns True once no more input is needed."""
+        chunk = chunk[:self.remaining]
+        self.remaining -= len(chunk)
+        self.extractor.feed(self.decoder.decode(chunk))
+        return self.extractor.done or self.remaining <= 0
+
+    def result(self):
+        return self.extractor.result()
+
+
+def _extract(response, max_bytes):
+    charset = response.encoding if "charset" in response.headers.get("Content-Type", "").lower() else None
+    body = BodyExtractor(response.url, charset, max_bytes)
+    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+        if body.feed(chunk):
+            break
+    return body.result()
+
+
+class ProductFetcher:
+
+    def __init__(self, max_entries=FETCH_CACHE_SIZE, ttl=FETCH_CACHE_TTL, max_bytes=FETCH_MAX_BYTES,
+                 pool_size=FETCH_POOL_SIZE):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+        self.session = requests.Session()
+        self.session.headers.update(BROWSER_HEADERS)
+        adapter = SafeHTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def fetch(self, url):
+        key = normalize_url(url)
+        entry, headers = self.cached(key)
+        if headers is None:
+            return dict(entry["data"])
+
+        try:
+            with outbound("product_page"), \
+                    self.session.get(url, headers=headers, timeout=5, allow_redirects=True, stream=True) as response:
+                if response.status_code == 304 and entry:
+                    return self.revalidated(key, entry)
+                response.raise_for_status()
+                return self.store(key, response.headers, _extract(response, self.max_bytes))
+        except requests.exceptions.RequestException:
+            # Do not expose internal error details to callers; return empty data
+            return dict(EMPTY_RESULT)
+
+    def cached(self, key):
+        """``(entry, None)`` when the cached entry is fresh, otherwise
+        ``(entry or None, conditional request headers)``."""
+        entry = self._get(key)
+        if entry and entry["expires_at"] > time.time():
+            return entry, None
+
+        headers = {}
+        if entry and entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return entry, headers
+
+    def revalidated(self, key, entry):
+        entry["expires_at"] = time.time() + self.ttl
+        self._put(key, entry)
+        return dict(entry["data"])
+
+    def store(self, key, response_headers, data):
+        self._put(key, {
+            "data": data,
+            "etag": response_headers.get("ETag"),
+            "last_modified": response_headers.get("Last-Modified"),
+            "expires_at": time.time() + self.ttl,
+        })
+        return dict(data)
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._cache.move_to_end(key)
+            return entry
+
+    def _put(self, key, entry):
+        with self._lock:
+            self._cache[key] = entry
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
@@ -0,0 +1,179 @@
+"""Two-tier cache in front of the Nominatim city lookup.
+
+An in-process LRU answers repeat lookups without I/O; the ``geocode_cache``
+table keeps results across restarts and workers. Misses for the same key
+are collapsed into a single upstream call, and "no such city" answers are
+cached for a shorter time than hits. When the table cannot be read or
+written, lookups go straight to the resolver instead of failing.
+"""
+import asyncio
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+import sqlalchemy.exc
+
+GEOCODE_CACHE_SIZE = int(os.getenv("GEOCODE_CACHE_SIZE", "1024"))
+GEOCODE_TTL = int(os.getenv("GEOCODE_TTL_DAYS", "30")) * 86400
+GEOCODE_NEGATIVE_TTL = int(os.getenv("GEOCODE_NEGATIVE_TTL_HOURS", "24")) * 3600
+
+# What cs50 raises for a failed statement (RuntimeError) or SQLAlchemy for
+# a pool or connection problem
+DB_ERRORS = (RuntimeError, sqlalchemy.exc.SQLAlchemyError)
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_location(location):
+    """Case-fold and collapse whitespace/punctuation so "  hanoi ,VN" == "Hanoi, VN"."""
+    text = re.sub(r"\s*,\s*", ", ", (location or "").strip().lower())
+    return re.sub(r"\s+", " ", text).strip(" ,.")
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class GeocodeCache:
+    """Memoize ``resolver(location) -> full_name or None``.
+
+    ``resolver`` should raise ``requests.RequestException`` on network
+    failures so they are never cached. ``get_db`` returns the cs50 handle
+    for the persistent tier, or None to run memory-only.
+    """
+
+    def __init__(self, resolver, get_db=lambda: None, max_entries=GEOCODE_CACHE_SIZE,
+                 ttl=GEOCODE_TTL, negative_ttl=GEOCODE_NEGATIVE_TTL):
+        self.resolver = resolver
+        self.get_db = get_db
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._async_flights = {}
+
+    def validate(self, location):
+        """Drop-in replacement for ``helpers.validate_city``: (is_real, full_name)."""
+        key = normalize_location(location)
+        if not key:
+            return False, None
+        try:
+            full_name = self.lookup(key)
+        except requests.exceptions.RequestException:
+            return False, None
+        return full_name is not None, full_name
+
+    def lookup(self, key):
+        found, full_name = self._memory_get(key)
+        if found:
+            return full_name
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            found, full_name, expires_at = self._store_get(key)
+            if not found:
+                full_name = self.resolver(key)
+                expires_at = self._expiry(full_name)
+                self._store_put(key, full_name, expires_at)
+            self._memory_put(key, full_name, expires_at)
+            flight.result = full_name
+            return full_name
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    async def alookup(self, key, resolver):
+        """``lookup`` for an event loop: ``resolver`` is a coroutine function,
+        the table tier runs in a worker thread and concurrent misses for a
+        key share one task."""
+        found, full_name = self._memory_get(key)
+        if found:
+            return full_name
+
+        flight = self._async_flights.get(key)
+        if flight is None:
+            flight = self._async_flights[key] = asyncio.ensure_future(self._aresolve(key, resolver))
+            flight.add_done_callback(lambda _: self._async_flights.pop(key, None))
+        return await asyncio.shield(flight)
+
+    async def _aresolve(self, key, resolver):
+        found, full_name, expires_at = await asyncio.to_thread(self._store_get, key)
+        if not found:
+            full_name = await resolver(key)
+            expires_at = self._expiry(full_name)
+            await asyncio.to_thread(self._store_put, key, full_name, expires_at)
+        self._memory_put(key, full_name, expires_at)
+        return full_name
+
+    def _expiry(self, full_name):
+        return int(time.time()) + (self.ttl if full_name else self.negative_ttl)
+
+    def _memory_get(self, key):
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is None:
+                return False, None
+            full_name, expires_at = entry
+            if expires_at <= time.time():
+                del self._lru[key]
+                return False, None
+            self._lru.move_to_end(key)
+            return True, full_name
+
+    def _memory_put(self, key, full_name, expires_at):
+        with self._lock:
+            self._lru[key] = (full_name, expires_at)
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+
+    def _store_get(self, key):
+        db = self.get_db()
+        if db is None:
+            return False, None, None
+        try:
+            rows = db.execute("SELECT full_name, expires_at FROM geocode_cache WHERE query_key = ? AND expires_at > ?",
+                              key, int(time.time()))
+        except DB_ERRORS as e:
+            logger.warning("geocode cache read failed, looking up %r live: %s", key, e)
+            return False, None, None
+        if not rows:
+            return False, None, None
+        return True, rows[0]["full_name"], rows[0]["expires_at"]
+
+    def _store_put(self, key, full_name, expires_at):
+        db = self.get_db()
+        if db is None:
+            return
+        try:
+            db.execute("""
+                INSERT INTO geocode_cache (query_key, full_name, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT (query_key) DO UPDATE SET full_name = excluded.full_name, expires_at = excluded.expires_at
+            """, key, full_name, expires_at)
+        except DB_ERRORS as e:
+            # The answer is still good; only the shared copy is lost
+            logger.warning("geocode cache write failed for %r: %s", key, e)
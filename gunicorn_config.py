@@ -1,4 +1,16 @@
+import os
+
 bind = "0.0.0.0:10000"
-workers = 1
-threads = 2
-timeout = 120
\ No newline at end of file
+# Rate limits and sessions live in STORAGE_URI, so workers can be scaled out
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+timeout = 120
+
+# SERVER_MODE=asgi serves asgi:app on uvicorn workers: /fetch_url and
+# /validate_city run on the event loop, every other route on ASGI_THREADS
+# threads. Needs requirements-async.txt.
+if os.getenv("SERVER_MODE", "wsgi") == "asgi":
+    wsgi_app = "asgi:app"
+    worker_class = "uvicorn.workers.UvicornWorker"
+else:
+    wsgi_app = "app:app"
+    threads = 2
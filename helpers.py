@@ -1,17 +1,18 @@
 import requests
-import urllib.parse
 import logging
 import socket
 import ipaddress
 
-from bs4 import BeautifulSoup
 from flask import redirect, render_template, session
 from functools import wraps
 from decimal import Decimal, ROUND_HALF_UP, InvalidOperation
 import os
 import uuid
+import base64
+import binascii
 
-from security import SafeHTTPAdapter
+from fetcher import ProductFetcher
+from instrumentation import outbound
 
 def login_required(f):
     @wraps(f)
@@ -43,116 +44,62 @@ def apology(message, code=400):
     return render_template("apology.html", top=code, bottom=escape(message)), code
 
 
+_product_fetcher = ProductFetcher()
+
+
 def get_product_info(url):
+    """Title/image/description for a product URL (pooled, cached, SSRF-safe)."""
+    return _product_fetcher.fetch(url)
 
-    session = requests.Session()
 
-    adapter = SafeHTTPAdapter()
-    session.mount("http://", adapter)
-    session.mount("https://", adapter)
-    
-    try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-            'Sec-Fetch-Dest': 'document',
-            'Sec-Fetch-Mode': 'navigate',
-            'Sec-Fetch-Site': 'none',
-            'Sec-Fetch-User': '?1',
-            'Cache-Control': 'max-age=0',
-        }
-        response = session.get(url, timeout=5, allow_redirects=True)
-        response.raise_for_status()
-
-        soup = BeautifulSoup(response.content, 'html.parser')
-
-        # Try Open Graph tags first
-        title_tag = (
-            soup.find("meta", property="og:title") or 
-            soup.find("meta", attrs={"name": "title"}) or 
-            soup.find("title")
-        )
+NOMINATIM_SEARCH_URL = os.getenv("NOMINATIM_SEARCH_URL", "https://nominatim.openstreetmap.org/search")
+NOMINATIM_HEADERS = {'User-Agent': 'BountyGo_Global_Validator'}
 
-        desc_tag = (
-            soup.find("meta", property="og:description") or 
-            soup.find("meta", attrs={"name": "description"})
-        )
 
-        image_tag = (
-            soup.find("meta", property="og:image") or 
-            soup.find("meta", attrs={"name": "image"}) or
-            soup.find("link", rel="image_src") or
-            soup.find("img", {"id": "icImg"}) or
-            soup.find("img", {"class": "ux-image-magnifier-view__image"})
+def nominatim_params(location_input):
+    return {"q": location_input or "", "format": "json", "addressdetails": 1, "limit": 1}
+
+
+def parse_nominatim(data):
+    """"City, Country" from a Nominatim search response, or None."""
+    if data:
+        address = data[0].get('address', {})
+
+        city = (
+            address.get('city') or 
+            address.get('town') or 
+            address.get('village') or 
+            address.get('city_district') or 
+            address.get('suburb') or 
+            address.get('province') or 
+            address.get('state')
         )
 
-        # Extract content
-        title_content = None
-        if title_tag:
-            raw_title = title_tag.get("content") or title_tag.get_text()
-            title_content = raw_title.strip() if raw_title else None
-
-        if desc_tag:
-            raw_desc = desc_tag.get("content")
-            description_content = raw_desc.strip() if raw_desc else None
-
-        image_url = None
-        if image_tag:
-            raw_url = image_tag.get("content") or image_tag.get("href") or image_tag.get("src")
-            if raw_url:
-                raw_url = raw_url.strip()
-                if raw_url.startswith("//"):
-                    raw_url = "https:" + raw_url
-                image_url = urllib.parse.urljoin(response.url, raw_url)
-
-        return {
-            "title": title_content,
-            "image": image_url,
-            "description": description_content
-        }
-    
-    except requests.exceptions.RequestException:
-        # Do not expose internal error details to callers; return empty data
-        return {
-            "title": None,
-            "image": None,
-            "description": None
-        }
-    
+        country = address.get('country')
+        if city and country:
+            return f"{city}, {country}"
+    return None
+
+
+def geocode_city(location_input):
+    """Resolve free text to "City, Country", or None if Nominatim has no match.
+
+    Network errors propagate as requests exceptions so callers (and the
+    geocode cache) can tell "no such city" apart from "could not ask".
+    """
+    with outbound("nominatim"):
+        response = requests.get(NOMINATIM_SEARCH_URL, params=nominatim_params(location_input),
+                                headers=NOMINATIM_HEADERS, timeout=5)
+    response.raise_for_status()
+    return parse_nominatim(response.json())
+
 
 def validate_city(location_input):
-    q = urllib.parse.quote_plus(location_input or "")
-    url = f"https://nominatim.openstreetmap.org/search?q={q}&format=json&addressdetails=1&limit=1"
-    headers = {'User-Agent': 'BountyGo_Global_Validator'}
     try:
-        response = requests.get(url, headers=headers, timeout=5)
-        response.raise_for_status()
-        data = response.json()
-        
-        if data:
-            address = data[0].get('address', {})
-
-            city = (
-                address.get('city') or 
-                address.get('town') or 
-                address.get('village') or 
-                address.get('city_district') or 
-                address.get('suburb') or 
-                address.get('province') or 
-                address.get('state')
-            )
-
-            country = address.get('country')
-            if city and country:
-                return True, f"{city}, {country}"
-            return False, None
-        return False, None
+        full_name = geocode_city(location_input)
     except requests.exceptions.RequestException:
         return False, None
+    return full_name is not None, full_name
     
 
 def calculate_success_rate(completed, total):
@@ -161,14 +108,42 @@ def calculate_success_rate(completed, total):
     return round((completed / total * 100), 1)
 
 
+# calculate_success_rate as a SQL expression, for queries that return the rate directly
+SUCCESS_RATE_SQL = """
+    CASE WHEN COALESCE({total}, 0) <= 0 THEN 100.0
+         ELSE ROUND(CAST(COALESCE({completed}, 0) * 100.0 / {total} AS NUMERIC), 1) END
+"""
+
+
 def to_cents(amount_str: str) -> int:
     try:
         amount = Decimal(amount_str)
         return int((amount * Decimal('100')).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
-    except (ValueError, TypeError, decimal.InvalidOperation):
+    except (ValueError, TypeError, InvalidOperation):
         raise ValueError("Invalid currency format.")
     
 
 def format_currency(cents: int) -> str:
     return f"{cents / 100:.2f}"
 
+
+def encode_cursor(key, bounty_id):
+    """Opaque keyset cursor for the (sort key, id) position of a bounty row."""
+    raw = f"{key!r}:{bounty_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """Return (sort key, id) from a cursor, or None if it is missing or malformed."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+        key, bounty_id = raw.rsplit(":", 1)
+        try:
+            key = int(key)
+        except ValueError:
+            key = float(key)
+        return key, int(bounty_id)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        return None
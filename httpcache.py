@@ -0,0 +1,93 @@
+"""Per-route HTTP cache policies.
+
+Responses are ``no-store`` unless a route opts in. Public listings viewed
+anonymously are wrapped in ``versioned``: their ETag and Last-Modified come
+from the ``table_versions`` row bounty_state bumps on every write, so a
+client revalidating an unchanged page gets a 304 before the listing query
+or template runs. Logged-in users, pending flash messages and non-GET
+requests fall through to the normal no-store response.
+
+``FragmentCache`` keeps rendered template blocks keyed by that same
+version, so a write in any worker invalidates them everywhere.
+"""
+import functools
+import hashlib
+import threading
+from datetime import datetime, timezone
+
+from flask import Response, g, make_response, request, session
+
+NO_STORE = "no-cache, no-store, must-revalidate"
+
+
+def table_version(db, name="bounties"):
+    """``(version, updated_at)`` for ``name``, read at most once per request."""
+    versions = g.setdefault("table_versions", {})
+    if name not in versions:
+        rows = db.execute("SELECT version, updated_at FROM table_versions WHERE name = ?", name)
+        versions[name] = (rows[0]["version"], rows[0]["updated_at"]) if rows else (0, 0)
+    return versions[name]
+
+
+def _fresh(etag, updated_at):
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since:
+        return updated_at <= request.if_modified_since.timestamp()
+    return False
+
+
+def versioned(get_db, private=False):
+    """Cache an anonymous GET view until the bounties table changes.
+
+    ``private`` pages embed the visitor's CSRF token, so they are keyed on
+    it and kept out of shared caches.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != "GET" or session.get("user_id") or session.get("_flashes"):
+                return view(*args, **kwargs)
+
+            version, updated_at = table_version(get_db())
+            seed = f"{version}:{request.full_path}"
+            if private:
+                seed += f":{session.get('csrf_token')}"
+            etag = hashlib.sha1(seed.encode()).hexdigest()
+
+            if _fresh(etag, updated_at):
+                response = Response(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            response.last_modified = datetime.fromtimestamp(updated_at, timezone.utc)
+            response.cache_control.no_cache = True
+            if private:
+                response.cache_control.private = True
+            else:
+                response.cache_control.public = True
+            response.vary.add("Cookie")
+            return response
+        return wrapper
+    return decorator
+
+
+class FragmentCache:
+    """Rendered template fragments, each stored with the version it was built from."""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get_or_render(self, name, version, render):
+        with self._lock:
+            entry = self._entries.get(name)
+        if entry and entry[0] == version:
+            return entry[1]
+        html = render()
+        with self._lock:
+            self._entries[name] = (version, html)
+        return html
@@ -0,0 +1,100 @@
+"""Idempotency keys for state-changing form POSTs.
+
+Each such form carries a hidden ``idempotency_key`` field, filled by the
+``idempotency_key()`` template global. Views wrapped in
+``idempotent(get_db)`` refuse POSTs without a key, and take the key with
+a single ``INSERT ... ON CONFLICT DO NOTHING`` before running. A repeat
+of the same key (a double click, a resubmitted form, a retried request)
+does not run the view again. It is redirected to wherever the first
+request went, or answered 409 while that request is still running or
+when the key belongs to another user. When a request fails (an error
+page instead of a redirect), its key is released so the form can be
+corrected and sent again.
+
+Keys live for ``IDEMPOTENCY_TTL`` seconds; an expired key can be taken
+again. Expired keys are deleted at most once per
+``IDEMPOTENCY_SWEEP_INTERVAL`` seconds by whichever request comes next.
+"""
+import functools
+import os
+import secrets
+import threading
+import time
+
+from flask import make_response, redirect, request, session
+
+from helpers import apology
+
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", "86400"))
+IDEMPOTENCY_SWEEP_INTERVAL = int(os.getenv("IDEMPOTENCY_SWEEP_INTERVAL", "300"))
+
+FIELD = "idempotency_key"
+
+# An expired key is taken over as if it were free
+_CLAIM = """
+    INSERT INTO idempotency_keys (key, user_id, expires_at) VALUES ({key}, {user}, {expires})
+    ON CONFLICT (key) DO UPDATE SET user_id = excluded.user_id, location = NULL, expires_at = excluded.expires_at
+    WHERE idempotency_keys.expires_at < {now}
+"""
+
+_sweep_lock = threading.Lock()
+_next_sweep = 0
+
+
+def new_key():
+    return secrets.token_urlsafe(16)
+
+
+def claim(db, key, user_id, ttl=IDEMPOTENCY_TTL):
+    """Take ``key`` for a request; False if it was already taken."""
+    _sweep(db)
+    now = int(time.time())
+    if db.supports_returning:
+        sql = _CLAIM.format(key=":key", user=":user_id", expires=":expires_at", now=":now") + " RETURNING key"
+        return bool(db.query(sql, key=key, user_id=user_id, expires_at=now + ttl, now=now))
+    sql = _CLAIM.format(key="?", user="?", expires="?", now="?")
+    return db.execute(sql, key, user_id, now + ttl, now) is not None
+
+
+def _sweep(db):
+    global _next_sweep
+    now = time.time()
+    with _sweep_lock:
+        if now < _next_sweep:
+            return
+        _next_sweep = now + IDEMPOTENCY_SWEEP_INTERVAL
+    db.execute("DELETE FROM idempotency_keys WHERE expires_at < ?", int(now))
+
+
+def idempotent(get_db):
+    """Run a POST view at most once per idempotency key."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != "POST":
+                return view(*args, **kwargs)
+            key = request.form.get(FIELD)
+            if not key:
+                return apology("This form is out of date. Please reload the page and try again.", 400)
+
+            db = get_db()
+            # Read before the view runs: register() clears the session
+            user_id = session.get("user_id")
+            if not claim(db, key, user_id):
+                rows = db.execute("SELECT user_id, location FROM idempotency_keys WHERE key = ?", key)
+                if rows and rows[0]["user_id"] == user_id and rows[0]["location"]:
+                    return redirect(rows[0]["location"])
+                return apology("This form was already submitted.", 409)
+
+            try:
+                response = make_response(view(*args, **kwargs))
+            except BaseException:
+                db.execute("DELETE FROM idempotency_keys WHERE key = ?", key)
+                raise
+            if response.status_code in (301, 302, 303, 307, 308) and response.location:
+                db.execute("UPDATE idempotency_keys SET location = ? WHERE key = ?", response.location, key)
+            else:
+                db.execute("DELETE FROM idempotency_keys WHERE key = ?", key)
+            return response
+        return wrapper
+    return decorator
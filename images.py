@@ -0,0 +1,253 @@
+"""Local, content-addressed copies of bounty product images.
+
+A bounty's remote ``img_url`` is downloaded once, through a pooled session
+on ``SafeHTTPAdapter`` like ``fetcher``, decoded with Pillow and written to
+``IMAGES_DIR`` as ``<sha256>.<ext>`` next to a ``<sha256>-thumb.jpg``
+cropped to ``THUMBNAIL_SIZE`` for the listing grid. A file name never
+changes content, so ``/images/<name>`` is served with an immutable,
+year-long Cache-Control and identical images are stored once.
+
+The ``image_files`` table indexes the store: size, how many bounties use
+each image (kept by ``bounty_state``) and when it was last served
+(``AccessLog``). ``plan_eviction`` works from that index alone, so
+cleanup costs one row per evicted image instead of a directory walk.
+"""
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+from flask import url_for
+from PIL import Image, ImageOps
+
+import bounty_state
+from instrumentation import outbound
+from security import SafeHTTPAdapter
+
+IMAGES_DIR = os.getenv("IMAGES_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "images"))
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(5 * 1024 * 1024)))
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", str(40_000_000)))
+THUMBNAIL_SIZE = tuple(int(n) for n in os.getenv("THUMBNAIL_SIZE", "400x300").split("x"))
+IMAGE_ACCESS_RESOLUTION = int(os.getenv("IMAGE_ACCESS_RESOLUTION", "3600"))
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+_EXTENSIONS = {"JPEG": "jpg", "PNG": "png", "GIF": "gif", "WEBP": "webp"}
+
+
+class ImageError(ValueError):
+    """The URL did not yield an image we are willing to store."""
+
+
+def thumbnail_name(key):
+    return image_hash(key) + "-thumb.jpg"
+
+
+def image_hash(name):
+    """Content hash of a stored image or of its thumbnail."""
+    return name.split(".", 1)[0].removesuffix("-thumb")
+
+
+def image_src(bounty, thumbnail=False):
+    """Stored copy of a bounty's image when there is one, else its original URL."""
+    if bounty.get("image_key"):
+        return url_for("stored_image", name=thumbnail_name(bounty["image_key"]) if thumbnail else bounty["image_key"])
+    return bounty.get("img_url") or bounty_state.DEFAULT_IMAGE
+
+
+class ImageStore:
+
+    def __init__(self, root=IMAGES_DIR, max_bytes=IMAGE_MAX_BYTES, thumbnail_size=THUMBNAIL_SIZE, pool_size=4):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.thumbnail_size = thumbnail_size
+
+        self.session = requests.Session()
+        self.session.headers.update({"User-Agent": "BountyGo-ImageFetcher/1.0",
+                                     "Accept": "image/avif,image/webp,image/*;q=0.8"})
+        adapter = SafeHTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def fetch(self, url):
+        """Download ``url`` and store it; returns the stored file name."""
+        return self.save(self.download(url))
+
+    def download(self, url):
+        """Image bytes; network errors raise requests exceptions."""
+        with outbound("image"), self.session.get(url, timeout=10, stream=True) as response:
+            response.raise_for_status()
+            if not response.headers.get("Content-Type", "image/").lower().startswith("image/"):
+                raise ImageError(f"not an image: {response.headers['Content-Type']}")
+            if int(response.headers.get("Content-Length") or 0) > self.max_bytes:
+                raise ImageError("image too large")
+            body = bytearray()
+            for chunk in response.iter_content(chunk_size=65536):
+                body += chunk
+                if len(body) > self.max_bytes:
+                    raise ImageError("image too large")
+        return bytes(body)
+
+    def save(self, data):
+        """Store image bytes and their thumbnail; returns the stored file name."""
+        digest = hashlib.sha256(data).hexdigest()
+        try:
+            image = Image.open(io.BytesIO(data))
+            if image.format not in _EXTENSIONS:
+                raise ImageError(f"unsupported image format {image.format}")
+            if image.width * image.height > IMAGE_MAX_PIXELS:
+                raise ImageError("image too large")
+            image.load()
+        except (OSError, Image.DecompressionBombError) as e:
+            raise ImageError(f"unreadable image: {e}") from e
+
+        key = f"{digest}.{_EXTENSIONS[image.format]}"
+        os.makedirs(self.root, exist_ok=True)
+        if not os.path.exists(os.path.join(self.root, key)):
+            self._write(key, data)
+        thumb = thumbnail_name(key)
+        if not os.path.exists(os.path.join(self.root, thumb)):
+            self._write(thumb, self._thumbnail(image))
+        return key
+
+    def size(self, key):
+        """Bytes on disk for an image and its thumbnail."""
+        return sum(os.path.getsize(os.path.join(self.root, name)) for name in (key, thumbnail_name(key)))
+
+    def remove(self, key):
+        for name in (key, thumbnail_name(key)):
+            try:
+                os.unlink(os.path.join(self.root, name))
+            except FileNotFoundError:
+                pass
+
+    def _thumbnail(self, image):
+        image = ImageOps.exif_transpose(image)
+        if image.mode != "RGB":
+            # Flatten transparency onto white rather than black
+            background = Image.new("RGB", image.size, "white")
+            rgba = image.convert("RGBA")
+            background.paste(rgba, mask=rgba.getchannel("A"))
+            image = background
+        out = io.BytesIO()
+        ImageOps.fit(image, self.thumbnail_size, Image.Resampling.LANCZOS).save(
+            out, "JPEG", quality=82, optimize=True, progressive=True)
+        return out.getvalue()
+
+    def _write(self, name, data):
+        # Write then rename so a concurrent reader never sees half a file
+        fd, tmp = tempfile.mkstemp(dir=self.root, prefix=".tmp-")
+        try:
+            os.chmod(tmp, 0o644)
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, os.path.join(self.root, name))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+
+class AccessLog:
+    """Records reads in ``image_files.last_access``, at most once per image
+    per ``IMAGE_ACCESS_RESOLUTION`` seconds in each process."""
+
+    def __init__(self, get_db, resolution=IMAGE_ACCESS_RESOLUTION):
+        self.get_db = get_db
+        self.resolution = resolution
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+
+    def touch(self, name):
+        digest, now = image_hash(name), time.time()
+        with self._lock:
+            if now - self._seen.get(digest, 0) < self.resolution:
+                return
+            # Kept in time order, so entries past the resolution are dropped
+            # from the front instead of piling up for every image ever served
+            self._seen[digest] = now
+            self._seen.move_to_end(digest)
+            while now - next(iter(self._seen.values())) >= self.resolution:
+                self._seen.popitem(last=False)
+        db = self.get_db()
+        if db is not None:
+            db.execute("UPDATE image_files SET last_access = ? WHERE hash = ?", int(now), digest)
+
+
+def plan_eviction(db, max_total_bytes, grace_seconds, now=None, batch=100):
+    """Images to delete, in order, as (row, reason) pairs, plus the store
+    size once they are gone.
+
+    Unreferenced images untouched for ``grace_seconds`` go first (the grace
+    covers an image saved but not yet linked to its bounty), then the least
+    recently served ones until the store fits in ``max_total_bytes``.
+    """
+    now = int(time.time() if now is None else now)
+    total = db.execute("SELECT COALESCE(SUM(size), 0) AS total FROM image_files")[0]["total"]
+    plan, planned = [], set()
+
+    for row in db.execute("""
+        SELECT hash, name, size, refs, last_access FROM image_files
+        WHERE refs = 0 AND last_access < ? ORDER BY last_access
+    """, now - grace_seconds):
+        plan.append((row, "unreferenced"))
+        planned.add(row["hash"])
+        total -= row["size"]
+
+    after = (-1, "")
+    while total > max_total_bytes:
+        rows = db.execute("""
+            SELECT hash, name, size, refs, last_access FROM image_files
+            WHERE last_access > ? OR (last_access = ? AND hash > ?)
+            ORDER BY last_access, hash LIMIT ?
+        """, after[0], after[0], after[1], batch)
+        if not rows:
+            break
+        for row in rows:
+            after = (row["last_access"], row["hash"])
+            if row["hash"] in planned:
+                continue
+            if total <= max_total_bytes:
+                break
+            plan.append((row, "least recently used"))
+            planned.add(row["hash"])
+            total -= row["size"]
+    return plan, total
+
+
+def _lock(db, digest):
+    # Serializes evict() and link() for one image. SQLite's BEGIN IMMEDIATE
+    # already holds the database write lock; Postgres needs one that works
+    # whether or not the image_files row exists yet
+    if db.backend == "postgresql":
+        db.query("SELECT pg_advisory_xact_lock(hashtext(:digest))", digest=digest)
+
+
+def link(db, store, bounty_id, img_url, key):
+    """``bounty_state.set_image`` for a freshly saved file, under the lock
+    ``evict`` takes. Raises FileNotFoundError when an eviction removed the
+    file after it was saved; the job retries and downloads it again."""
+    with db.transaction():
+        _lock(db, image_hash(key))
+        return bounty_state.set_image(db, bounty_id, img_url, key, store.size(key))
+
+
+def evict(db, store, row):
+    """Unlink an image from its bounties and the index, then delete its files.
+
+    Returns False, and keeps everything, when the image gained references
+    after ``plan_eviction`` chose it. The files are deleted under the same
+    lock, before the commit, so ``link`` cannot point a bounty at them in
+    between.
+    """
+    with db.transaction():
+        _lock(db, row["hash"])
+        current = db.execute("SELECT refs FROM image_files WHERE hash = ?", row["hash"])
+        if not current or current[0]["refs"] > row["refs"]:
+            return False
+        bounty_state.drop_image(db, row["name"])
+        db.execute("DELETE FROM image_files WHERE hash = ?", row["hash"])
+        store.remove(row["name"])
+    return True
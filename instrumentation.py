@@ -0,0 +1,248 @@
+"""Request, SQL and outbound HTTP timings for /metrics.
+
+``init_app`` times every Flask request and counts the queries it issues;
+``instrument_engine`` hooks SQLAlchemy's cursor events, so every cs50
+``db.execute`` is timed and aggregated under its normalized text (literals
+replaced by ``?``). ``outbound(service)`` wraps calls to other sites.
+Requests slower than ``SLOW_REQUEST_SECONDS`` are logged with their query
+breakdown.
+
+Everything is kept in plain per-process counters and fixed-bucket
+histograms (a few perf_counter calls and one regex per query), cheap
+enough to leave on; each worker reports its own numbers.
+
+``sample_profile`` is an opt-in (``PROFILING_ENABLED=1``) sampling
+profiler: it walks every thread's stack at ``interval`` for a few seconds
+and returns collapsed stacks for flamegraph.pl or speedscope.
+"""
+import contextlib
+import contextvars
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import g, request
+from sqlalchemy import event
+
+SLOW_REQUEST_SECONDS = float(os.getenv("SLOW_REQUEST_SECONDS", "1.0"))
+METRICS_MAX_STATEMENTS = int(os.getenv("METRICS_MAX_STATEMENTS", "200"))
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+OUTBOUND_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+logger = logging.getLogger(__name__)
+
+_LITERALS = re.compile(r"'[^']*(?:''[^']*)*'|\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r"\(\?(?:, ?\?)+\)")
+
+# Stats of the request running in this context, if any
+_current = contextvars.ContextVar("request_stats", default=None)
+
+
+def normalize_sql(sql):
+    """Statement text with literals and IN lists folded, for grouping."""
+    sql = " ".join(_LITERALS.sub("?", sql).split())
+    return _IN_LISTS.sub("(...)", sql)[:300]
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += 1
+            series[2] += value
+
+    def lines(self, metric, label_names):
+        with self._lock:
+            snapshot = {labels: (list(b), n, s) for labels, (b, n, s) in self._series.items()}
+        lines = [f"# TYPE {metric} histogram"]
+        for labels, (buckets, count, total) in sorted(snapshot.items()):
+            base = _labels(label_names, labels)
+            for bound, n in zip(self.buckets, buckets):
+                lines.append(f'{metric}_bucket{{{base}{"," if base else ""}le="{bound}"}} {n}')
+            lines.append(f'{metric}_bucket{{{base}{"," if base else ""}le="+Inf"}} {count}')
+            lines.append(f"{metric}_sum{{{base}}} {total:.6f}")
+            lines.append(f"{metric}_count{{{base}}} {count}")
+        return lines
+
+
+class QueryStats:
+    """Count, total and max seconds per normalized statement."""
+
+    def __init__(self, max_statements=METRICS_MAX_STATEMENTS):
+        self.max_statements = max_statements
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def observe(self, statement, seconds):
+        with self._lock:
+            stats = self._stats.get(statement)
+            if stats is None:
+                if len(self._stats) >= self.max_statements:
+                    statement = "other"
+                stats = self._stats.setdefault(statement, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+
+    def lines(self):
+        with self._lock:
+            snapshot = {k: list(v) for k, v in self._stats.items()}
+        lines = ["# TYPE bountygo_db_query_seconds summary"]
+        for statement, (count, total, _) in sorted(snapshot.items()):
+            label = _labels(("statement",), (statement,))
+            lines.append(f"bountygo_db_query_seconds_sum{{{label}}} {total:.6f}")
+            lines.append(f"bountygo_db_query_seconds_count{{{label}}} {count}")
+        lines.append("# TYPE bountygo_db_query_max_seconds gauge")
+        for statement, (_, _, longest) in sorted(snapshot.items()):
+            lines.append(f"bountygo_db_query_max_seconds{{{_labels(('statement',), (statement,))}}} {longest:.6f}")
+        return lines
+
+
+class RequestStats:
+
+    __slots__ = ("start", "queries", "db_seconds", "outbound_seconds", "slowest")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.outbound_seconds = 0.0
+        self.slowest = []  # (seconds, statement), kept to the 3 slowest
+
+    def add_query(self, statement, seconds):
+        self.queries += 1
+        self.db_seconds += seconds
+        if len(self.slowest) < 3 or seconds > self.slowest[-1][0]:
+            self.slowest = sorted(self.slowest + [(seconds, statement)], reverse=True)[:3]
+
+
+request_seconds = Histogram(REQUEST_BUCKETS)
+request_queries = Histogram(QUERY_COUNT_BUCKETS)
+outbound_seconds = Histogram(OUTBOUND_BUCKETS)
+outbound_errors = Counter()
+query_stats = QueryStats()
+_errors_lock = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+def instrument_engine(engine):
+    """Time every statement run on ``engine``."""
+    @event.listens_for(engine, "before_cursor_execute")
+    def before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after(conn, cursor, statement, parameters, context, executemany):
+        seconds = time.perf_counter() - conn.info["query_start"].pop()
+        normalized = normalize_sql(statement)
+        query_stats.observe(normalized, seconds)
+        stats = _current.get()
+        if stats is not None:
+            stats.add_query(normalized, seconds)
+
+
+@contextlib.contextmanager
+def outbound(service):
+    """Time a call to another site (``service`` labels the metric)."""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        with _errors_lock:
+            outbound_errors[service] += 1
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        outbound_seconds.observe((service,), seconds)
+        stats = _current.get()
+        if stats is not None:
+            stats.outbound_seconds += seconds
+
+
+def start_request():
+    """Begin timing a request in the current context."""
+    stats = RequestStats()
+    return stats, _current.set(stats)
+
+
+def finish_request(stats, token, endpoint, method, status):
+    """Record a request started with ``start_request``; returns its duration."""
+    _current.reset(token)
+    seconds = time.perf_counter() - stats.start
+    request_seconds.observe((endpoint, method, str(status)), seconds)
+    request_queries.observe((endpoint,), stats.queries)
+    if seconds >= SLOW_REQUEST_SECONDS:
+        logger.warning("slow request %s %s -> %s in %.3fs: %d queries (%.3fs), %.3fs outbound; slowest: %s",
+                       method, endpoint, status, seconds, stats.queries, stats.db_seconds, stats.outbound_seconds,
+                       "; ".join(f"{s * 1000:.1f}ms {q}" for s, q in stats.slowest) or "none")
+    return seconds
+
+
+def init_app(app):
+    @app.before_request
+    def _start():
+        g.instrumentation = start_request()
+
+    @app.after_request
+    def _finish(response):
+        started = g.pop("instrumentation", None)
+        if started is not None:
+            finish_request(*started, request.endpoint or "unmatched", request.method, response.status_code)
+        return response
+
+
+def metrics_text():
+    """Request, query and outbound metrics in Prometheus text format."""
+    lines = request_seconds.lines("bountygo_http_request_duration_seconds", ("endpoint", "method", "status"))
+    lines += request_queries.lines("bountygo_http_request_queries", ("endpoint",))
+    lines += query_stats.lines()
+    lines += outbound_seconds.lines("bountygo_outbound_request_duration_seconds", ("service",))
+    lines.append("# TYPE bountygo_outbound_request_errors_total counter")
+    with _errors_lock:
+        for service, count in sorted(outbound_errors.items()):
+            lines.append(f'bountygo_outbound_request_errors_total{{service="{_escape(service)}"}} {count}')
+    return "\n".join(lines) + "\n"
+
+
+def sample_profile(seconds, interval=0.005):
+    """Sample every other thread's stack; collapsed "a;b;c count" lines."""
+    stacks = Counter()
+    me = threading.get_ident()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == me:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            stacks[";".join(reversed(names))] += 1
+        time.sleep(interval)
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
@@ -0,0 +1,175 @@
+"""Background jobs for slow outbound work (geocoding, product scraping).
+
+Jobs are rows in the ``jobs`` table, so they survive restarts and whichever
+worker process is free runs them. Each process starts ``JOB_WORKERS``
+threads that claim due jobs with a guarded UPDATE, call the registered
+handler and either mark the job done or reschedule it with exponential
+backoff (``JOB_RETRY_BASE`` seconds, doubling per attempt, capped at
+``JOB_RETRY_MAX``). After ``JOB_MAX_ATTEMPTS`` the job is marked failed and
+the handler's ``on_failure`` runs. A job whose worker died mid-run is
+picked up again once its ``JOB_LEASE_SECONDS`` lease has run out.
+
+Done and failed jobs are kept for ``JOB_RETENTION`` seconds (the details
+page shows a bounty's latest job) and then deleted, at most once per
+``JOB_SWEEP_INTERVAL`` seconds by whichever worker looks for work next.
+"""
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+JOB_RETRY_BASE = float(os.getenv("JOB_RETRY_BASE", "2"))
+JOB_RETRY_MAX = float(os.getenv("JOB_RETRY_MAX", "300"))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "300"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "5"))
+JOB_RETENTION = int(os.getenv("JOB_RETENTION", "604800"))
+JOB_SWEEP_INTERVAL = int(os.getenv("JOB_SWEEP_INTERVAL", "3600"))
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueue:
+
+    def __init__(self, get_db, workers=JOB_WORKERS, max_attempts=JOB_MAX_ATTEMPTS,
+                 poll_interval=JOB_POLL_INTERVAL, retention=JOB_RETENTION, sweep_interval=JOB_SWEEP_INTERVAL):
+        self.get_db = get_db
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.sweep_interval = sweep_interval
+        self._next_sweep = 0
+        self._handlers = {}
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._started_pid = None
+
+    def handler(self, kind, on_failure=None):
+        """Register ``fn(db, bounty_id, **payload)`` for ``kind``.
+
+        ``on_failure(db, bounty_id)`` runs once the last attempt has failed.
+        """
+        def decorator(fn):
+            self._handlers[kind] = (fn, on_failure)
+            return fn
+        return decorator
+
+    def enqueue(self, db, kind, bounty_id=None, **payload):
+        """Queue a job; inside a transaction it becomes visible on commit."""
+        job_id = db.execute("""
+            INSERT INTO jobs (kind, bounty_id, payload, max_attempts, run_after) VALUES (?, ?, ?, ?, ?)
+        """, kind, bounty_id, json.dumps(payload), self.max_attempts, int(time.time()))
+        db.after_commit(self._wake.set)
+        return job_id
+
+    def start(self):
+        """Start the worker threads (once per process, so it is fork-safe)."""
+        with self._lock:
+            if self.workers <= 0 or self._started_pid == os.getpid():
+                return
+            self._started_pid = os.getpid()
+        for i in range(self.workers):
+            threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True).start()
+
+    def _work(self):
+        while True:
+            try:
+                ran = self.run_next()
+            except Exception:
+                logger.exception("job worker error")
+                ran = False
+            if not ran:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+
+    def run_next(self):
+        """Claim and run one due job; returns False when none is due."""
+        db = self.get_db()
+        if db is None:
+            return False
+        self._sweep(db)
+        job = self._claim(db)
+        if job is None:
+            return False
+
+        fn, on_failure = self._handlers.get(job["kind"], (None, None))
+        try:
+            if fn is None:
+                raise LookupError(f"no handler for job kind {job['kind']!r}")
+            fn(db, job["bounty_id"], **json.loads(job["payload"] or "{}"))
+        except Exception as e:
+            self._failed(db, job, e, on_failure)
+        else:
+            db.execute("UPDATE jobs SET status = 'done', locked_until = NULL, finished_at = ? WHERE id = ?",
+                       int(time.time()), job["id"])
+        return True
+
+    def run_pending(self):
+        """Run due jobs in the calling thread until none are left (scripts, tests)."""
+        count = 0
+        while self.run_next():
+            count += 1
+        return count
+
+    def _sweep(self, db):
+        now = int(time.time())
+        with self._lock:
+            if now < self._next_sweep:
+                return
+            self._next_sweep = now + self.sweep_interval
+        db.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?", now - self.retention)
+
+    def _claim(self, db):
+        now = int(time.time())
+        # Another worker may win the race for a candidate; try the next one
+        for _ in range(5):
+            rows = db.execute("""
+                SELECT * FROM jobs
+                WHERE (status = 'queued' AND run_after <= ?) OR (status = 'running' AND locked_until <= ?)
+                ORDER BY run_after, id LIMIT 1
+            """, now, now)
+            if not rows:
+                return None
+            job = rows[0]
+            if db.execute("""
+                UPDATE jobs SET status = 'running', attempts = attempts + 1, locked_until = ?
+                WHERE id = ? AND status = ? AND attempts = ?
+            """, now + JOB_LEASE_SECONDS, job["id"], job["status"], job["attempts"]) == 1:
+                job["attempts"] += 1
+                return job
+        return None
+
+    def _failed(self, db, job, error, on_failure):
+        message = f"{type(error).__name__}: {error}"[:500]
+        if job["attempts"] < job["max_attempts"]:
+            delay = min(JOB_RETRY_MAX, JOB_RETRY_BASE * 2 ** (job["attempts"] - 1))
+            # Jitter so jobs that failed together do not retry together
+            run_after = int(time.time() + delay * random.uniform(0.5, 1.0))
+            db.execute("""
+                UPDATE jobs SET status = 'queued', run_after = ?, locked_until = NULL, last_error = ? WHERE id = ?
+            """, run_after, message, job["id"])
+            logger.info("job %s (%s) attempt %s failed, retrying: %s", job["id"], job["kind"], job["attempts"], message)
+            return
+
+        db.execute("""
+            UPDATE jobs SET status = 'failed', locked_until = NULL, last_error = ?, finished_at = ? WHERE id = ?
+        """, message, int(time.time()), job["id"])
+        logger.warning("job %s (%s) failed after %s attempts: %s", job["id"], job["kind"], job["attempts"], message)
+        if on_failure is not None:
+            try:
+                on_failure(db, job["bounty_id"])
+            except Exception:
+                logger.exception("job %s on_failure hook failed", job["id"])
+
+
+def latest_job(db, bounty_id):
+    """Most recent job for a bounty, for the details page."""
+    rows = db.execute("""
+        SELECT kind, status, attempts, max_attempts, run_after, last_error
+        FROM jobs WHERE bounty_id = ? ORDER BY id DESC LIMIT 1
+    """, bounty_id)
+    return rows[0] if rows else None
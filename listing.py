@@ -0,0 +1,83 @@
+"""Keyset-paginated query over pending bounties.
+
+Shared by the /bounties page and /api/v1/bounties. Rows come back in
+relevance order when searching, otherwise most expensive first, each with
+a ``sort_key`` column; ``encode_cursor(row["sort_key"], row["id"])`` of
+the first or last row is the ``before`` / ``after`` cursor of the
+neighbouring page.
+"""
+import os
+from collections import namedtuple
+
+from search import ranked_search
+
+BOUNTIES_PAGE_SIZE = int(os.getenv("BOUNTIES_PAGE_SIZE", "24"))
+BOUNTIES_MAX_PAGE_SIZE = 100
+
+Page = namedtuple("Page", "rows has_next has_prev")
+
+
+def page_limit(value):
+    """Requested page size, clamped to 1..BOUNTIES_MAX_PAGE_SIZE."""
+    try:
+        limit = int(value or BOUNTIES_PAGE_SIZE)
+    except ValueError:
+        limit = BOUNTIES_PAGE_SIZE
+    return max(1, min(limit, BOUNTIES_MAX_PAGE_SIZE))
+
+
+def pending_query(backend, columns="b.*", search_query=None, category=None, dispatch_box=None,
+                  after=None, before=None, limit=BOUNTIES_PAGE_SIZE):
+    """SQL and parameters of a pending_bounties page (one row over ``limit``)."""
+    before = None if after else before
+
+    plan = ranked_search(backend, search_query)
+    if plan:
+        source, sort_key, descending = plan.source, plan.rank, False
+        params = list(plan.source_params)
+    else:
+        source, sort_key, descending = "bounties b", "b.price", True
+        params = []
+
+    query = f"SELECT {columns}, {sort_key} AS sort_key FROM {source} WHERE b.status = 'pending'"
+
+    if plan:
+        query += " AND " + plan.condition
+        params.extend(plan.condition_params)
+
+    if category:
+        query += " AND b.category = ?"
+        params.append(category)
+
+    if dispatch_box:
+        query += " AND b.dispatch_box = ?"
+        params.append(dispatch_box)
+
+    # Walk (sort_key, id) from the cursor; a "before" page is read in the
+    # opposite order and flipped so both directions stay on the same index.
+    forward = "DESC" if descending else "ASC"
+    backward = "ASC" if descending else "DESC"
+    if after:
+        query += f" AND ({sort_key}, b.id) {'<' if descending else '>'} (?, ?)"
+        params.extend(after)
+    elif before:
+        query += f" AND ({sort_key}, b.id) {'>' if descending else '<'} (?, ?)"
+        params.extend(before)
+    query += f" ORDER BY sort_key {backward if before else forward}, b.id {backward if before else forward} LIMIT ?"
+    params.append(limit + 1)
+    return query, params
+
+
+def pending_bounties(db, columns="b.*", search_query=None, category=None, dispatch_box=None,
+                     after=None, before=None, limit=BOUNTIES_PAGE_SIZE):
+    """One page of pending bounties; ``columns`` is the SELECT list over ``b``."""
+    before = None if after else before
+    query, params = pending_query(db.backend, columns, search_query, category, dispatch_box, after, before, limit)
+    rows = db.execute(query, *params)
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if before:
+        rows.reverse()
+        return Page(rows, has_next=True, has_prev=has_more)
+    return Page(rows, has_next=has_more, has_prev=after is not None)
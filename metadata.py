@@ -0,0 +1,151 @@
+"""Incremental product metadata extractor.
+
+Feeds HTML to ``html.parser.HTMLParser`` chunk by chunk and records the
+first match of each rule, so the caller can stop downloading as soon as
+``done`` is true instead of building a full document tree. Returns the
+same ``{"title", "image", "description"}`` dict the old BeautifulSoup
+path did.
+
+Rules are tried in priority order per field (lower index wins). Generic
+Open Graph / meta rules apply to every page; ``SITE_RULES`` adds fallbacks
+for specific hosts and can be extended with ``register_site_rules``.
+"""
+import urllib.parse
+from collections import namedtuple
+from html.parser import HTMLParser
+
+# ``attrs`` must all match (``class`` matches one token of the class list);
+# the value comes from the first non-empty attribute in ``value_from``, or
+# from the element text when ``value_from`` is empty.
+Rule = namedtuple("Rule", "field tag attrs value_from in_head")
+
+FIELDS = ("title", "image", "description")
+
+DEFAULT_RULES = [
+    Rule("title", "meta", {"property": "og:title"}, ("content",), True),
+    Rule("title", "meta", {"name": "title"}, ("content",), True),
+    Rule("title", "title", {}, (), True),
+    Rule("description", "meta", {"property": "og:description"}, ("content",), True),
+    Rule("description", "meta", {"name": "description"}, ("content",), True),
+    Rule("image", "meta", {"property": "og:image"}, ("content",), True),
+    Rule("image", "meta", {"name": "image"}, ("content",), True),
+    Rule("image", "link", {"rel": "image_src"}, ("href",), True),
+]
+
+SITE_RULES = {
+    "ebay.": [
+        Rule("image", "img", {"id": "icImg"}, ("src",), False),
+        Rule("image", "img", {"class": "ux-image-magnifier-view__image"}, ("src",), False),
+    ],
+}
+
+
+def register_site_rules(host_fragment, rules):
+    """Add fallback rules for hosts containing ``host_fragment`` (e.g. "amazon.")."""
+    SITE_RULES.setdefault(host_fragment, []).extend(rules)
+
+
+def rules_for(url):
+    host = (urllib.parse.urlsplit(url).hostname or "").lower()
+    rules = list(DEFAULT_RULES)
+    for fragment, extra in SITE_RULES.items():
+        if fragment in host:
+            rules.extend(extra)
+    return rules
+
+
+def _matches(rule, tag, attrs):
+    if rule.tag != tag:
+        return False
+    for name, wanted in rule.attrs.items():
+        value = attrs.get(name)
+        if value is None:
+            return False
+        if name in ("class", "rel"):
+            if wanted not in value.split():
+                return False
+        elif value != wanted:
+            return False
+    return True
+
+
+class MetadataExtractor(HTMLParser):
+
+    def __init__(self, base_url, rules=None):
+        super().__init__(convert_charrefs=True)
+        self.base_url = base_url
+        self.rules = rules if rules is not None else rules_for(base_url)
+        self._by_field = {f: [r for r in self.rules if r.field == f] for f in FIELDS}
+        # field -> (rule priority, raw value)
+        self._found = {}
+        self._text_rule = None
+        self._text = []
+        self.head_closed = False
+
+    @property
+    def done(self):
+        """True once no unread part of the page can change the result."""
+        return all(self._is_final(f) for f in FIELDS)
+
+    def _is_final(self, field):
+        found = self._found.get(field)
+        for priority, rule in enumerate(self._by_field[field]):
+            if found and priority >= found[0]:
+                return True
+            if not (rule.in_head and self.head_closed):
+                return False
+        return True
+
+    def _offer(self, rule, value):
+        value = (value or "").strip()
+        if not value:
+            return
+        priority = self._by_field[rule.field].index(rule)
+        current = self._found.get(rule.field)
+        if current is None or priority < current[0]:
+            self._found[rule.field] = (priority, value)
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "body":
+            self.head_closed = True
+        attrs = {k: v for k, v in attrs if v is not None}
+        for rule in self.rules:
+            if not _matches(rule, tag, attrs):
+                continue
+            if rule.value_from:
+                self._offer(rule, next((attrs[a] for a in rule.value_from if attrs.get(a)), None))
+            elif self._text_rule is None:
+                self._text_rule, self._text = rule, []
+
+    handle_startendtag = handle_starttag
+
+    def handle_data(self, data):
+        if self._text_rule is not None:
+            self._text.append(data)
+
+    def handle_endtag(self, tag):
+        if self._text_rule is not None and tag == self._text_rule.tag:
+            self._offer(self._text_rule, "".join(self._text))
+            self._text_rule = None
+        if tag == "head":
+            self.head_closed = True
+
+    def result(self):
+        title = self._found.get("title", (None, None))[1]
+        description = self._found.get("description", (None, None))[1]
+        image = self._found.get("image", (None, None))[1]
+        if image:
+            if image.startswith("//"):
+                image = "https:" + image
+            image = urllib.parse.urljoin(self.base_url, image)
+        return {"title": title, "image": image, "description": description}
+
+
+def extract_metadata(html, base_url):
+    """Parse a complete document (or as much of it as is needed)."""
+    extractor = MetadataExtractor(base_url)
+    for start in range(0, len(html), 16384):
+        extractor.feed(html[start:start + 16384])
+        if extractor.done:
+            break
+    return extractor.result()
@@ -0,0 +1,428 @@
+"""Versioned schema migrations for the bounty database.
+
+Each migration is a function that receives the ``database.Database`` and the
+backend name (``"sqlite"`` or ``"postgresql"``). Applied versions are recorded
+in ``schema_migrations`` so ``migrate()`` is safe to call on every startup.
+"""
+import time
+
+
+def _initial_schema(db, backend):
+    pk = "SERIAL PRIMARY KEY" if backend == "postgresql" else "INTEGER PRIMARY KEY AUTOINCREMENT"
+
+    db.execute(f"""
+        CREATE TABLE IF NOT EXISTS users (
+            id {pk},
+            username TEXT NOT NULL UNIQUE,
+            email TEXT NOT NULL UNIQUE,
+            password_hash TEXT NOT NULL,
+            total_posted INTEGER DEFAULT 0,
+            completed_posted INTEGER DEFAULT 0,
+            total_claimed INTEGER DEFAULT 0,
+            completed_orders INTEGER DEFAULT 0
+        )
+    """)
+    db.execute(f"""
+        CREATE TABLE IF NOT EXISTS bounties (
+            id {pk},
+            poster_id INTEGER NOT NULL REFERENCES users(id),
+            traveler_id INTEGER REFERENCES users(id),
+            item_name TEXT NOT NULL,
+            category TEXT NOT NULL,
+            price REAL NOT NULL,
+            reward_fee REAL NOT NULL,
+            description TEXT NOT NULL,
+            img_url TEXT NOT NULL DEFAULT '/static/Bountygo.png',
+            dispatch_box TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    db.execute(f"""
+        CREATE TABLE IF NOT EXISTS bounty_requests (
+            id {pk},
+            bounty_id INTEGER NOT NULL REFERENCES bounties(id),
+            traveler_id INTEGER NOT NULL REFERENCES users(id),
+            status TEXT DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+    if backend != "sqlite":
+        return
+
+    # Reputation counters, as defined in bounty.sqbpro
+    db.execute("""
+        CREATE TRIGGER IF NOT EXISTS increment_total_posted
+        AFTER INSERT ON bounties
+        BEGIN
+            UPDATE users SET total_posted = total_posted + 1 WHERE id = NEW.poster_id;
+        END
+    """)
+    db.execute("""
+        CREATE TRIGGER IF NOT EXISTS decrement_total_posted
+        AFTER DELETE ON bounties
+        BEGIN
+            UPDATE users SET total_posted = total_posted - 1 WHERE id = OLD.poster_id;
+        END
+    """)
+    db.execute("""
+        CREATE TRIGGER IF NOT EXISTS increment_completed_posted
+        AFTER UPDATE OF status ON bounties
+        FOR EACH ROW
+        WHEN NEW.status = 'completed' AND OLD.status != 'completed'
+        BEGIN
+            UPDATE users SET completed_posted = completed_posted + 1 WHERE id = NEW.poster_id;
+        END
+    """)
+    db.execute("""
+        CREATE TRIGGER IF NOT EXISTS increment_total_claimed
+        AFTER UPDATE OF traveler_id ON bounties
+        FOR EACH ROW
+        WHEN NEW.traveler_id IS NOT NULL AND OLD.traveler_id IS NULL
+        BEGIN
+            UPDATE users SET total_claimed = total_claimed + 1 WHERE id = NEW.traveler_id;
+        END
+    """)
+    db.execute("""
+        CREATE TRIGGER IF NOT EXISTS update_user_reputation
+        AFTER UPDATE OF status ON bounties
+        FOR EACH ROW
+        WHEN NEW.status = 'completed' AND OLD.status != 'completed'
+        BEGIN
+            UPDATE users SET completed_orders = completed_orders + 1 WHERE id = NEW.traveler_id;
+        END
+    """)
+
+
+def _listing_indexes(db, backend):
+    # Keyset pagination on /bounties walks (price, id) within status = 'pending',
+    # the home page sorts pending bounties by reward_fee.
+    db.execute("CREATE INDEX IF NOT EXISTS idx_bounties_status_price_id ON bounties (status, price, id)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_bounties_status_reward ON bounties (status, reward_fee)")
+
+
+def _fts_triggers(db):
+    db.execute("""
+        CREATE TRIGGER IF NOT EXISTS bounties_fts_insert
+        AFTER INSERT ON bounties
+        BEGIN
+            INSERT INTO bounties_fts (rowid, item_name, description, category)
+            VALUES (NEW.id, NEW.item_name, NEW.description, NEW.category);
+        END
+    """)
+    db.execute("""
+        CREATE TRIGGER IF NOT EXISTS bounties_fts_delete
+        AFTER DELETE ON bounties
+        BEGIN
+            INSERT INTO bounties_fts (bounties_fts, rowid, item_name, description, category)
+            VALUES ('delete', OLD.id, OLD.item_name, OLD.description, OLD.category);
+        END
+    """)
+    db.execute("""
+        CREATE TRIGGER IF NOT EXISTS bounties_fts_update
+        AFTER UPDATE OF item_name, description, category ON bounties
+        BEGIN
+            INSERT INTO bounties_fts (bounties_fts, rowid, item_name, description, category)
+            VALUES ('delete', OLD.id, OLD.item_name, OLD.description, OLD.category);
+            INSERT INTO bounties_fts (rowid, item_name, description, category)
+            VALUES (NEW.id, NEW.item_name, NEW.description, NEW.category);
+        END
+    """)
+
+
+def _full_text_search(db, backend):
+    if backend == "postgresql":
+        db.execute("""
+            ALTER TABLE bounties ADD COLUMN IF NOT EXISTS search_vector tsvector
+            GENERATED ALWAYS AS (
+                setweight(to_tsvector('simple', coalesce(item_name, '')), 'A') ||
+                setweight(to_tsvector('simple', coalesce(category, '')), 'B') ||
+                setweight(to_tsvector('simple', coalesce(description, '')), 'C')
+            ) STORED
+        """)
+        db.execute("CREATE INDEX IF NOT EXISTS idx_bounties_search ON bounties USING GIN (search_vector)")
+        return
+
+    # External-content FTS5 index; the _fts_triggers mirror every write made
+    # by order(), update_bounty() and delete_bounty().
+    db.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS bounties_fts USING fts5(
+            item_name, description, category,
+            content='bounties', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    """)
+    _fts_triggers(db)
+    db.execute("INSERT INTO bounties_fts (bounties_fts) VALUES ('rebuild')")
+
+
+def _geocode_cache(db, backend):
+    # Persistent tier of geocache.GeocodeCache; full_name is NULL for a
+    # cached "no such city" answer.
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS geocode_cache (
+            query_key TEXT PRIMARY KEY,
+            full_name TEXT,
+            expires_at INTEGER NOT NULL
+        )
+    """)
+
+
+def _drop_counter_triggers(db, backend):
+    # bounty_state now maintains the users.* counters inside each transition,
+    # on every backend; keeping the SQLite triggers would count twice.
+    if backend != "sqlite":
+        return
+    for name in ("increment_total_posted", "decrement_total_posted", "increment_completed_posted",
+                 "increment_total_claimed", "update_user_reputation"):
+        db.execute(f"DROP TRIGGER IF EXISTS {name}")
+
+
+def _table_versions(db, backend):
+    # Change counter behind the ETag / Last-Modified of public listings;
+    # bounty_state bumps the 'bounties' row inside every transition.
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS table_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0,
+            updated_at INTEGER NOT NULL
+        )
+    """)
+    db.execute("INSERT INTO table_versions (name, version, updated_at) VALUES ('bounties', 0, ?)", int(time.time()))
+
+
+def _jobs(db, backend):
+    # Queue for jobs.JobQueue; run_after is a unix timestamp
+    pk = "SERIAL PRIMARY KEY" if backend == "postgresql" else "INTEGER PRIMARY KEY AUTOINCREMENT"
+    db.execute(f"""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id {pk},
+            kind TEXT NOT NULL,
+            bounty_id INTEGER,
+            payload TEXT,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL,
+            run_after INTEGER NOT NULL,
+            locked_until INTEGER,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    db.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_run_after ON jobs (status, run_after)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_jobs_bounty_id ON jobs (bounty_id)")
+
+
+def _image_key(db, backend):
+    # File name in images.IMAGES_DIR of the local copy of img_url, once stored
+    db.execute("ALTER TABLE bounties ADD COLUMN image_key TEXT")
+
+
+def _image_files(db, backend):
+    # One row per stored image (keyed by content hash) for scripts/cleanup_images.py;
+    # refs is kept by bounty_state, last_access by the /images route
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS image_files (
+            hash TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            refs INTEGER NOT NULL DEFAULT 0,
+            last_access INTEGER NOT NULL
+        )
+    """)
+    db.execute("CREATE INDEX IF NOT EXISTS idx_image_files_refs_last_access ON image_files (refs, last_access)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_image_files_last_access ON image_files (last_access)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_bounties_image_key ON bounties (image_key)")
+    # Sizes of images stored before this migration are filled in by cleanup_images.py --scan
+    db.execute("""
+        INSERT INTO image_files (hash, name, size, refs, last_access)
+        SELECT SUBSTR(image_key, 1, 64), image_key, 0, COUNT(*), ?
+        FROM bounties WHERE image_key IS NOT NULL GROUP BY image_key
+    """, int(time.time()))
+
+
+def _request_indexes(db, backend):
+    # bounty_details lists a bounty's pending requests; the unique index lets
+    # bounty_state.add_request insert without checking for a repeat first.
+    # Keep one request per traveler and bounty, preferring the accepted one.
+    db.execute("""
+        DELETE FROM bounty_requests WHERE EXISTS (
+            SELECT 1 FROM bounty_requests o
+            WHERE o.bounty_id = bounty_requests.bounty_id AND o.traveler_id = bounty_requests.traveler_id
+              AND (CASE WHEN o.status = 'accepted' THEN 0 ELSE 1 END, o.id)
+                < (CASE WHEN bounty_requests.status = 'accepted' THEN 0 ELSE 1 END, bounty_requests.id)
+        )
+    """)
+    db.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_bounty_requests_bounty_traveler "
+               "ON bounty_requests (bounty_id, traveler_id)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_bounty_requests_bounty_status ON bounty_requests (bounty_id, status)")
+
+
+def _integer_money(db, backend):
+    # price and reward_fee have always held cents (helpers.to_cents) but were
+    # declared REAL, so SQLite stored and returned them as floats.
+    if backend == "postgresql":
+        for column in ("price", "reward_fee"):
+            db.execute(f"ALTER TABLE bounties ALTER COLUMN {column} TYPE INTEGER USING ROUND({column})::INTEGER")
+        return
+
+    # SQLite cannot change a column's type, and foreign_keys cannot be turned
+    # off inside this transaction, so renaming bounties repoints the
+    # bounty_requests foreign key at the old table: rebuild both.
+    db.execute("ALTER TABLE bounties RENAME TO bounties_old")
+    db.execute("ALTER TABLE bounty_requests RENAME TO bounty_requests_old")
+    db.execute("""
+        CREATE TABLE bounties (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            poster_id INTEGER NOT NULL REFERENCES users(id),
+            traveler_id INTEGER REFERENCES users(id),
+            item_name TEXT NOT NULL,
+            category TEXT NOT NULL,
+            price INTEGER NOT NULL,
+            reward_fee INTEGER NOT NULL,
+            description TEXT NOT NULL,
+            img_url TEXT NOT NULL DEFAULT '/static/Bountygo.png',
+            dispatch_box TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            image_key TEXT
+        )
+    """)
+    db.execute("""
+        INSERT INTO bounties (id, poster_id, traveler_id, item_name, category, price, reward_fee, description,
+                              img_url, dispatch_box, status, created_at, image_key)
+        SELECT id, poster_id, traveler_id, item_name, category,
+               CAST(ROUND(price) AS INTEGER), CAST(ROUND(reward_fee) AS INTEGER), description,
+               img_url, dispatch_box, status, created_at, image_key
+        FROM bounties_old
+    """)
+    db.execute("""
+        CREATE TABLE bounty_requests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            bounty_id INTEGER NOT NULL REFERENCES bounties(id),
+            traveler_id INTEGER NOT NULL REFERENCES users(id),
+            status TEXT DEFAULT 'pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    db.execute("INSERT INTO bounty_requests SELECT id, bounty_id, traveler_id, status, created_at FROM bounty_requests_old")
+
+    # Keep AUTOINCREMENT from handing out ids of rows deleted before the rebuild
+    for table in ("bounties", "bounty_requests"):
+        db.execute("DELETE FROM sqlite_sequence WHERE name = ?", table)
+        db.execute("UPDATE sqlite_sequence SET name = ? WHERE name = ?", table, f"{table}_old")
+
+    # Dropping the old tables drops their indexes and triggers with them
+    db.execute("DROP TABLE bounty_requests_old")
+    db.execute("DROP TABLE bounties_old")
+    _listing_indexes(db, backend)
+    _fts_triggers(db)
+    db.execute("CREATE INDEX IF NOT EXISTS idx_bounties_image_key ON bounties (image_key)")
+    db.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_bounty_requests_bounty_traveler "
+               "ON bounty_requests (bounty_id, traveler_id)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_bounty_requests_bounty_status ON bounty_requests (bounty_id, status)")
+
+
+def _owner_indexes(db, backend):
+    # profile() lists a user's bounties by poster_id and by traveler_id, newest
+    # (highest id) first; order() looks up the poster's latest bounty the same way.
+    db.execute("CREATE INDEX IF NOT EXISTS idx_bounties_poster_id ON bounties (poster_id)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_bounties_traveler_id ON bounties (traveler_id)")
+
+
+def _idempotency_keys(db, backend):
+    # One row per form submission for idempotency.idempotent; location is
+    # where the first request redirected to, NULL while it runs
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            key TEXT PRIMARY KEY,
+            user_id INTEGER,
+            location TEXT,
+            expires_at INTEGER NOT NULL
+        )
+    """)
+    db.execute("CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires_at ON idempotency_keys (expires_at)")
+
+
+def _bounty_events(db, backend):
+    # Public bounty changes for feed.py's /events stream, read by id
+    pk = "SERIAL PRIMARY KEY" if backend == "postgresql" else "INTEGER PRIMARY KEY AUTOINCREMENT"
+    db.execute(f"""
+        CREATE TABLE IF NOT EXISTS bounty_events (
+            id {pk},
+            event TEXT NOT NULL,
+            bounty_id INTEGER NOT NULL,
+            created_at INTEGER NOT NULL
+        )
+    """)
+    db.execute("CREATE INDEX IF NOT EXISTS idx_bounty_events_created_at ON bounty_events (created_at)")
+
+
+def _bounty_idempotency_key(db, backend):
+    # Form key of the order that created the bounty; unique, so a repeated
+    # submission cannot post the bounty twice (NULLs do not collide)
+    db.execute("ALTER TABLE bounties ADD COLUMN idempotency_key TEXT")
+    db.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_bounties_idempotency_key ON bounties (idempotency_key)")
+
+
+def _replica_heartbeat(db, backend):
+    # Bumped by replicas.ReplicaRouter on the primary at every check; how far
+    # a replica's copy trails it is the replica's lag
+    db.execute("INSERT INTO table_versions (name, version, updated_at) VALUES ('heartbeat', 0, ?)", int(time.time()))
+
+
+def _job_finished_at(db, backend):
+    # When a job was marked done or failed, so jobs.JobQueue can delete old
+    # ones; earlier finished jobs count from their last scheduled run
+    db.execute("ALTER TABLE jobs ADD COLUMN finished_at INTEGER")
+    db.execute("UPDATE jobs SET finished_at = run_after WHERE status IN ('done', 'failed')")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_finished_at ON jobs (status, finished_at)")
+
+
+MIGRATIONS = [
+    (1, "initial schema", _initial_schema),
+    (2, "listing indexes", _listing_indexes),
+    (3, "full-text search", _full_text_search),
+    (4, "geocode cache", _geocode_cache),
+    (5, "drop counter triggers", _drop_counter_triggers),
+    (6, "table versions", _table_versions),
+    (7, "jobs", _jobs),
+    (8, "bounty image key", _image_key),
+    (9, "image files", _image_files),
+    (10, "bounty request indexes", _request_indexes),
+    (11, "integer money columns", _integer_money),
+    (12, "owner indexes", _owner_indexes),
+    (13, "idempotency keys", _idempotency_keys),
+    (14, "bounty events", _bounty_events),
+    (15, "bounty idempotency key", _bounty_idempotency_key),
+    (16, "replica heartbeat", _replica_heartbeat),
+    (17, "job finished at", _job_finished_at),
+]
+
+
+def applied_versions(db):
+    db.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    return {row["version"] for row in db.execute("SELECT version FROM schema_migrations")}
+
+
+def migrate(db):
+    """Apply every pending migration, each inside its own transaction."""
+    done = applied_versions(db)
+    applied = []
+
+    for version, name, step in MIGRATIONS:
+        if version in done:
+            continue
+        with db.transaction():
+            step(db, db.backend)
+            db.execute("INSERT INTO schema_migrations (version, name) VALUES (?, ?)", version, name)
+        applied.append(version)
+
+    return applied
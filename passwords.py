@@ -0,0 +1,104 @@
+"""Password hashing off the request threads.
+
+``PasswordHasher`` runs werkzeug's generate/check_password_hash in a pool
+of ``PASSWORD_HASH_WORKERS`` processes (0 hashes inline, as the tests do),
+so a burst of logins uses at most that many cores per web worker and the
+request threads waiting on it hold neither CPU nor the GIL. At most
+``PASSWORD_HASH_QUEUE`` more hashes wait for a free process; beyond that
+callers get ``HasherBusy`` after ``PASSWORD_HASH_TIMEOUT`` seconds rather
+than queueing without bound.
+
+``PASSWORD_HASH_METHOD`` is a werkzeug method string such as
+``scrypt:32768:8:1`` or ``pbkdf2:sha256:600000``. ``verify`` also returns
+a new hash when the stored one was made with other parameters, for the
+caller to save. ``reject`` answers a login for a user that does not
+exist by sleeping for the typical verify time instead of hashing, so
+response times do not reveal which accounts exist.
+"""
+import concurrent.futures
+import multiprocessing
+import os
+import threading
+import time
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+PASSWORD_HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "1"))
+PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", "8"))
+PASSWORD_HASH_TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", "5"))
+
+
+class HasherBusy(Exception):
+    """Every pool slot and queue place is taken."""
+
+
+def _method(stored):
+    return stored.split("$", 1)[0]
+
+
+def _verify(stored, password, method):
+    """(matches, new hash if ``stored`` uses other parameters than ``method``)."""
+    if not check_password_hash(stored, password):
+        return False, None
+    if _method(stored) != method:
+        return True, generate_password_hash(password, method)
+    return True, None
+
+
+class PasswordHasher:
+
+    def __init__(self, method=PASSWORD_HASH_METHOD, workers=PASSWORD_HASH_WORKERS,
+                 queue=PASSWORD_HASH_QUEUE, timeout=PASSWORD_HASH_TIMEOUT):
+        # werkzeug fills in default parameters ("scrypt" -> "scrypt:32768:8:1");
+        # timing one hash also seeds the delay used by reject()
+        start = time.perf_counter()
+        self.method = _method(generate_password_hash("", method))
+        self.verify_seconds = time.perf_counter() - start
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers + queue)
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pool_pid = None
+
+    def _executor(self):
+        # Created on first use in each process, so gunicorn workers forked
+        # after import get their own
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = concurrent.futures.ProcessPoolExecutor(
+                    self.workers, mp_context=multiprocessing.get_context("spawn"))
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def _run(self, fn, *args):
+        if self.workers <= 0:
+            return fn(*args)
+        if not self._slots.acquire(timeout=self.timeout):
+            raise HasherBusy()
+        try:
+            return self._executor().submit(fn, *args).result()
+        except concurrent.futures.process.BrokenProcessPool:
+            # A pool process died; start a fresh pool on the next call
+            with self._lock:
+                self._pool = None
+            raise
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, stored, password):
+        """(matches, replacement hash or None)."""
+        start = time.perf_counter()
+        matches, new_hash = self._run(_verify, stored, password, self.method)
+        if new_hash is None:
+            self.verify_seconds += (time.perf_counter() - start - self.verify_seconds) * 0.1
+        return matches, new_hash
+
+    def reject(self):
+        """Take as long as a failed verify without hashing anything."""
+        time.sleep(self.verify_seconds)
+        return False
@@ -0,0 +1,47 @@
+"""SQL behind the busiest pages.
+
+app.py runs these statements and queryplans.py EXPLAINs the same strings,
+so ``scripts/migrate.py --explain`` reports on what the pages actually
+issue. The /bounties listing builds its SQL in ``listing.pending_query``
+and bounty_state keeps its transition statements to itself.
+"""
+from helpers import SUCCESS_RATE_SQL
+
+# index(): the four best-paid open bounties
+FEATURED_BOUNTIES = "SELECT * FROM bounties WHERE status = 'pending' ORDER BY reward_fee DESC LIMIT 4"
+
+# Success rate of each requester on the details page, computed by the database
+_REQUESTER_RATE = SUCCESS_RATE_SQL.format(completed="t.completed_orders", total="t.total_claimed")
+
+# bounty_details(viewer id, bounty id): one row per pending request (or one
+# row with NULL req_* columns), each carrying the bounty, its poster and
+# whether the viewer already asked
+BOUNTY_DETAILS = f"""
+    SELECT b.*, p.username AS poster_name,
+           EXISTS (SELECT 1 FROM bounty_requests WHERE bounty_id = b.id AND traveler_id = ?) AS has_requested,
+           r.id AS req_id, r.traveler_id AS req_traveler_id, t.username AS req_username,
+           t.completed_orders AS req_completed_orders, {_REQUESTER_RATE} AS req_rate
+    FROM bounties b
+    JOIN users p ON p.id = b.poster_id
+    LEFT JOIN bounty_requests r ON r.bounty_id = b.id AND r.status = 'pending'
+    LEFT JOIN users t ON t.id = r.traveler_id
+    WHERE b.id = ?
+    ORDER BY r.id
+"""
+
+# profile(user id): the bounties they posted, and the ones they claimed
+PROFILE_ORDERS = """
+    SELECT bounties.*, users.username AS traveler_name, users.id AS traveler_id
+    FROM bounties
+    LEFT JOIN users ON bounties.traveler_id = users.id
+    WHERE poster_id = ?
+    ORDER BY bounties.id DESC
+"""
+
+PROFILE_CLAIMS = """
+    SELECT bounties.*, users.username AS poster_name, users.id AS poster_id
+    FROM bounties
+    JOIN users ON bounties.poster_id = users.id
+    WHERE traveler_id = ?
+    ORDER BY bounties.id DESC
+"""
@@ -0,0 +1,63 @@
+"""Query plans of the statements behind the busiest pages.
+
+``HOT_QUERIES`` pairs the statements index(), bounties(), bounty_details(),
+profile() and bounty_state.claim() run (the constants in queries.py,
+``listing.pending_query`` and ``bounty_state.SETTLE_REQUESTS``) with
+representative parameters.
+``report(db)`` EXPLAINs each one and lists the tables it reads in full
+instead of through an index; scripts/migrate.py --explain prints it.
+"""
+import itertools
+import re
+
+from bounty_state import SETTLE_REQUESTS
+from listing import pending_query
+from queries import BOUNTY_DETAILS, FEATURED_BOUNTIES, PROFILE_CLAIMS, PROFILE_ORDERS
+
+# Plan lines that read a whole table: SQLite "SCAN t" without an index,
+# Postgres "Seq Scan on t"
+_SQLITE_SCAN = re.compile(r"^SCAN (\S+)(?!\S)(?! USING| VIRTUAL TABLE)")
+_POSTGRES_SCAN = re.compile(r"Seq Scan on (\S+)")
+
+
+HOT_QUERIES = {
+    "index: featured": lambda backend: (FEATURED_BOUNTIES, []),
+    "bounties: first page": lambda backend: pending_query(backend),
+    "bounties: next page": lambda backend: pending_query(backend, after=(1500, 42)),
+    "bounties: category": lambda backend: pending_query(backend, category="Food"),
+    "bounties: search": lambda backend: pending_query(backend, search_query="camera"),
+    "bounty_details": lambda backend: (BOUNTY_DETAILS, [1, 1]),
+    "profile: orders": lambda backend: (PROFILE_ORDERS, [1]),
+    "profile: claims": lambda backend: (PROFILE_CLAIMS, [1]),
+    "accept_traveler: requests": lambda backend: (SETTLE_REQUESTS, [1, 1]),
+}
+
+
+def _named(sql, params):
+    """``?`` placeholders as ``:pN`` for ``db.query``."""
+    counter = itertools.count()
+    sql = re.sub(r"\?", lambda m: f":p{next(counter)}", sql)
+    return sql, {f"p{i}": value for i, value in enumerate(params)}
+
+
+def explain(db, sql, params=()):
+    """The plan of ``sql`` as a list of lines."""
+    sql, named = _named(sql, params)
+    if db.backend == "sqlite":
+        return [row["detail"] for row in db.query("EXPLAIN QUERY PLAN " + sql, **named)]
+    return [row["QUERY PLAN"] for row in db.query("EXPLAIN " + sql, **named)]
+
+
+def full_scans(db, plan):
+    """Tables ``plan`` reads without an index."""
+    pattern = _SQLITE_SCAN if db.backend == "sqlite" else _POSTGRES_SCAN
+    return [match.group(1) for line in plan for match in [pattern.search(line.strip())] if match]
+
+
+def report(db):
+    """``{name: (plan lines, fully scanned tables)}`` for every hot query."""
+    plans = {}
+    for name, build in HOT_QUERIES.items():
+        plan = explain(db, *build(db.backend))
+        plans[name] = (plan, full_scans(db, plan))
+    return plans
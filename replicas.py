@@ -0,0 +1,147 @@
+"""Read replicas for the read-only pages.
+
+``DATABASE_REPLICA_URLS`` is a comma-separated list of database URLs that
+hold copies of ``DATABASE_URL`` (streaming replicas on Postgres; for SQLite,
+files refreshed by scripts/copy_replica.py). ``ReplicaRouter.reader``
+hands out a healthy replica round-robin, or the primary when there are
+no replicas, none is healthy, or the user wrote something in the last
+``READ_YOUR_WRITES_SECONDS``, so they always see their own changes.
+
+Every ``REPLICA_CHECK_INTERVAL`` seconds a background thread bumps the
+primary's ``heartbeat`` row in table_versions and reads the same row on
+each replica. A replica's lag is the time since the primary wrote the
+first heartbeat the replica has not got yet. The heartbeat changes at
+every check, so the lag estimate does not depend on which tables the
+app happened to write. A replica that cannot be reached, or that lags
+more than ``REPLICA_MAX_LAG`` seconds, gets no reads until a later
+check passes.
+"""
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from database import Database
+
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+REPLICA_CHECK_INTERVAL = float(os.getenv("REPLICA_CHECK_INTERVAL", "5"))
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", "30"))
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "30"))
+
+logger = logging.getLogger(__name__)
+
+
+def _heartbeat(db):
+    rows = db.execute("SELECT version FROM table_versions WHERE name = 'heartbeat'")
+    return rows[0]["version"] if rows else 0
+
+
+def _beat(db):
+    db.execute("UPDATE table_versions SET version = version + 1, updated_at = ? WHERE name = 'heartbeat'",
+               int(time.time()))
+    return _heartbeat(db)
+
+
+class Replica:
+
+    def __init__(self, url):
+        self.url = url
+        self.db = None
+        self.healthy = False
+        self.lag = None
+        self.error = "not checked yet"
+
+
+class ReplicaRouter:
+
+    def __init__(self, primary, urls=DATABASE_REPLICA_URLS, check_interval=REPLICA_CHECK_INTERVAL,
+                 max_lag=REPLICA_MAX_LAG, read_your_writes=READ_YOUR_WRITES_SECONDS, on_connect=None):
+        self.primary = primary
+        self.replicas = [Replica(url) for url in urls]
+        self.check_interval = check_interval
+        self.max_lag = max_lag
+        self.read_your_writes = read_your_writes
+        self.on_connect = on_connect  # called with each replica's Database once it is opened
+        self._samples = deque()  # (time, primary heartbeat) of recent checks
+        self._next_replica = 0
+        self._check_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._started_pid = None
+
+    def start(self):
+        """Start the checker thread (once per process, so it is fork-safe)."""
+        with self._lock:
+            if not self.replicas or self._started_pid == os.getpid():
+                return
+            self._started_pid = os.getpid()
+        threading.Thread(target=self._check_forever, name="replica-checker", daemon=True).start()
+
+    def _check_forever(self):
+        while True:
+            try:
+                self.check()
+            except Exception:
+                logger.exception("replica check failed")
+            time.sleep(self.check_interval)
+
+    def reader(self, wrote_at=None):
+        """Database to read from for a user whose last write was at ``wrote_at``."""
+        if not self.replicas or (wrote_at and time.time() - wrote_at < self.read_your_writes):
+            return self.primary
+        healthy = [r for r in self.replicas if r.healthy]
+        if not healthy:
+            return self.primary
+        self._next_replica = (self._next_replica + 1) % len(healthy)
+        return healthy[self._next_replica].db
+
+    def check(self):
+        """Bump the heartbeat and probe every replica now."""
+        with self._check_lock:
+            self._check()
+
+    def _check(self):
+        try:
+            beat = _beat(self.primary)
+            self._samples.append((time.time(), beat))
+        except Exception:
+            logger.exception("primary heartbeat failed")
+        now = time.time()
+        # Keep enough history to tell a replica within max_lag from one beyond it
+        while len(self._samples) > 1 and self._samples[1][0] < now - self.max_lag - self.check_interval:
+            self._samples.popleft()
+
+        for replica in self.replicas:
+            try:
+                if replica.db is None:
+                    replica.db = Database(replica.url)
+                    if self.on_connect:
+                        self.on_connect(replica.db)
+                beat = _heartbeat(replica.db)
+            except Exception as e:
+                if replica.healthy:
+                    logger.warning("replica %s is down: %s", replica.url, e)
+                replica.healthy, replica.lag, replica.error = False, None, str(e)
+                continue
+            replica.lag = self._lag(beat, now)
+            replica.error = None if replica.lag <= self.max_lag else f"{replica.lag:.0f}s behind"
+            if replica.healthy and replica.error:
+                logger.warning("replica %s is %s", replica.url, replica.error)
+            replica.healthy = replica.error is None
+
+    def _lag(self, beat, now):
+        # Time since the primary wrote the first heartbeat this replica lacks
+        for sampled_at, primary_beat in self._samples:
+            if primary_beat > beat:
+                return now - sampled_at
+        return 0.0
+
+    def metrics_text(self):
+        lines = ["# TYPE bountygo_db_replica_healthy gauge"]
+        for i, replica in enumerate(self.replicas):
+            lines.append(f'bountygo_db_replica_healthy{{replica="{i}"}} {int(replica.healthy)}')
+        lines.append("# TYPE bountygo_db_replica_lag_seconds gauge")
+        for i, replica in enumerate(self.replicas):
+            if replica.lag is not None:
+                lines.append(f'bountygo_db_replica_lag_seconds{{replica="{i}"}} {replica.lag:.1f}')
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+"""Reproducible load test of the main routes.
+
+Seeds a throwaway SQLite database with --users users, --bounties bounties
+and about --requests-per-bounty traveler requests on each pending one,
+starts local stubs for Nominatim and product pages (so /order's city
+lookup and product scraping never leave the machine), runs gunicorn with
+gunicorn_config.py and drives it from --concurrency virtual users for
+--duration seconds. Most of them are logged in and mix /, /bounties,
+search, /bounties/<id>, /profile and the occasional POST /order; the
+rest browse the public pages anonymously.
+
+Reports throughput, p50/p95/p99 per route and queries per request per
+endpoint (from the app's /metrics). Save a run with --output and diff two
+runs with `compare`, which exits 1 when a route got slower or issues
+more queries than the threshold allows.
+
+Usage:
+    python scripts/bench_load.py run [--duration 30] [--concurrency 20] [--output run.json]
+    python scripts/bench_load.py seed bounty.db [--users 500] [--bounties 5000]
+    python scripts/bench_load.py compare base.json new.json [--threshold 10]
+
+Runs with one worker by default so /metrics covers every request.
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import random
+import re
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from werkzeug.security import generate_password_hash
+
+from bounty_state import reconcile_counters
+from database import Database
+from migrations import migrate
+
+logging.getLogger().setLevel(logging.WARNING)  # cs50 turns on DEBUG logging for everything
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+PASSWORD = 'bench-password'
+METRICS_TOKEN = 'bench-metrics'
+CATEGORIES = ('Anime', 'Fashion', 'Food', 'other')
+CITIES = ('Hanoi, Vietnam', 'Da Nang, Vietnam', 'Tokyo, Japan', 'Osaka, Japan', 'Seoul, South Korea',
+          'Bangkok, Thailand', 'Paris, France', 'Berlin, Germany', 'New York, United States', 'Sydney, Australia')
+WORDS = ('vintage', 'limited', 'edition', 'camera', 'sneakers', 'matcha', 'figure', 'manga', 'jacket', 'watch',
+         'kitkat', 'ramen', 'lens', 'vinyl', 'console', 'perfume', 'bag', 'tea', 'snack', 'poster')
+
+# Route mix for logged-in users; anonymous ones only take the public routes
+ROUTES = {'home': 15, 'listing': 25, 'search': 15, 'details': 25, 'profile': 15, 'order': 5}
+PUBLIC_ROUTES = ('home', 'listing', 'search')
+ENDPOINTS = {'home': 'index', 'listing': 'bounties', 'search': 'bounties', 'details': 'bounty_details',
+             'profile': 'profile', 'order': 'order'}
+
+
+def seed(path, users, bounties, requests_per_bounty, rng):
+    """Create the schema in a new database at ``path`` and fill it."""
+    db = Database(f'sqlite:///{path}')
+    migrate(db)
+    password_hash = generate_password_hash(PASSWORD)
+
+    conn = sqlite3.connect(path)
+    conn.executemany('INSERT INTO users (id, username, email, password_hash) VALUES (?, ?, ?, ?)',
+                     [(i, f'user{i}', f'user{i}@bench.test', password_hash) for i in range(1, users + 1)])
+
+    now = time.time()
+    rows, pending = [], []
+    for i in range(1, bounties + 1):
+        poster = rng.randint(1, users)
+        status = rng.choices(('pending', 'claimed', 'completed'), (70, 15, 15))[0]
+        traveler = None
+        if status != 'pending':
+            traveler = rng.randint(1, users)
+            if traveler == poster:
+                status, traveler = 'pending', None
+        created = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(now - rng.randint(60, 90 * 86400)))
+        rows.append((i, poster, traveler, ' '.join(rng.sample(WORDS, 3)).title(), rng.choice(CATEGORIES),
+                     rng.randint(500, 500000), rng.randint(100, 20000), ' '.join(rng.choices(WORDS, k=20)),
+                     rng.choice(CITIES), status, created))
+        if status == 'pending':
+            pending.append((i, poster))
+    conn.executemany("""
+        INSERT INTO bounties (id, poster_id, traveler_id, item_name, category, price, reward_fee, description,
+                              dispatch_box, status, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+
+    bounty_requests = set()
+    for bounty_id, poster in pending:
+        for _ in range(rng.randint(0, 2 * requests_per_bounty)):
+            traveler = rng.randint(1, users)
+            if traveler != poster:
+                bounty_requests.add((bounty_id, traveler))
+    conn.executemany('INSERT INTO bounty_requests (bounty_id, traveler_id) VALUES (?, ?)', sorted(bounty_requests))
+    conn.commit()
+    conn.close()
+
+    reconcile_counters(db)
+    db.engine.dispose()
+    return [bounty_id for bounty_id, _ in pending]
+
+
+def start_upstream(delay):
+    """Nominatim and product page stand-ins on one local port."""
+    png = _tiny_png()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(delay)
+            url = urlsplit(self.path)
+            if url.path == '/search':
+                city = parse_qs(url.query).get('q', [''])[0].split(',')[0].strip().title() or 'Nowhere'
+                body, kind = json.dumps([{'address': {'city': city, 'country': 'Benchland'}}]).encode(), 'application/json'
+            elif url.path.startswith('/img/'):
+                body, kind = png, 'image/png'
+            else:
+                body = (f'<html><head><meta property="og:title" content="Item {url.path}">'
+                        f'<meta property="og:image" content="/img{url.path}.png"></head><body></body></html>').encode()
+                kind = 'text/html; charset=utf-8'
+            self.send_response(200)
+            self.send_header('Content-Type', kind)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _tiny_png():
+    from PIL import Image
+    out = io.BytesIO()
+    Image.new('RGB', (64, 48), (200, 40, 40)).save(out, 'PNG')
+    return out.getvalue()
+
+
+def start_app(args, port, workdir, db_path, upstream_port, **extra_env):
+    env = dict(os.environ,
+               SERVER_MODE=args.mode,
+               WEB_CONCURRENCY=str(args.workers),
+               SECRET_KEY='bench',
+               DATABASE_URL=f'sqlite:///{db_path}',
+               STORAGE_URI=f'sqlite:///{os.path.join(workdir, "state.db")}',
+               IMAGES_DIR=os.path.join(workdir, 'images'),
+               NOMINATIM_SEARCH_URL=f'http://127.0.0.1:{upstream_port}/search',
+               SSRF_ALLOWED_NETWORKS='127.0.0.1/32',
+               RATELIMIT_ENABLED='0',
+               SLOW_REQUEST_SECONDS='5',
+               METRICS_TOKEN=METRICS_TOKEN,
+               **extra_env)
+    process = subprocess.Popen(
+        ['gunicorn', '-c', 'gunicorn_config.py', '-b', f'127.0.0.1:{port}', '--log-level', 'warning'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=None if args.verbose else subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            requests.get(f'http://127.0.0.1:{port}/', timeout=1)
+            return process
+        except requests.exceptions.RequestException:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError('server did not start')
+
+
+_CSRF = re.compile(r'name="csrf_token" value="([^"]+)"')
+
+
+class VirtualUser:
+
+    def __init__(self, base, user_id, bounty_ids, upstream_port, rng):
+        self.base = base
+        self.user_id = user_id
+        self.bounty_ids = bounty_ids
+        self.upstream_port = upstream_port
+        self.rng = rng
+        self.session = requests.Session()
+        self.csrf = None
+
+    def login(self):
+        token = _CSRF.search(self.session.get(f'{self.base}/login').text).group(1)
+        response = self.session.post(f'{self.base}/login', allow_redirects=False, data={
+            'username': f'user{self.user_id}', 'email': f'user{self.user_id}@bench.test',
+            'password': PASSWORD, 'csrf_token': token})
+        if response.status_code != 302:
+            raise RuntimeError(f'login failed for user{self.user_id}: {response.status_code}')
+        self.csrf = _CSRF.search(self.session.get(f'{self.base}/order').text).group(1)
+
+    def pick(self):
+        if self.csrf is None:
+            return self.rng.choice(PUBLIC_ROUTES)
+        return self.rng.choices(list(ROUTES), list(ROUTES.values()))[0]
+
+    def request(self, route):
+        """Issue one request for ``route``; returns True on the expected status."""
+        get = self.session.get
+        if route == 'home':
+            response = get(f'{self.base}/')
+        elif route == 'listing':
+            response = get(f'{self.base}/bounties', params={'category': self.rng.choice(CATEGORIES + (None,))})
+        elif route == 'search':
+            response = get(f'{self.base}/bounties', params={'search_query': ' '.join(self.rng.sample(WORDS, 2))})
+        elif route == 'details':
+            response = get(f'{self.base}/bounties/{self.rng.choice(self.bounty_ids)}')
+        elif route == 'profile':
+            response = get(f'{self.base}/profile')
+        else:
+            n = self.rng.randint(1, 10 ** 9)
+            response = self.session.post(f'{self.base}/order', allow_redirects=False, data={
+                'item_name': f'Bench item {n}', 'category': self.rng.choice(CATEGORIES), 'price': '12.50',
+                'reward': '3', 'description': 'load test', 'location': self.rng.choice(CITIES),
+                'product_url': f'http://127.0.0.1:{self.upstream_port}/product/{n}', 'csrf_token': self.csrf,
+                'idempotency_key': f'bench-{self.user_id}-{n}'})
+            return response.status_code == 302
+        return response.status_code == 200
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else float('nan')
+
+
+_QUERIES = re.compile(r'^bountygo_http_request_queries_(sum|count)\{endpoint="([^"]+)"\} ([\d.]+)$', re.MULTILINE)
+
+
+def scrape_queries(base):
+    """{endpoint: [query sum, request count]} from /metrics."""
+    text = requests.get(f'{base}/metrics', headers={'Authorization': f'Bearer {METRICS_TOKEN}'}, timeout=10).text
+    totals = {}
+    for kind, endpoint, value in _QUERIES.findall(text):
+        totals.setdefault(endpoint, [0.0, 0])[0 if kind == 'sum' else 1] = float(value)
+    return totals
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp()
+    db_path = os.path.join(workdir, 'bounty.db')
+    print(f'Seeding {args.users} users, {args.bounties} bounties...')
+    bounty_ids = seed(db_path, args.users, args.bounties, args.requests_per_bounty, rng)
+
+    upstream = start_upstream(args.upstream_delay)
+    upstream_port = upstream.server_address[1]
+    port = args.port
+    base = f'http://127.0.0.1:{port}'
+    process = start_app(args, port, workdir, db_path, upstream_port)
+    try:
+        users = []
+        for i in range(args.concurrency):
+            user = VirtualUser(base, rng.randint(1, args.users), bounty_ids, upstream_port, random.Random(args.seed + i))
+            if i >= args.concurrency * args.anonymous:
+                user.login()
+            users.append(user)
+
+        for user in users:  # warm caches and connections
+            for route in PUBLIC_ROUTES:
+                user.request(route)
+
+        samples = {route: [] for route in ROUTES}
+        errors = {route: 0 for route in ROUTES}
+        before = scrape_queries(base)
+        deadline = time.perf_counter() + args.duration
+
+        def drive(user):
+            while time.perf_counter() < deadline:
+                route = user.pick()
+                start = time.perf_counter()
+                try:
+                    ok = user.request(route)
+                except requests.exceptions.RequestException:
+                    ok = False
+                elapsed = time.perf_counter() - start
+                if ok:
+                    samples[route].append(elapsed)
+                else:
+                    errors[route] += 1
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=drive, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        after = scrape_queries(base)
+    finally:
+        process.terminate()
+        process.wait()
+        upstream.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    routes = {}
+    for route, times in samples.items():
+        routes[route] = {
+            'requests': len(times), 'errors': errors[route], 'rps': len(times) / elapsed,
+            'p50_ms': percentile(times, .50) * 1000, 'p95_ms': percentile(times, .95) * 1000,
+            'p99_ms': percentile(times, .99) * 1000,
+        }
+    queries = {}
+    for endpoint, (total, count) in after.items():
+        old_total, old_count = before.get(endpoint, (0.0, 0))
+        if count > old_count:
+            queries[endpoint] = (total - old_total) / (count - old_count)
+
+    result = {
+        'config': {k: v for k, v in vars(args).items() if k not in ('func', 'output', 'compare', 'verbose')},
+        'elapsed': elapsed,
+        'rps': sum(r['requests'] for r in routes.values()) / elapsed,
+        'routes': routes,
+        'queries_per_request': queries,
+    }
+    report(result)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+        print(f'Saved to {args.output}')
+    if args.compare:
+        with open(args.compare) as f:
+            return diff(json.load(f), result, args.threshold)
+    return 0
+
+
+def report(result):
+    print(f'{result["rps"]:.1f} req/s over {result["elapsed"]:.1f}s')
+    print(f'{"route":<10} {"requests":>8} {"errors":>6} {"req/s":>7} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"queries":>8}')
+    for route, r in result['routes'].items():
+        queries = result['queries_per_request'].get(ENDPOINTS[route])
+        print(f'{route:<10} {r["requests"]:>8} {r["errors"]:>6} {r["rps"]:>7.1f} {r["p50_ms"]:>8.1f} '
+              f'{r["p95_ms"]:>8.1f} {r["p99_ms"]:>8.1f} {"-" if queries is None else f"{queries:.1f}":>8}')
+
+
+def diff(base, new, threshold):
+    """Print route-by-route changes; returns 1 if anything regressed."""
+    regressed = False
+    print(f'\nChange vs baseline (regression threshold {threshold:.0f}%):')
+    print(f'{"route":<10} {"req/s":>9} {"p50":>9} {"p95":>9} {"p99":>9} {"queries":>9}')
+    for route, r in new['routes'].items():
+        old = base['routes'].get(route)
+        if not old or not old['requests'] or not r['requests']:
+            continue
+        change = {k: (r[k] - old[k]) / old[k] * 100 if old[k] else 0.0
+                  for k in ('rps', 'p50_ms', 'p95_ms', 'p99_ms')}
+        q_old = base['queries_per_request'].get(ENDPOINTS[route])
+        q_new = new['queries_per_request'].get(ENDPOINTS[route])
+        q_change = '' if q_old is None or q_new is None else f'{q_new - q_old:+.1f}'
+        flags = []
+        if change['p95_ms'] > threshold:
+            flags.append('slower')
+        if change['rps'] < -threshold:
+            flags.append('less throughput')
+        if q_old is not None and q_new is not None and q_new > q_old + 0.5:
+            flags.append('more queries')
+        regressed = regressed or bool(flags)
+        print(f'{route:<10} {change["rps"]:>+8.1f}% {change["p50_ms"]:>+8.1f}% {change["p95_ms"]:>+8.1f}% '
+              f'{change["p99_ms"]:>+8.1f}% {q_change:>9}  {", ".join(flags)}')
+    print('REGRESSION' if regressed else 'No regressions.')
+    return 1 if regressed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='seed a database, start the app and load it')
+    seed_parser = commands.add_parser('seed', help='only seed a database file')
+    for p in (run_parser, seed_parser):
+        p.add_argument('--users', type=int, default=500)
+        p.add_argument('--bounties', type=int, default=5000)
+        p.add_argument('--requests-per-bounty', type=int, default=2)
+        p.add_argument('--seed', type=int, default=1)
+    seed_parser.add_argument('path')
+    run_parser.add_argument('--duration', type=float, default=30)
+    run_parser.add_argument('--concurrency', type=int, default=20)
+    run_parser.add_argument('--anonymous', type=float, default=0.25, help='share of virtual users not logged in')
+    run_parser.add_argument('--workers', type=int, default=1)
+    run_parser.add_argument('--mode', choices=('wsgi', 'asgi'), default='wsgi')
+    run_parser.add_argument('--upstream-delay', type=float, default=0.05)
+    run_parser.add_argument('--port', type=int, default=18600)
+    run_parser.add_argument('--output')
+    run_parser.add_argument('--compare', help='baseline JSON to diff this run against')
+    run_parser.add_argument('--threshold', type=float, default=10)
+    run_parser.add_argument('--verbose', action='store_true', help='show the server log')
+
+    compare_parser = commands.add_parser('compare', help='diff two saved runs')
+    compare_parser.add_argument('base')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type=float, default=10)
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        return run(args)
+    if args.command == 'seed':
+        if os.path.exists(args.path):
+            parser.error(f'{args.path} already exists')
+        pending = seed(args.path, args.users, args.bounties, args.requests_per_bounty, random.Random(args.seed))
+        print(f'Seeded {args.path}: {args.users} users, {args.bounties} bounties ({len(pending)} pending).')
+        print(f'Every user logs in with password {PASSWORD!r}.')
+        return 0
+    with open(args.base) as f, open(args.new) as g:
+        base, new = json.load(f), json.load(g)
+    report(new)
+    return diff(base, new, args.threshold)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
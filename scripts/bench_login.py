@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""Login throughput, and what it does to the rest of the site.
+
+Seeds a database like bench_load.py, then runs gunicorn twice: once
+hashing inline on the request threads (PASSWORD_HASH_WORKERS=0) and once
+with the process pool (--hash-workers). Each time, --login-clients threads
+sign in over and over while --browse-clients threads load /bounties.
+Reports sign-ins per second and browsing latency for both runs.
+
+Usage:
+    python scripts/bench_login.py [--duration 15] [--login-clients 8] [--browse-clients 8]
+"""
+import argparse
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+from bench_load import CATEGORIES, PASSWORD, percentile, seed, start_app, start_upstream
+
+_CSRF = re.compile(r'name="csrf_token" value="([^"]+)"')
+
+
+def login(base, user_id):
+    session = requests.Session()
+    token = _CSRF.search(session.get(f'{base}/login').text).group(1)
+    response = session.post(f'{base}/login', allow_redirects=False, data={
+        'username': f'user{user_id}', 'email': f'user{user_id}@bench.test',
+        'password': PASSWORD, 'csrf_token': token})
+    return response.status_code == 302
+
+
+def browse(base, session, rng):
+    response = session.get(f'{base}/bounties', params={'category': rng.choice(CATEGORIES)})
+    return response.status_code == 200
+
+
+def measure(args, label, db_path, workdir, upstream_port, hash_workers):
+    port = args.port
+    base = f'http://127.0.0.1:{port}'
+    process = start_app(args, port, workdir, db_path, upstream_port, PASSWORD_HASH_WORKERS=str(hash_workers))
+    try:
+        login(base, 1)  # start the hash pool before timing
+        logins, pages, failures = [], [], [0]
+        deadline = time.perf_counter() + args.duration
+
+        def login_loop(i):
+            rng = random.Random(i)
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                ok = login(base, rng.randint(1, args.users))
+                if ok:
+                    logins.append(time.perf_counter() - start)
+                else:
+                    failures[0] += 1
+
+        def browse_loop(i):
+            rng = random.Random(1000 + i)
+            session = requests.Session()
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                if browse(base, session, rng):
+                    pages.append(time.perf_counter() - start)
+                else:
+                    failures[0] += 1
+
+        threads = [threading.Thread(target=login_loop, args=(i,)) for i in range(args.login_clients)]
+        threads += [threading.Thread(target=browse_loop, args=(i,)) for i in range(args.browse_clients)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        process.terminate()
+        process.wait()
+
+    print(f'{label:<22} {len(logins) / elapsed:>9.1f} {percentile(logins, .95) * 1000:>10.0f} '
+          f'{len(pages) / elapsed:>9.1f} {percentile(pages, .50) * 1000:>10.0f} '
+          f'{percentile(pages, .95) * 1000:>10.0f} {failures[0]:>8}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--duration', type=float, default=15)
+    parser.add_argument('--login-clients', type=int, default=8)
+    parser.add_argument('--browse-clients', type=int, default=8)
+    parser.add_argument('--hash-workers', type=int, default=1)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--bounties', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=1, help='gunicorn workers')
+    parser.add_argument('--port', type=int, default=18601)
+    parser.add_argument('--verbose', action='store_true', help='show the server log')
+    args = parser.parse_args()
+    args.mode = 'wsgi'
+
+    workdir = tempfile.mkdtemp()
+    db_path = os.path.join(workdir, 'bounty.db')
+    seed(db_path, args.users, args.bounties, 1, random.Random(1))
+    upstream = start_upstream(0)
+    try:
+        print(f'{"hashing":<22} {"logins/s":>9} {"login p95":>10} {"pages/s":>9} {"page p50":>10} '
+              f'{"page p95":>10} {"failures":>8}')
+        measure(args, 'inline', db_path, workdir, upstream.server_address[1], 0)
+        measure(args, f'pool of {args.hash_workers}', db_path, workdir, upstream.server_address[1],
+                args.hash_workers)
+    finally:
+        upstream.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""Benchmark metadata extraction: streaming extractor vs BeautifulSoup.
+
+Usage:
+    python scripts/bench_metadata.py [PAGES_DIR] [--repeat N]
+
+PAGES_DIR holds saved product pages (*.html, e.g. "Save page as..." from a
+browser, named after the host such as ebay.com-123.html so site rules
+apply). Without it a synthetic corpus is generated. Reports CPU time and
+peak traced memory per parser, and any pages where the results differ.
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+import urllib.parse
+from pathlib import Path
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from bs4 import BeautifulSoup
+
+from metadata import extract_metadata
+
+
+def soup_metadata(html, base_url):
+    """The previous get_product_info parsing path, kept as the baseline."""
+    soup = BeautifulSoup(html, 'html.parser')
+    title_tag = (
+        soup.find("meta", property="og:title") or
+        soup.find("meta", attrs={"name": "title"}) or
+        soup.find("title")
+    )
+    desc_tag = (
+        soup.find("meta", property="og:description") or
+        soup.find("meta", attrs={"name": "description"})
+    )
+    image_tag = (
+        soup.find("meta", property="og:image") or
+        soup.find("meta", attrs={"name": "image"}) or
+        soup.find("link", rel="image_src") or
+        soup.find("img", {"id": "icImg"}) or
+        soup.find("img", {"class": "ux-image-magnifier-view__image"})
+    )
+
+    title = None
+    if title_tag:
+        raw = title_tag.get("content") or title_tag.get_text()
+        title = raw.strip() if raw else None
+    description = None
+    if desc_tag:
+        raw = desc_tag.get("content")
+        description = raw.strip() if raw else None
+    image = None
+    if image_tag:
+        raw = image_tag.get("content") or image_tag.get("href") or image_tag.get("src")
+        if raw:
+            raw = raw.strip()
+            if raw.startswith("//"):
+                raw = "https:" + raw
+            image = urllib.parse.urljoin(base_url, raw)
+    return {"title": title, "image": image, "description": description}
+
+
+def synthetic_corpus(count=20):
+    body = "".join(f'<div class="row"><a href="/p/{i}">Related item {i}</a><p>{"lorem ipsum " * 40}</p></div>'
+                   for i in range(400))
+    pages = []
+    for i in range(count):
+        head = (f'<meta property="og:title" content="Product {i}">'
+                f'<meta property="og:description" content="Description {i}">'
+                f'<meta property="og:image" content="/images/{i}.jpg">' if i % 2 == 0
+                else f'<title>Product {i}</title><meta name="description" content="Description {i}">')
+        img = '' if i % 2 == 0 else f'<img id="icImg" src="//i.ebayimg.com/{i}.jpg">'
+        host = "shop.example.com" if i % 2 == 0 else "www.ebay.com"
+        html = f'<html><head>{"<script>var x = 1;</script>" * 50}{head}</head><body>{img}{body}</body></html>'
+        pages.append((f"https://{host}/item/{i}", html))
+    return pages
+
+
+def load_corpus(directory):
+    pages = []
+    for path in sorted(Path(directory).glob("*.html")):
+        host = path.stem.split("-")[0] if "." in path.stem.split("-")[0] else "example.com"
+        pages.append((f"https://{host}/{path.name}", path.read_text(encoding="utf-8", errors="replace")))
+    return pages
+
+
+def measure(parse, pages, repeat):
+    start = time.process_time()
+    for _ in range(repeat):
+        for url, html in pages:
+            parse(html, url)
+    cpu = time.process_time() - start
+
+    peak = 0
+    for url, html in pages:
+        tracemalloc.start()
+        parse(html, url)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return cpu, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pages_dir", nargs="?")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    pages = load_corpus(args.pages_dir) if args.pages_dir else synthetic_corpus()
+    if not pages:
+        print(f"No *.html files in {args.pages_dir}")
+        return 1
+    total_kb = sum(len(html) for _, html in pages) / 1024
+    print(f"{len(pages)} pages, {total_kb:.0f} KiB, {args.repeat} passes")
+
+    results = {}
+    for name, parse in (("beautifulsoup", soup_metadata), ("streaming", extract_metadata)):
+        cpu, peak = measure(parse, pages, args.repeat)
+        results[name] = cpu
+        per_page_ms = cpu / (len(pages) * args.repeat) * 1000
+        print(f"{name:>14}: {per_page_ms:8.2f} ms/page CPU, {peak / 1024:8.0f} KiB peak")
+    print(f"speedup: {results['beautifulsoup'] / max(results['streaming'], 1e-9):.1f}x")
+
+    mismatches = [url for url, html in pages if soup_metadata(html, url) != extract_metadata(html, url)]
+    for url in mismatches:
+        print(f"differs: {url}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
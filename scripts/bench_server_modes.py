@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""Load-test comparison of the WSGI and ASGI serving modes.
+
+Starts a local upstream stub that answers product pages after
+--upstream-delay seconds, then runs gunicorn once per SERVER_MODE with the
+same worker count and fires --requests /fetch_url calls (unique URLs, so
+the fetch cache does not help) from --concurrency client threads, with a
+home page request every --page-every calls to show how the rest of the
+site fares while upstream calls are in flight.
+
+Usage:
+    python scripts/bench_server_modes.py [--requests 200] [--concurrency 50]
+
+Needs requirements-async.txt for the asgi run.
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def start_upstream(delay):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(delay)
+            body = (f'<html><head><meta property="og:title" content="Item {self.path}">'
+                    f'<meta property="og:image" content="/img.jpg"></head><body></body></html>').encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_app(mode, port, workdir, workers):
+    env = dict(os.environ,
+               SERVER_MODE=mode,
+               WEB_CONCURRENCY=str(workers),
+               SECRET_KEY="bench",
+               DATABASE_URL=f"sqlite:///{os.path.join(workdir, f'{mode}.db')}",
+               STORAGE_URI=f"sqlite:///{os.path.join(workdir, f'{mode}-state.db')}",
+               SSRF_ALLOWED_NETWORKS="127.0.0.1/32",
+               FETCH_URL_LIMIT="100000 per minute",
+               JOB_WORKERS="0")
+    process = subprocess.Popen(
+        ["gunicorn", "-c", "gunicorn_config.py", "-b", f"127.0.0.1:{port}", "--log-level", "warning"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            requests.get(f"http://127.0.0.1:{port}/", timeout=1)
+            return process
+        except requests.exceptions.RequestException:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{mode} server did not start")
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else float("nan")
+
+
+def run(mode, args, upstream_port, workdir, port):
+    process = start_app(mode, port, workdir, args.workers)
+    base = f"http://127.0.0.1:{port}"
+    fetch_times, page_times, errors = [], [], []
+
+    def one(i):
+        session = requests.Session()
+        path = "/" if args.page_every and i % args.page_every == 0 else (
+            f"/fetch_url?url=http://127.0.0.1:{upstream_port}/item/{mode}/{i}")
+        start = time.perf_counter()
+        try:
+            response = session.get(base + path, timeout=60)
+            response.raise_for_status()
+            if path != "/" and not response.json().get("title"):
+                raise ValueError("empty preview")
+        except Exception as e:
+            errors.append(e)
+            return
+        (page_times if path == "/" else fetch_times).append(time.perf_counter() - start)
+
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            list(pool.map(one, range(args.requests)))
+        elapsed = time.perf_counter() - start
+    finally:
+        process.terminate()
+        process.wait()
+
+    done = len(fetch_times) + len(page_times)
+    print(f"{mode:>5}: {done / elapsed:7.1f} req/s, {len(errors)} errors | "
+          f"/fetch_url p50 {percentile(fetch_times, .5) * 1000:6.0f} ms, p95 {percentile(fetch_times, .95) * 1000:6.0f} ms | "
+          f"/ p50 {percentile(page_times, .5) * 1000:6.0f} ms, p95 {percentile(page_times, .95) * 1000:6.0f} ms")
+    return done / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--upstream-delay", type=float, default=0.5)
+    parser.add_argument("--page-every", type=int, default=10)
+    parser.add_argument("--modes", default="wsgi,asgi")
+    args = parser.parse_args()
+
+    upstream = start_upstream(args.upstream_delay)
+    workdir = tempfile.mkdtemp()
+    print(f"{args.requests} requests, {args.concurrency} concurrent, {args.workers} worker(s), "
+          f"upstream delay {args.upstream_delay * 1000:.0f} ms")
+    try:
+        results = {mode: run(mode, args, upstream.server_address[1], workdir, 18500 + i)
+                   for i, mode in enumerate(args.modes.split(","))}
+    finally:
+        upstream.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+    if len(results) == 2:
+        (a, ra), (b, rb) = results.items()
+        print(f"{b} / {a} throughput: {rb / ra:.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
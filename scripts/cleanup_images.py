@@ -1,48 +1,87 @@
 #!/usr/bin/env python3
 """Cleanup script for static/images.
 
-Deletes files older than a given number of days and enforces a total size limit.
+Works from the image_files index rather than the directory: unreferenced
+images older than the grace period are deleted first, then the least
+recently served ones until the store is under the size limit. Bounties
+whose image is evicted go back to linking the original URL.
 Run manually or schedule via cron/Task Scheduler.
+
+Usage: python scripts/cleanup_images.py [--dry-run] [--scan]
+
+--scan walks the directory once to index files the table does not know
+about (e.g. stored before the index existed) and fill in missing sizes.
 """
 import os
+import sys
 import time
-from pathlib import Path
 
-IMAGES_DIR = Path(os.path.join(os.getcwd(), 'static', 'images'))
-MAX_AGE_DAYS = int(os.environ.get('CLEANUP_MAX_AGE_DAYS', '30'))
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from database import Database
+from images import IMAGES_DIR, ImageStore, evict, image_hash, plan_eviction
+from migrations import migrate
+
+DATABASE_URL = os.environ.get('DATABASE_URL', 'sqlite:///bounty.db')
 MAX_TOTAL_BYTES = int(os.environ.get('CLEANUP_MAX_TOTAL_BYTES', str(200 * 1024 * 1024)))  # 200 MB
+GRACE_HOURS = float(os.environ.get('CLEANUP_GRACE_HOURS', '24'))
 
 
-def cleanup():
-    if not IMAGES_DIR.exists():
+def scan(db, store):
+    indexed = {row['hash']: row['size'] for row in db.execute('SELECT hash, size FROM image_files')}
+    added = resized = 0
+    with os.scandir(store.root) as entries:
+        for entry in entries:
+            if not entry.is_file() or entry.name.startswith('.') or entry.name.endswith('-thumb.jpg'):
+                continue
+            digest = image_hash(entry.name)
+            try:
+                size = store.size(entry.name)
+            except FileNotFoundError:  # thumbnail missing
+                size = entry.stat().st_size
+            if digest not in indexed:
+                refs = db.execute('SELECT COUNT(*) AS n FROM bounties WHERE image_key = ?', entry.name)[0]['n']
+                db.execute('INSERT INTO image_files (hash, name, size, refs, last_access) VALUES (?, ?, ?, ?, ?)',
+                           digest, entry.name, size, refs, int(entry.stat().st_mtime))
+                added += 1
+            elif indexed[digest] != size:
+                db.execute('UPDATE image_files SET size = ? WHERE hash = ?', size, digest)
+                resized += 1
+    print(f'Scan: {added} file(s) indexed, {resized} size(s) corrected.')
+
+
+def cleanup(dry_run=False, rescan=False):
+    if not os.path.isdir(IMAGES_DIR):
         print('No images directory found, nothing to do.')
         return
 
-    now = time.time()
-    files = [p for p in IMAGES_DIR.iterdir() if p.is_file()]
-
-    # Delete old files
-    cutoff = now - (MAX_AGE_DAYS * 86400)
-    for f in files:
-        try:
-            if f.stat().st_mtime < cutoff:
-                print(f'Removing old file: {f.name}')
-                f.unlink()
-        except Exception as e:
-            print(f'Error removing {f}: {e}')
-
-    # Recalculate and enforce total size
-    files = sorted([p for p in IMAGES_DIR.iterdir() if p.is_file()], key=lambda p: p.stat().st_mtime)
-    total = sum(p.stat().st_size for p in files)
-    while total > MAX_TOTAL_BYTES and files:
-        oldest = files.pop(0)
-        try:
-            print(f'Removing to reduce size: {oldest.name}')
-            total -= oldest.stat().st_size
-            oldest.unlink()
-        except Exception as e:
-            print(f'Error removing {oldest}: {e}')
+    db = Database(DATABASE_URL)
+    migrate(db)
+    store = ImageStore(IMAGES_DIR)
+    if rescan:
+        scan(db, store)
+
+    plan, total = plan_eviction(db, MAX_TOTAL_BYTES, int(GRACE_HOURS * 3600))
+    freed = 0
+    for row, reason in plan:
+        print(f'{"Would remove" if dry_run else "Removing"} {row["name"]} '
+              f'({row["size"]} bytes, {row["refs"]} bounty reference(s), '
+              f'last served {time.strftime("%Y-%m-%d", time.localtime(row["last_access"]))}): {reason}')
+        if not dry_run:
+            try:
+                if not evict(db, store, row):
+                    print(f'Kept {row["name"]}: in use again')
+                    continue
+            except Exception as e:
+                print(f'Error removing {row["name"]}: {e}')
+                continue
+        freed += row['size']
+
+    verb = 'would be freed' if dry_run else 'freed'
+    print(f'{len(plan)} image(s), {freed} bytes {verb}; store is {"" if total <= MAX_TOTAL_BYTES else "still "}'
+          f'{total} of {MAX_TOTAL_BYTES} bytes.')
 
 
 if __name__ == '__main__':
-    cleanup()
+    args = sys.argv[1:]
+    cleanup(dry_run='--dry-run' in args, rescan='--scan' in args)
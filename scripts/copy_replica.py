@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""Keep SQLite replica files in step with the primary, to try
+DATABASE_REPLICA_URLS locally.
+
+Every --interval seconds, copies the DATABASE_URL file over each replica
+file with SQLite's online backup API. That gives a consistent snapshot
+even while the app is writing. Replicas therefore lag the primary by up
+to --interval seconds. Run the app with
+DATABASE_REPLICA_URLS=sqlite:///replica.db[,sqlite:///replica2.db].
+
+Usage: python scripts/copy_replica.py replica.db [replica2.db ...] [--interval 5] [--once]
+"""
+import argparse
+import os
+import sqlite3
+import time
+
+DATABASE_URL = os.environ.get('DATABASE_URL', 'sqlite:///bounty.db')
+
+
+def copy(primary_path, replica_path):
+    source = sqlite3.connect(primary_path)
+    target = sqlite3.connect(replica_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('replicas', nargs='+')
+    parser.add_argument('--interval', type=float, default=5)
+    parser.add_argument('--once', action='store_true')
+    args = parser.parse_args()
+
+    if not DATABASE_URL.startswith('sqlite:///'):
+        parser.error('DATABASE_URL must be a sqlite:/// URL')
+    primary_path = DATABASE_URL[len('sqlite:///'):]
+
+    while True:
+        started = time.time()
+        for replica in args.replicas:
+            try:
+                copy(primary_path, replica)
+            except sqlite3.Error as e:
+                print(f'Copy to {replica} failed: {e}')
+        print(f'{time.strftime("%H:%M:%S")} copied to {len(args.replicas)} replica(s) in {time.time() - started:.2f}s')
+        if args.once:
+            return
+        time.sleep(max(0.0, args.interval - (time.time() - started)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""Apply pending schema migrations and check the hot queries' plans.
+
+The app migrates on startup; run this to upgrade ahead of a deploy or to
+see where a database stands.
+
+Usage: python scripts/migrate.py [--status] [--explain]
+
+--status   list every migration and whether it has been applied, without applying any
+--explain  print the plan of each query in queryplans.HOT_QUERIES and exit 1
+           if one of them reads a whole table
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from database import Database
+from migrations import MIGRATIONS, applied_versions, migrate
+from queryplans import report
+
+DATABASE_URL = os.environ.get('DATABASE_URL', 'sqlite:///bounty.db')
+
+
+def status(db):
+    done = applied_versions(db)
+    for version, name, _ in MIGRATIONS:
+        print(f'{version:>4}  {"applied" if version in done else "pending":<8} {name}')
+    pending = len([v for v, _, _ in MIGRATIONS if v not in done])
+    print(f'{pending} pending migration(s).')
+
+
+def explain(db):
+    unindexed = 0
+    for name, (plan, scans) in report(db).items():
+        print(f'{name}{"  <- full scan of " + ", ".join(scans) if scans else ""}')
+        for line in plan:
+            print(f'    {line}')
+        unindexed += bool(scans)
+    print(f'{unindexed} quer{"y" if unindexed == 1 else "ies"} not index-backed.')
+    return unindexed
+
+
+def main():
+    args = sys.argv[1:]
+    db = Database(DATABASE_URL)
+    if '--status' in args:
+        status(db)
+        return 0
+
+    applied = migrate(db)
+    names = {version: name for version, name, _ in MIGRATIONS}
+    for version in applied:
+        print(f'Applied {version}: {names[version]}')
+    print(f'{len(applied)} migration(s) applied.' if applied else 'Schema is up to date.')
+
+    if '--explain' in args:
+        return 1 if explain(db) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""Recompute users.total_posted/completed_posted/total_claimed/completed_orders.
+
+The counters are maintained incrementally by bounty_state; run this after
+migrations, manual data fixes or restores to repair any drift.
+
+Usage: python scripts/reconcile_counters.py [--dry-run]
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from bounty_state import reconcile_counters
+from database import Database
+from migrations import migrate
+
+DATABASE_URL = os.environ.get('DATABASE_URL', 'sqlite:///bounty.db')
+COUNTERS = ('total_posted', 'completed_posted', 'total_claimed', 'completed_orders')
+
+
+def main():
+    dry_run = '--dry-run' in sys.argv[1:]
+    db = Database(DATABASE_URL)
+    migrate(db)
+
+    drifted = reconcile_counters(db, dry_run=dry_run)
+    for row in drifted:
+        changes = ', '.join(f'{c} {row[c]} -> {row["expected_" + c]}'
+                            for c in COUNTERS if (row[c] or 0) != row['expected_' + c])
+        print(f'{row["username"]} (#{row["id"]}): {changes}')
+
+    verb = 'would be fixed' if dry_run else 'fixed'
+    print(f'{len(drifted)} user(s) {verb}.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""Pre-warm the geocode cache from existing bounties.
+
+Resolves every distinct bounties.dispatch_box value that is not already
+cached, pausing between upstream calls to respect Nominatim's usage policy.
+Run manually after a deploy or schedule via cron/Task Scheduler.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from database import Database
+from geocache import GeocodeCache, normalize_location
+from helpers import geocode_city
+from migrations import migrate
+
+DATABASE_URL = os.environ.get('DATABASE_URL', 'sqlite:///bounty.db')
+DELAY_SECONDS = float(os.environ.get('GEOCODE_WARM_DELAY', '1.0'))
+
+
+def warm():
+    db = Database(DATABASE_URL)
+    migrate(db)
+    cache = GeocodeCache(geocode_city, lambda: db)
+
+    rows = db.execute("""
+        SELECT DISTINCT dispatch_box FROM bounties
+        WHERE dispatch_box IS NOT NULL AND dispatch_box != ''
+    """)
+    keys = sorted({normalize_location(r['dispatch_box']) for r in rows} - {''})
+    cached = {r['query_key'] for r in db.execute(
+        "SELECT query_key FROM geocode_cache WHERE expires_at > ?", int(time.time()))}
+
+    pending = [k for k in keys if k not in cached]
+    print(f'{len(keys)} locations, {len(keys) - len(pending)} already cached, {len(pending)} to resolve.')
+
+    for i, key in enumerate(pending):
+        if i:
+            time.sleep(DELAY_SECONDS)
+        try:
+            full_name = cache.lookup(key)
+            print(f'{key} -> {full_name or "(not found)"}')
+        except Exception as e:
+            print(f'Error resolving {key}: {e}')
+
+
+if __name__ == '__main__':
+    warm()
@@ -0,0 +1,48 @@
+"""Full-text search over bounties.
+
+SQLite uses the ``bounties_fts`` FTS5 table and Postgres the generated
+``search_vector`` column (both created in migrations.py and kept in sync by
+the database itself). ``ranked_search`` returns the SQL pieces the listing
+query splices in; ``rank`` sorts ascending, best match first.
+"""
+import re
+from collections import namedtuple
+
+SearchClause = namedtuple("SearchClause", "source source_params condition condition_params rank")
+
+# Column weights: item_name, description, category
+_FTS_WEIGHTS = "10.0, 1.0, 5.0"
+
+
+def _terms(text):
+    return re.findall(r"\w+", (text or "").lower())[:8]
+
+
+def ranked_search(backend, text):
+    """Build the FROM/WHERE/rank pieces for a search, or None for an empty query.
+
+    Every term is prefix-matched and all terms must match, so "iph 15"
+    finds "iPhone 15 Pro".
+    """
+    terms = _terms(text)
+    if not terms:
+        return None
+
+    if backend == "postgresql":
+        tsquery = " & ".join(f"{t}:*" for t in terms)
+        return SearchClause(
+            source="bounties b CROSS JOIN to_tsquery('simple', ?) AS q",
+            source_params=[tsquery],
+            condition="b.search_vector @@ q",
+            condition_params=[],
+            rank="(-ts_rank(b.search_vector, q))::float8",
+        )
+
+    match = " ".join(f'"{t}"*' for t in terms)
+    return SearchClause(
+        source="bounties_fts JOIN bounties b ON b.id = bounties_fts.rowid",
+        source_params=[],
+        condition="bounties_fts MATCH ?",
+        condition_params=[match],
+        rank=f"bm25(bounties_fts, {_FTS_WEIGHTS})",
+    )
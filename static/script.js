@@ -7,6 +7,8 @@ document.addEventListener("DOMContentLoaded", function() {
     initDeleteConfirmation();
     initDoneConfirmation();
     loadOrderForm();
+    initCityCheck();
+    initLiveFeed();
 });
 
 function initImagePreview() {
@@ -165,6 +167,11 @@ function loadOrderForm() {
         orderForm.addEventListener('submit', function(event) {
             if (orderButton.disabled || event.defaultPrevented) return;
 
+            // Lets the server look up an image for the item when none was filled in
+            const urlInput = document.getElementById('url_input');
+            const productUrlInput = document.getElementById('product_url_input');
+            if (urlInput && productUrlInput) productUrlInput.value = urlInput.value.trim();
+
             orderButton.disabled = true;
             orderButton.innerHTML = `<span class="spinner-border spinner-border-sm"></span> Loading...`;
 
@@ -173,4 +180,79 @@ function loadOrderForm() {
             }, 0);
         });
     }
-}
\ No newline at end of file
+}
+
+
+function initCityCheck() {
+    // Checks the city as soon as it is typed; the server-side result is cached,
+    // so the form submission does not have to wait on the lookup again
+    document.querySelectorAll('input[name="location"]').forEach(input => {
+        const hint = input.parentElement.querySelector('.form-text');
+        if (!hint) return;
+        const defaultHint = hint.innerHTML;
+
+        input.addEventListener('change', async () => {
+            const location = input.value.trim();
+            if (!location) {
+                hint.innerHTML = defaultHint;
+                return;
+            }
+            try {
+                const response = await fetch(`/validate_city?location=${encodeURIComponent(location)}`);
+                if (!response.ok) return;
+                const data = await response.json();
+                hint.textContent = data.valid ? `\u2713 ${data.full_name}` : "We could not find this city.";
+                hint.classList.toggle("text-success", data.valid);
+                hint.classList.toggle("text-danger", !data.valid);
+            } catch (error) {
+                console.error(error);
+            }
+        });
+    });
+}
+
+
+function initLiveFeed() {
+    // Applies bounty changes from /events to the listing and detail pages
+    // in place, instead of the user reloading them to find out
+    const page = document.querySelector('[data-live-feed]');
+    const notice = document.getElementById('live-feed-notice');
+    if (!page || !notice || !window.EventSource) return;
+
+    const detailMessages = {
+        updated: "The poster just edited this bounty.",
+        requested: "A traveler just asked to carry this bounty.",
+        claimed: "This bounty was just claimed.",
+        completed: "This bounty was just completed.",
+        deleted: "This bounty was just removed.",
+    };
+    let posted = 0;
+
+    const show = (text) => {
+        notice.querySelector('span').textContent = text;
+        notice.classList.remove('d-none');
+    };
+
+    new EventSource('/events').addEventListener('bounty', (message) => {
+        const change = JSON.parse(message.data);
+
+        if (page.dataset.liveFeed === 'list') {
+            if (change.event === 'created' || change.event === 'published') {
+                posted += 1;
+                show(`${posted} new ${posted === 1 ? 'bounty' : 'bounties'} posted.`);
+            } else if (['claimed', 'completed', 'deleted'].includes(change.event)) {
+                const card = page.querySelector(`[data-bounty-id="${change.bounty_id}"]`);
+                if (!card) return;
+                card.remove();
+                const count = document.getElementById('bounty-count');
+                if (count) count.textContent = `${page.querySelectorAll('[data-bounty-id]').length} items on this page`;
+            }
+        } else if (String(change.bounty_id) === page.dataset.bountyId && detailMessages[change.event]) {
+            show(detailMessages[change.event]);
+            if (['claimed', 'completed', 'deleted'].includes(change.event)) {
+                page.querySelectorAll('form[action="/request_bounty"] button, form[action="/accept_traveler"] button')
+                    .forEach(button => { button.disabled = true; });
+            }
+        }
+    });
+}
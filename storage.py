@@ -0,0 +1,235 @@
+"""Shared storage for rate-limit counters and server-side sessions.
+
+``memory://`` limiter counters and a local FileSystemCache session directory
+tied the app to one gunicorn worker, and session files never expired.
+``STORAGE_URI`` now selects one backend for both:
+
+* ``sqlite:///path/state.db`` (default) - a WAL SQLite file shared by every
+  worker on the host. Expired rows are deleted by a background sweeper
+  every ``STORAGE_SWEEP_INTERVAL`` seconds.
+* ``redis://host:port/db`` - shared across hosts, Redis expires keys itself.
+  Any Redis-protocol server works (Valkey, KeyDB, a local stand-in in
+  development). Needs the ``redis`` package.
+* ``memory://`` - per process, for tests and single-worker development.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+import urllib.parse
+
+from cachelib import BaseCache, SimpleCache
+from cachelib.serializers import BaseSerializer
+from limits.storage import Storage
+
+STORAGE_URI = os.getenv("STORAGE_URI", "sqlite:///shared_state.db")
+STORAGE_SWEEP_INTERVAL = int(os.getenv("STORAGE_SWEEP_INTERVAL", "300"))
+STORAGE_BUSY_TIMEOUT_MS = int(os.getenv("STORAGE_BUSY_TIMEOUT_MS", "5000"))
+
+LIMIT_PREFIX = "limit:"
+SESSION_PREFIX = "session:"
+
+
+class SharedStore:
+    """Key/value table with per-key expiry in a SQLite file.
+
+    Safe to share between threads and processes: every thread (re)opens its
+    own connection after a fork, and writers serialize on SQLite's lock.
+    """
+
+    def __init__(self, path, sweep_interval=STORAGE_SWEEP_INTERVAL):
+        self.path = path
+        self.sweep_interval = sweep_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._sweeper_pid = None
+        self._connect().executescript("""
+            CREATE TABLE IF NOT EXISTS shared_kv (
+                key TEXT PRIMARY KEY,
+                value BLOB,
+                expires_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_shared_kv_expires_at ON shared_kv (expires_at);
+        """)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=STORAGE_BUSY_TIMEOUT_MS / 1000, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+            self._start_sweeper()
+        return conn
+
+    def _start_sweeper(self):
+        # Threads do not survive fork, so each worker process starts its own
+        with self._lock:
+            if self.sweep_interval <= 0 or self._sweeper_pid == os.getpid():
+                return
+            self._sweeper_pid = os.getpid()
+        threading.Thread(target=self._sweep_forever, name="storage-sweeper", daemon=True).start()
+
+    def _sweep_forever(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except sqlite3.Error:
+                logging.getLogger(__name__).exception("storage sweep failed")
+
+    def get(self, key):
+        row = self._connect().execute(
+            "SELECT value FROM shared_kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time())).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value, ttl=None):
+        self._connect().execute("INSERT OR REPLACE INTO shared_kv (key, value, expires_at) VALUES (?, ?, ?)",
+                                (key, value, time.time() + ttl if ttl else None))
+
+    def add(self, key, value, ttl=None):
+        """Set ``key`` only if it is missing or expired; returns whether it was set."""
+        now = time.time()
+        cursor = self._connect().execute("""
+            INSERT INTO shared_kv (key, value, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at
+            WHERE shared_kv.expires_at <= ?
+        """, (key, value, now + ttl if ttl else None, now))
+        return cursor.rowcount == 1
+
+    def incr(self, key, amount, ttl):
+        """Add ``amount`` to a counter; an expired counter restarts with a fresh ``ttl``."""
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("""
+                INSERT INTO shared_kv (key, value, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET
+                    value = CASE WHEN shared_kv.expires_at <= ? THEN excluded.value
+                                 ELSE shared_kv.value + excluded.value END,
+                    expires_at = CASE WHEN shared_kv.expires_at <= ? THEN excluded.expires_at
+                                      ELSE shared_kv.expires_at END
+            """, (key, amount, now + ttl, now, now))
+            value = conn.execute("SELECT value FROM shared_kv WHERE key = ?", (key,)).fetchone()[0]
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return value
+
+    def expires_at(self, key):
+        row = self._connect().execute("SELECT expires_at FROM shared_kv WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def delete(self, key):
+        return self._connect().execute("DELETE FROM shared_kv WHERE key = ?", (key,)).rowcount == 1
+
+    def clear(self, prefix=""):
+        return self._connect().execute("DELETE FROM shared_kv WHERE substr(key, 1, ?) = ?",
+                                       (len(prefix), prefix)).rowcount
+
+    def sweep(self):
+        """Delete expired rows; returns how many were removed."""
+        return self._connect().execute("DELETE FROM shared_kv WHERE expires_at <= ?", (time.time(),)).rowcount
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def open_store(uri):
+    """One SharedStore per file, shared by the limiter and the session cache."""
+    path = urllib.parse.urlparse(uri).path
+    path = path[1:] if path.startswith("/") else path
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = SharedStore(path)
+        return _stores[path]
+
+
+class SQLiteLimitStorage(Storage):
+    """Flask-Limiter backend for ``sqlite://`` URIs (fixed-window strategy)."""
+
+    STORAGE_SCHEME = ["sqlite"]
+
+    def __init__(self, uri, wrap_exceptions=False, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self.store = open_store(uri)
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def incr(self, key, expiry, amount=1):
+        return self.store.incr(LIMIT_PREFIX + key, amount, expiry)
+
+    def get(self, key):
+        return self.store.get(LIMIT_PREFIX + key) or 0
+
+    def get_expiry(self, key):
+        return self.store.expires_at(LIMIT_PREFIX + key) or time.time()
+
+    def check(self):
+        try:
+            self.store.get(LIMIT_PREFIX)
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        return self.store.clear(LIMIT_PREFIX)
+
+    def clear(self, key):
+        self.store.delete(LIMIT_PREFIX + key)
+
+
+class SharedSessionCache(BaseCache):
+    """cachelib backend over SharedStore for CacheLibSessionInterface."""
+
+    serializer = BaseSerializer()
+
+    def __init__(self, store, default_timeout=300):
+        super().__init__(default_timeout)
+        self.store = store
+
+    def _ttl(self, timeout):
+        return self._normalize_timeout(timeout) or None
+
+    def get(self, key):
+        value = self.store.get(SESSION_PREFIX + key)
+        return None if value is None else self.serializer.loads(value)
+
+    def set(self, key, value, timeout=None):
+        self.store.set(SESSION_PREFIX + key, self.serializer.dumps(value), self._ttl(timeout))
+        return True
+
+    def add(self, key, value, timeout=None):
+        return self.store.add(SESSION_PREFIX + key, self.serializer.dumps(value), self._ttl(timeout))
+
+    def delete(self, key):
+        return self.store.delete(SESSION_PREFIX + key)
+
+    def has(self, key):
+        return self.store.get(SESSION_PREFIX + key) is not None
+
+    def clear(self):
+        self.store.clear(SESSION_PREFIX)
+        return True
+
+
+def session_cache(uri=STORAGE_URI):
+    """cachelib client for server-side sessions on the configured backend."""
+    scheme = urllib.parse.urlparse(uri).scheme
+    if scheme == "sqlite":
+        return SharedSessionCache(open_store(uri))
+    if scheme in ("redis", "rediss", "valkey", "valkeys"):
+        import redis
+        from cachelib import RedisCache
+        return RedisCache(host=redis.from_url(uri.replace("valkey", "redis", 1)), key_prefix=SESSION_PREFIX)
+    if scheme == "memory":
+        return SimpleCache()
+    raise ValueError(f"Unsupported STORAGE_URI scheme: {scheme}")
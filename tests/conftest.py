@@ -0,0 +1,52 @@
+import os
+import tempfile
+
+# Point the app at throwaway SQLite files before `app` is imported;
+# migrations create the schema on the first request.
+_tmp = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(_tmp, "bounty.db"))
+os.environ.setdefault("STORAGE_URI", "sqlite:///" + os.path.join(_tmp, "shared_state.db"))
+os.environ.setdefault("JOB_WORKERS", "0")  # tests drain the queue with run_pending()
+os.environ.setdefault("IMAGES_DIR", os.path.join(_tmp, "images"))
+os.environ.setdefault("PASSWORD_HASH_WORKERS", "0")  # hash inline; test_passwords covers the pool
+
+import itertools  # noqa: E402
+
+import pytest  # noqa: E402
+
+_user_numbers = itertools.count()
+
+
+@pytest.fixture
+def client():
+    """Test client with CSRF checks off and fresh rate limits; its first
+    request runs init_db and migrations."""
+    from app import app, limiter
+
+    app.config['TESTING'] = True
+    app.config['WTF_CSRF_ENABLED'] = False
+    limiter.reset()
+    with app.test_client() as client:
+        client.get('/')
+        yield client
+
+
+@pytest.fixture
+def login(client):
+    """``login(user_id)`` signs the client in as that user."""
+    def login(user_id):
+        with client.session_transaction() as sess:
+            sess['user_id'] = user_id
+    return login
+
+
+@pytest.fixture
+def logged_in(client, login):
+    """The client signed in as a new user, whose id is ``client.user_id``."""
+    import app as app_module
+
+    n = next(_user_numbers)
+    client.user_id = app_module.db.execute("INSERT INTO users (username, email, password_hash) VALUES (?, ?, 'h')",
+                                           f"user{n}", f"user{n}@example.com")
+    login(client.user_id)
+    return client
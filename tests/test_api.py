@@ -0,0 +1,53 @@
+import pytest
+
+import app as app_module
+
+
+@pytest.fixture
+def seeded(client):
+    db = app_module.db
+    db.execute("DELETE FROM bounty_requests")
+    db.execute("DELETE FROM bounties")
+    db.execute("DELETE FROM users")
+    poster = db.execute("INSERT INTO users (username, email, password_hash, total_posted, completed_posted) "
+                        "VALUES ('poster', 'p@example.com', 'x', 4, 1)")
+    other = db.execute("INSERT INTO users (username, email, password_hash) VALUES ('other', 'o@example.com', 'x')")
+    ids = [db.execute("INSERT INTO bounties (poster_id, item_name, category, price, reward_fee, description, dispatch_box) "
+                      "VALUES (?, ?, 'misc', ?, 100, 'desc', 'Hanoi, Vietnam')", poster, f"item-{i}", 1000 * i)
+           for i in range(5)]
+    db.execute("UPDATE bounties SET status = 'validating' WHERE id = ?", ids[0])
+    return client, poster, other, ids
+
+
+def test_listing_pages_with_selected_fields(seeded):
+    client, poster, _, ids = seeded
+    names, url = [], '/api/v1/bounties?limit=2&fields=item_name,price,poster_name'
+    while url:
+        body = client.get(url).get_json()
+        assert all(set(item) == {"item_name", "price", "poster_name"} for item in body["data"])
+        assert all(item["poster_name"] == "poster" for item in body["data"])
+        names.extend(item["item_name"] for item in body["data"])
+        url = body["links"].get("next")
+    assert names == ["item-4", "item-3", "item-2", "item-1"]  # validating item-0 is not listed
+
+    resp = client.get('/api/v1/bounties?fields=item_name,password_hash')
+    assert resp.status_code == 400 and "password_hash" in resp.get_json()["error"]
+
+
+def test_batches_return_requested_records_in_order_in_one_call(seeded, login):
+    client, poster, other, ids = seeded
+    assert client.get(f'/api/v1/bounties/{ids[1]}').status_code == 401
+
+    login(other)
+    body = client.get(f'/api/v1/bounties?ids={ids[3]},{ids[0]},999999,{ids[1]}&fields=id,status').get_json()
+    assert body["data"] == [{"id": ids[3], "status": "pending"}, {"id": ids[1], "status": "pending"}]
+    assert client.get(f'/api/v1/bounties/{ids[0]}').status_code == 404
+
+    login(poster)
+    assert client.get(f'/api/v1/bounties/{ids[0]}?fields=status').get_json() == {"data": {"status": "validating"}}
+
+    body = client.get(f'/api/v1/users?ids={other},{poster}&fields=username,shopper_rate').get_json()
+    assert body["data"] == [{"username": "other", "shopper_rate": 100.0}, {"username": "poster", "shopper_rate": 25.0}]
+    user = client.get(f'/api/v1/users/{poster}').get_json()["data"]
+    assert "email" not in user and "password_hash" not in user
+    assert client.get('/api/v1/users?ids=' + ",".join(map(str, range(101)))).status_code == 400
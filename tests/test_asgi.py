@@ -0,0 +1,111 @@
+import asyncio
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+pytest.importorskip("asgiref")
+
+import asgi  # noqa: E402
+import asyncfetch  # noqa: E402
+import feed  # noqa: E402
+import security  # noqa: E402
+
+
+@pytest.fixture
+def upstream():
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = b'<html><head><meta property="og:title" content="Async kettle"></head></html>'
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def serve(*paths):
+    """Run the ASGI app through startup, the GET requests and shutdown."""
+    async def run():
+        events = asyncio.Queue()
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        lifespan = asyncio.create_task(asgi.app({"type": "lifespan"}, events.get, send))
+        await events.put({"type": "lifespan.startup"})
+        while not sent:
+            await asyncio.sleep(0.01)
+        try:
+            transport = httpx.ASGITransport(app=asgi.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as client:
+                return [await client.get(path) for path in paths]
+        finally:
+            await events.put({"type": "lifespan.shutdown"})
+            await lifespan
+
+    return asyncio.run(run())
+
+
+def test_fetch_url_runs_natively_and_blocks_private_addresses(upstream, monkeypatch):
+    blocked, = serve(f"/fetch_url?url={upstream}/blocked")
+    assert not blocked.json()["title"]
+
+    monkeypatch.setattr(security, "is_disallowed_ip", lambda ip: False)
+    preview, page = serve(f"/fetch_url?url={upstream}/kettle", "/")
+    assert preview.json()["title"] == "Async kettle"
+    assert preview.headers["cache-control"].startswith("private, max-age=")
+    assert page.status_code == 200 and "<html" in page.text.lower()
+
+
+def test_validate_city_uses_the_shared_geocode_cache(monkeypatch):
+    lookups = []
+
+    async def fake_geocode(client, location):
+        lookups.append(location)
+        return "Da Nang, Vietnam" if location == "da nang" else None
+
+    monkeypatch.setattr(asyncfetch, "ageocode_city", fake_geocode)
+    found, again, missing = serve("/validate_city?location=Da%20Nang", "/validate_city?location=da nang",
+                                  "/validate_city?location=atlantis-nowhere")
+    assert found.json() == {"valid": True, "full_name": "Da Nang, Vietnam"}
+    assert again.json() == found.json()
+    assert missing.json() == {"valid": False, "full_name": None}
+    assert lookups == ["da nang", "atlantis-nowhere"]
+
+
+def test_event_stream_replays_a_backlog_longer_than_one_batch(client, monkeypatch):
+    db = asgi.flask_module.db
+    after, count = feed.latest_id(db), feed.FEED_BATCH + 10
+    db.execute("INSERT INTO bounty_events (event, bounty_id, created_at) "
+               "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?) "
+               "SELECT 'updated', i, ? FROM n", count, int(time.time()))
+    monkeypatch.setattr(asgi, "_broadcaster", feed.Broadcaster(lambda: db, poll_interval=0.01))
+
+    async def run():
+        sent = []
+
+        async def send(message):
+            sent.append(message.get("body", b"").decode())
+
+        stream = asyncio.ensure_future(asgi._stream(send, after))
+        deadline = time.time() + 5
+        while "".join(sent).count("event: bounty") < count and time.time() < deadline:
+            await asyncio.sleep(0.01)
+        stream.cancel()
+        await asyncio.gather(stream, return_exceptions=True)
+        return "".join(sent)
+
+    ids = [int(line[4:]) for line in asyncio.run(run()).splitlines() if line.startswith("id: ")]
+    assert ids == list(range(after + 1, after + count + 1))
@@ -0,0 +1,96 @@
+import pytest
+
+import app as app_module
+
+
+@pytest.fixture
+def seeded(client):
+    db = app_module.db
+    db.execute("DELETE FROM bounty_requests")
+    db.execute("DELETE FROM bounties")
+    db.execute("DELETE FROM users")
+    user_id = db.execute("INSERT INTO users (username, email, password_hash) VALUES ('poster', 'p@example.com', 'x')")
+    for i in range(7):
+        db.execute(
+            "INSERT INTO bounties (poster_id, item_name, category, price, reward_fee, description, dispatch_box) "
+            "VALUES (?, ?, 'misc', ?, 100, 'desc', 'Hanoi, Vietnam')",
+            user_id, f"item-{i}", 1000 * (i % 3),
+        )
+    return client
+
+
+def test_bounties_keyset_pages_cover_every_row_once(seeded):
+    seen = []
+    url = '/bounties?limit=3'
+    while url:
+        resp = seeded.get(url)
+        assert resp.status_code == 200
+        html = resp.get_data(as_text=True)
+        seen.extend(line.split('>')[1].split('<')[0] for line in html.splitlines() if 'card-title' in line)
+        marker = 'href="/bounties?after='
+        url = None
+        if marker in html:
+            url = html[html.index(marker) + 6:].split('"')[0].replace('&amp;', '&')
+
+    assert sorted(seen) == sorted(f"item-{i}" for i in range(7))
+    assert len(seen) == len(set(seen))
+
+
+def test_bounties_search_uses_full_text_index(seeded):
+    db = app_module.db
+    poster = db.execute("SELECT id FROM users LIMIT 1")[0]["id"]
+    db.execute(
+        "INSERT INTO bounties (poster_id, item_name, category, price, reward_fee, description, dispatch_box) "
+        "VALUES (?, 'Vintage Leica camera', 'photo', 5000, 100, 'rangefinder', 'Tokyo, Japan')",
+        poster,
+    )
+
+    html = seeded.post('/bounties', data={'search_query': 'leic'}).get_data(as_text=True)
+    assert 'Vintage Leica camera' in html
+    assert 'item-0' not in html
+
+    db.execute("UPDATE bounties SET item_name = 'Nikon F3' WHERE item_name = 'Vintage Leica camera'")
+    resp = seeded.post('/bounties', data={'search_query': 'leic'})
+    assert resp.status_code == 302
+
+
+def test_public_pages_revalidate_until_bounties_change(seeded, login):
+    first = seeded.get('/')
+    assert first.status_code == 200 and first.headers['ETag']
+    assert 'public' in first.headers['Cache-Control']
+
+    again = seeded.get('/', headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+
+    poster = app_module.db.execute("SELECT id FROM users")[0]['id']
+    app_module.bounty_state.create(app_module.db, poster, 'new item', 'misc', 1, 10000, 'd', None, 'Hanoi, Vietnam')
+    changed = seeded.get('/', headers={'If-None-Match': first.headers['ETag']})
+    assert changed.status_code == 200 and 'new item' in changed.get_data(as_text=True)
+
+    login(poster)
+    private = seeded.get('/', headers={'If-None-Match': changed.headers['ETag']})
+    assert private.status_code == 200 and 'no-store' in private.headers['Cache-Control']
+
+
+def test_details_lists_requesters_in_one_query_and_requests_are_unique(seeded, login):
+    db = app_module.db
+    poster = db.execute("SELECT id FROM users")[0]['id']
+    bounty_id = db.execute("SELECT id FROM bounties LIMIT 1")[0]['id']
+    traveler = db.execute("INSERT INTO users (username, email, password_hash, total_claimed, completed_orders) "
+                          "VALUES ('traveler', 't@example.com', 'x', 3, 2)")
+
+    login(poster)
+    form = {'bounty_id': bounty_id, 'idempotency_key': 'own'}
+    assert seeded.post('/request_bounty', data=form).status_code == 400  # own bounty
+
+    login(traveler)
+    assert seeded.post('/request_bounty', data=dict(form, idempotency_key='first')).status_code == 302
+    assert seeded.post('/request_bounty', data=dict(form, idempotency_key='second')).status_code == 400
+    assert db.execute("SELECT COUNT(*) AS n FROM bounty_requests")[0]['n'] == 1
+
+    html = seeded.get(f'/bounties/{bounty_id}').get_data(as_text=True)
+    assert '@poster' in html
+
+    login(poster)
+    html = seeded.get(f'/bounties/{bounty_id}').get_data(as_text=True)
+    assert '@traveler' in html and '66.7% Success' in html
@@ -0,0 +1,102 @@
+import threading
+
+import pytest
+
+import bounty_state
+from database import Database
+from migrations import migrate
+
+
+@pytest.fixture(params=[True, False], ids=["returning", "no-returning"])
+def db(request, tmp_path):
+    database = Database(f"sqlite:///{tmp_path / 'test.db'}")
+    migrate(database)
+    database.supports_returning = request.param
+    return database
+
+
+def _seed(db):
+    poster = db.execute("INSERT INTO users (username, email, password_hash) VALUES ('poster', 'p@x', 'h')")
+    t1 = db.execute("INSERT INTO users (username, email, password_hash) VALUES ('t1', 't1@x', 'h')")
+    t2 = db.execute("INSERT INTO users (username, email, password_hash) VALUES ('t2', 't2@x', 'h')")
+    bounty = db.execute(
+        "INSERT INTO bounties (poster_id, item_name, category, price, reward_fee, description, dispatch_box) "
+        "VALUES (?, 'item', 'misc', 100, 10, 'desc', 'Hanoi, Vietnam')", poster)
+    r1 = db.execute("INSERT INTO bounty_requests (bounty_id, traveler_id) VALUES (?, ?)", bounty, t1)
+    r2 = db.execute("INSERT INTO bounty_requests (bounty_id, traveler_id) VALUES (?, ?)", bounty, t2)
+    return poster, bounty, (t1, r1), (t2, r2)
+
+
+def test_claim_complete(db):
+    poster, bounty, (t1, r1), (t2, r2) = _seed(db)
+
+    assert bounty_state.claim(db, r1, t2) is None
+    assert bounty_state.claim(db, r1, poster) == bounty
+    assert bounty_state.claim(db, r2, poster) is None
+
+    row = db.execute("SELECT status, traveler_id FROM bounties WHERE id = ?", bounty)[0]
+    assert row == {"status": "claimed", "traveler_id": t1}
+    statuses = {r["id"]: r["status"] for r in db.execute("SELECT id, status FROM bounty_requests")}
+    assert statuses == {r1: "accepted", r2: "rejected"}
+
+    assert bounty_state.delete(db, bounty, poster) is None
+    assert bounty_state.complete(db, bounty, t1) is None
+    assert bounty_state.complete(db, bounty, poster) == bounty
+    assert db.execute("SELECT status FROM bounties WHERE id = ?", bounty)[0]["status"] == "completed"
+    assert db.execute("SELECT COUNT(*) AS n FROM bounty_requests")[0]["n"] == 0
+
+
+def test_delete_removes_requests_only_when_allowed(db):
+    poster, bounty, (t1, r1), _ = _seed(db)
+
+    assert bounty_state.delete(db, bounty, t1) is None
+    assert db.execute("SELECT COUNT(*) AS n FROM bounty_requests")[0]["n"] == 2
+
+    assert bounty_state.delete(db, bounty, poster) == bounty
+    assert db.execute("SELECT COUNT(*) AS n FROM bounties")[0]["n"] == 0
+
+
+def test_concurrent_claims_accept_exactly_one(db):
+    poster, bounty, (_, r1), (_, r2) = _seed(db)
+    results = []
+    threads = [threading.Thread(target=lambda r=r: results.append(bounty_state.claim(db, r, poster)))
+               for r in (r1, r2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sorted(results, key=str) == sorted([bounty, None], key=str)
+    accepted = db.execute("SELECT COUNT(*) AS n FROM bounty_requests WHERE status = 'accepted'")[0]["n"]
+    assert accepted == 1
+
+
+def _counters(db, user_id):
+    return db.execute("SELECT total_posted, completed_posted, total_claimed, completed_orders FROM users WHERE id = ?",
+                      user_id)[0]
+
+
+def test_counters_follow_the_lifecycle_and_reconcile(db):
+    poster = db.execute("INSERT INTO users (username, email, password_hash) VALUES ('poster', 'p@x', 'h')")
+    traveler = db.execute("INSERT INTO users (username, email, password_hash) VALUES ('t', 't@x', 'h')")
+    kept = bounty_state.create(db, poster, "a", "misc", 100, 10, "d", None, "Hanoi, Vietnam")
+    dropped = bounty_state.create(db, poster, "b", "misc", 100, 10, "d", None, "Hanoi, Vietnam")
+    assert _counters(db, poster)["total_posted"] == 2
+
+    bounty_state.delete(db, dropped, poster)
+    request_id = db.execute("INSERT INTO bounty_requests (bounty_id, traveler_id) VALUES (?, ?)", kept, traveler)
+    bounty_state.claim(db, request_id, poster)
+    bounty_state.complete(db, kept, poster)
+
+    assert _counters(db, poster) == {"total_posted": 1, "completed_posted": 1, "total_claimed": 0, "completed_orders": 0}
+    assert _counters(db, traveler) == {"total_posted": 0, "completed_posted": 0, "total_claimed": 1, "completed_orders": 1}
+    assert bounty_state.reconcile_counters(db) == []
+
+    db.execute("UPDATE users SET total_posted = 7, completed_orders = 3")
+    drifted = bounty_state.reconcile_counters(db, dry_run=True)
+    assert {r["id"] for r in drifted} == {poster, traveler}
+    assert _counters(db, poster)["total_posted"] == 7
+
+    bounty_state.reconcile_counters(db)
+    assert _counters(db, poster)["total_posted"] == 1
+    assert _counters(db, traveler)["completed_orders"] == 1
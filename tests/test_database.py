@@ -0,0 +1,86 @@
+import threading
+
+import pytest
+import sqlalchemy
+
+from database import Database
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = Database(f"sqlite:///{tmp_path / 'test.db'}")
+    database.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, v TEXT)")
+    return database
+
+
+def test_sqlite_pragmas_applied_on_connect(db):
+    with db.engine.connect() as conn:
+        pragma = lambda name: conn.execute(sqlalchemy.text(f"PRAGMA {name}")).scalar()
+        assert pragma("journal_mode") == "wal"
+        assert pragma("busy_timeout") == 5000
+        assert pragma("synchronous") == 1
+
+
+def test_transaction_rolls_back_and_nests(db):
+    with pytest.raises(ValueError):
+        with db.transaction():
+            db.execute("INSERT INTO t (v) VALUES ('a')")
+            with db.transaction():
+                db.execute("INSERT INTO t (v) VALUES ('b')")
+            raise ValueError()
+    assert db.execute("SELECT COUNT(*) AS n FROM t")[0]["n"] == 0
+
+    with db.transaction():
+        db.execute("INSERT INTO t (v) VALUES ('c')")
+    assert db.execute("SELECT v FROM t") == [{"v": "c"}]
+
+
+def test_each_transaction_begins_its_own(db):
+    with db.transaction():
+        db.execute("INSERT INTO t (v) VALUES ('a')")
+
+    # A second block on the same thread must open its own transaction
+    with pytest.raises(ValueError):
+        with db.transaction():
+            db.execute("INSERT INTO t (v) VALUES ('b')")
+            raise ValueError()
+    assert db.execute("SELECT v FROM t") == [{"v": "a"}]
+
+
+def test_after_commit_hooks_run_only_on_commit(db):
+    calls = []
+    with db.transaction():
+        db.after_commit(lambda: calls.append("a"))
+        assert calls == []
+    assert calls == ["a"]
+
+    with pytest.raises(ValueError):
+        with db.transaction():
+            db.after_commit(lambda: calls.append("b"))
+            raise ValueError()
+    assert calls == ["a"]
+
+
+def test_transaction_recovers_after_failed_statement(db):
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            db.execute("INSERT INTO missing_table (v) VALUES ('x')")
+    db.execute("INSERT INTO t (v) VALUES ('ok')")
+    assert db.execute("SELECT v FROM t") == [{"v": "ok"}]
+
+
+def test_open_transaction_does_not_leak_to_other_threads(db):
+    with db.transaction():
+        db.execute("INSERT INTO t (v) VALUES ('pending')")
+        seen = []
+        reader = threading.Thread(target=lambda: seen.append(db.execute("SELECT COUNT(*) AS n FROM t")[0]["n"]))
+        reader.start()
+        reader.join()
+    assert seen == [0]
+
+
+def test_pool_metrics(db):
+    db.execute("SELECT 1")
+    stats = db.pool_stats()
+    assert stats["checkouts"] >= 1 and stats["checkouts"] == stats["checkins"]
+    assert "bountygo_db_pool_checkouts_total" in db.metrics_text()
@@ -0,0 +1,58 @@
+import pytest
+
+import bounty_state
+from database import Database
+from facets import FacetCache
+from migrations import migrate
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = Database(f"sqlite:///{tmp_path / 'test.db'}")
+    migrate(database)
+    return database
+
+
+@pytest.fixture
+def facets(db, monkeypatch):
+    monkeypatch.setattr(bounty_state, "_listeners", [])
+    cache = FacetCache(lambda: db, ttl=3600)
+    bounty_state.on_change(cache.handle)
+    return cache
+
+
+def _counts(facets, field):
+    return {row[field]: row["count"] for row in facets.get()[field]}
+
+
+def test_facets_follow_bounty_events(db, facets):
+    poster = db.execute("INSERT INTO users (username, email, password_hash) VALUES ('poster', 'p@x', 'h')")
+    traveler = db.execute("INSERT INTO users (username, email, password_hash) VALUES ('t', 't@x', 'h')")
+    assert facets.get() == {"category": [], "dispatch_box": []}
+
+    a = bounty_state.create(db, poster, "a", "books", 100, 10, "d", None, "Hanoi, Vietnam")
+    b = bounty_state.create(db, poster, "b", "books", 100, 10, "d", None, "Tokyo, Japan")
+    assert _counts(facets, "category") == {"books": 2}
+    assert _counts(facets, "dispatch_box") == {"Hanoi, Vietnam": 1, "Tokyo, Japan": 1}
+
+    request_id = db.execute("INSERT INTO bounty_requests (bounty_id, traveler_id) VALUES (?, ?)", a, traveler)
+    bounty_state.claim(db, request_id, poster)
+    assert _counts(facets, "category") == {"books": 1}
+    assert _counts(facets, "dispatch_box") == {"Tokyo, Japan": 1}
+
+    bounty_state.update(db, b, poster, "b", 100, 10, "d", "Osaka, Japan")
+    assert _counts(facets, "dispatch_box") == {"Osaka, Japan": 1}
+
+    bounty_state.delete(db, b, poster)
+    assert facets.get() == {"category": [], "dispatch_box": []}
+
+
+def test_facets_are_served_from_memory(db, facets):
+    facets.get()
+    # A write that bypasses bounty_state is only picked up after the TTL
+    db.execute("INSERT INTO users (username, email, password_hash) VALUES ('poster', 'p@x', 'h')")
+    db.execute("INSERT INTO bounties (poster_id, item_name, category, price, reward_fee, description, dispatch_box) "
+               "VALUES (1, 'i', 'misc', 1, 1, 'd', 'Hanoi, Vietnam')")
+    assert facets.get()["category"] == []
+    facets.invalidate()
+    assert facets.get()["category"] == [{"category": "misc", "count": 1}]
@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+import app as app_module
+import bounty_state
+import feed
+from database import Database
+from migrations import migrate
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    database = Database(f"sqlite:///{tmp_path / 'test.db'}")
+    migrate(database)
+    monkeypatch.setattr(bounty_state, "_recorders", [feed.EventLog(lambda: database).record])
+    return database
+
+
+def _users(db, *names):
+    return [db.execute("INSERT INTO users (username, email, password_hash) VALUES (?, ?, 'h')", name, f"{name}@x")
+            for name in names]
+
+
+def _post(db, poster, status="pending"):
+    return bounty_state.create(db, poster, "item", "misc", 100, 10, "desc", None, "Hanoi", status=status)
+
+
+def test_public_transitions_are_logged_in_order(db):
+    poster, traveler = _users(db, "poster", "traveler")
+    bounty = _post(db, poster, status="validating")
+    rejected = _post(db, poster, status="validating")
+    bounty_state.reject(db, rejected)
+    assert feed.since(db, 0) == []
+
+    bounty_state.publish(db, bounty, "Hanoi, Vietnam")
+    request_id = bounty_state.add_request(db, bounty, traveler)
+    assert bounty_state.add_request(db, bounty, traveler) is None
+    bounty_state.claim(db, request_id, poster)
+    bounty_state.complete(db, bounty, poster)
+
+    rows = feed.since(db, 0)
+    assert [(row["event"], row["bounty_id"]) for row in rows] == [
+        ("published", bounty), ("requested", bounty), ("claimed", bounty), ("completed", bounty)]
+    assert feed.replay(db, rows[1]["id"]).count("event: bounty") == 2
+    assert feed.replay(db, None).endswith(f"id: {rows[-1]['id']}\n\n")
+
+
+def test_events_roll_back_with_their_transition(db):
+    poster, = _users(db, "poster")
+    bounty = _post(db, poster)
+    after = feed.latest_id(db)
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            bounty_state.delete(db, bounty, poster)
+            raise RuntimeError("boom")
+    assert feed.since(db, after) == []
+    assert db.execute("SELECT id FROM bounties WHERE id = ?", bounty) == [{"id": bounty}]
+
+
+def test_broadcaster_fans_out_and_drops_slow_readers(db):
+    poster, = _users(db, "poster")
+
+    async def run():
+        broadcaster = feed.Broadcaster(lambda: db, poll_interval=0.01, queue_size=1)
+        fast, slow = broadcaster.subscribe(0), broadcaster.subscribe(0)
+        first = await asyncio.to_thread(_post, db, poster)
+        assert (await asyncio.wait_for(fast.get(), 2))["bounty_id"] == first
+
+        second = await asyncio.to_thread(_post, db, poster)
+        assert (await asyncio.wait_for(fast.get(), 2))["bounty_id"] == second
+        # The slow reader never took the first row, so it is told to reconnect
+        assert slow.get_nowait() is None
+
+        broadcaster.unsubscribe(fast)
+        await asyncio.wait_for(broadcaster._task, 2)
+
+    asyncio.run(run())
+
+
+def test_events_view_replays_since_last_event_id(client):
+    start = client.get("/events")
+    assert start.mimetype == "text/event-stream"
+    assert start.headers["Cache-Control"].startswith("no-cache")
+    last_id = int(start.get_data(as_text=True).split("id: ")[1])
+
+    resp = client.get("/events", headers={"Last-Event-ID": str(last_id)})
+    assert resp.get_data(as_text=True) == f"retry: {feed.FEED_RETRY_MS}\n\n"
+
+    # Polled every FEED_RETRY_MS, so it is not rate limited
+    assert all(client.get("/events").status_code == 200 for _ in range(40))
+
+
+def test_events_view_polls_a_replica(client, monkeypatch):
+    readers = []
+    monkeypatch.setattr(app_module.replica_router, "reader",
+                        lambda wrote_at=None: readers.append(wrote_at) or app_module.db)
+    assert client.get("/events").status_code == 200
+    assert readers == [None]
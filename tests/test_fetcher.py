@@ -0,0 +1,65 @@
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+import security
+from fetcher import ProductFetcher, normalize_url
+
+PAGE = (b'<html><head><title>Fallback</title>'
+        b'<meta property="og:title" content=" Camera ">'
+        b'<meta property="og:image" content="/img/cam.jpg">'
+        b'</head><body>' + b'x' * 200000 + b'</body></html>')
+
+
+class _Handler(BaseHTTPRequestHandler):
+    hits = []
+
+    def do_GET(self):
+        self.hits.append(self.headers.get("If-None-Match"))
+        if self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(PAGE)))
+        self.send_header("ETag", '"v1"')
+        self.end_headers()
+        self.wfile.write(PAGE)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = HTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    _Handler.hits = []
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+
+
+def test_normalize_url_drops_fragment_and_tracking():
+    assert normalize_url("HTTPS://Shop.example.com:443/p?utm_source=x&id=2#top") == "https://shop.example.com/p?id=2"
+
+
+def test_private_addresses_are_blocked(server):
+    assert ProductFetcher().fetch(server + "/item") == {"title": None, "image": None, "description": None}
+    assert _Handler.hits == []
+
+
+def test_fetch_caches_and_revalidates(server, monkeypatch):
+    monkeypatch.setattr(security, "is_disallowed_ip", lambda ip: False)
+    fetcher = ProductFetcher(ttl=60)
+
+    data = fetcher.fetch(server + "/item?utm_campaign=a")
+    assert data == {"title": "Camera", "image": server + "/img/cam.jpg", "description": None}
+    assert fetcher.fetch(server + "/item") == data
+    assert _Handler.hits == [None]
+
+    fetcher.ttl = 0
+    fetcher._cache[normalize_url(server + "/item")]["expires_at"] = 0
+    assert fetcher.fetch(server + "/item") == data
+    assert _Handler.hits == [None, '"v1"']
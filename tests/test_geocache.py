@@ -0,0 +1,58 @@
+import threading
+import time
+
+import requests
+
+from geocache import GeocodeCache, normalize_location
+
+
+def test_normalize_location():
+    assert normalize_location("  Hanoi ,VN ") == normalize_location("hanoi, vn") == "hanoi, vn"
+
+
+def test_hits_and_misses_are_cached_but_errors_are_not():
+    calls = []
+
+    def resolver(key):
+        calls.append(key)
+        if key == "down":
+            raise requests.exceptions.ConnectionError()
+        return None if key == "atlantis" else "Hanoi, Vietnam"
+
+    cache = GeocodeCache(resolver)
+    assert cache.validate("Hanoi") == (True, "Hanoi, Vietnam")
+    assert cache.validate(" HANOI ") == (True, "Hanoi, Vietnam")
+    assert cache.validate("Atlantis") == (False, None)
+    assert cache.validate("atlantis") == (False, None)
+    assert cache.validate("down") == (False, None)
+    assert cache.validate("down") == (False, None)
+    assert calls == ["hanoi", "atlantis", "down", "down"]
+
+
+def test_concurrent_misses_share_one_upstream_call():
+    calls = []
+
+    def resolver(key):
+        calls.append(key)
+        time.sleep(0.05)
+        return "Tokyo, Japan"
+
+    cache = GeocodeCache(resolver)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.validate("tokyo"))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert calls == ["tokyo"]
+    assert results == [(True, "Tokyo, Japan")] * 8
+
+
+def test_cache_table_errors_fall_back_to_a_live_lookup(tmp_path):
+    from database import Database
+
+    # No migrations, so every geocode_cache statement fails
+    db = Database(f"sqlite:///{tmp_path / 'test.db'}")
+    cache = GeocodeCache(lambda key: "Hanoi, Vietnam", lambda: db)
+    assert cache.validate("Hanoi") == (True, "Hanoi, Vietnam")
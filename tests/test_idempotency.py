@@ -0,0 +1,70 @@
+import time
+
+import pytest
+
+import app as app_module
+
+
+@pytest.fixture(autouse=True)
+def fresh_keys(client):
+    app_module.db.execute("DELETE FROM idempotency_keys")
+
+
+ORDER = {'item_name': 'Kit Kat', 'category': 'Food', 'price': '5', 'reward': '2', 'description': 'matcha',
+         'location': 'Tokyo', 'idempotency_key': 'order-key-1'}
+
+
+def test_repeated_order_runs_once_and_redirects_to_the_same_bounty(logged_in, login):
+    db, client = app_module.db, logged_in
+    first = client.post('/order', data=ORDER)
+    second = client.post('/order', data=ORDER)
+    assert first.status_code == second.status_code == 302
+    assert first.location == second.location
+    assert db.execute("SELECT COUNT(*) AS n FROM bounties WHERE poster_id = ?", client.user_id)[0]["n"] == 1
+
+    # Another user cannot replay someone else's key
+    login(db.execute("INSERT INTO users (username, email, password_hash) VALUES ('idem2', 'i2@x', 'h')"))
+    assert client.post('/order', data=ORDER).status_code == 409
+
+
+def test_failed_request_stores_no_key(logged_in):
+    db, client = app_module.db, logged_in
+    form = dict(ORDER, idempotency_key='order-key-2')
+    assert client.post('/order', data=dict(form, price='')).status_code == 400
+    assert not db.execute("SELECT key FROM idempotency_keys WHERE key = 'order-key-2'")
+    assert client.post('/order', data=form).status_code == 302
+    assert db.execute("SELECT location FROM idempotency_keys WHERE key = 'order-key-2'")[0]["location"]
+
+
+def test_key_in_use_or_expired(logged_in):
+    db, client = app_module.db, logged_in
+    # Still running in another request: location is not set yet
+    db.execute("INSERT INTO idempotency_keys (key, user_id, expires_at) VALUES ('order-key-4', ?, ?)",
+               client.user_id, int(time.time()) + 60)
+    assert client.post('/order', data=dict(ORDER, idempotency_key='order-key-4')).status_code == 409
+
+    db.execute("UPDATE idempotency_keys SET location = '/old', expires_at = 0 WHERE key = 'order-key-4'")
+    resp = client.post('/order', data=dict(ORDER, idempotency_key='order-key-4'))
+    assert resp.status_code == 302 and resp.location != '/old'
+
+
+def test_posts_without_a_key_are_rejected(logged_in):
+    form = {k: v for k, v in ORDER.items() if k != 'idempotency_key'}
+    assert logged_in.post('/order', data=form).status_code == 400
+    assert not app_module.db.execute("SELECT id FROM bounties WHERE poster_id = ?", logged_in.user_id)
+
+
+def test_concurrent_orders_with_one_key_create_one_bounty(logged_in):
+    db = app_module.db
+    args = (db, logged_in.user_id, 'Pocky', 'Food', 500, 200, 'd', None, 'Tokyo')
+    first = app_module.bounty_state.create(*args, idempotency_key='order-key-3')
+    assert first and app_module.bounty_state.create(*args, idempotency_key='order-key-3') is None
+    assert db.execute("SELECT COUNT(*) AS n FROM bounties WHERE idempotency_key = 'order-key-3'")[0]["n"] == 1
+
+
+def test_register_rejects_duplicates_with_one_insert(logged_in):
+    taken = app_module.db.execute("SELECT username FROM users WHERE id = ?", logged_in.user_id)[0]["username"]
+    form = {'username': taken, 'email': 'other@x', 'password': 'pw', 'confirmation': 'pw', 'idempotency_key': 'r1'}
+    assert logged_in.post('/register', data=form).status_code == 400
+    form = dict(form, username='idem3', email='i3@x', idempotency_key='r2')
+    assert logged_in.post('/register', data=form).status_code == 302
@@ -0,0 +1,130 @@
+import io
+import os
+
+import pytest
+from PIL import Image
+
+import app as app_module
+import bounty_state
+import images
+from database import Database
+from images import ImageError, ImageStore, evict, link, plan_eviction, thumbnail_name
+from migrations import migrate
+
+
+def png(size=(800, 200), color=(200, 30, 30, 128)):
+    out = io.BytesIO()
+    Image.new("RGBA", size, color).save(out, "PNG")
+    return out.getvalue()
+
+
+def test_images_are_stored_once_by_content_with_a_thumbnail(tmp_path):
+    store = ImageStore(root=str(tmp_path), thumbnail_size=(40, 30))
+    data = png()
+    key = store.save(data)
+    assert key.endswith(".png") and len(key) == 64 + 4
+    assert store.save(data) == key
+    assert sorted(os.listdir(tmp_path)) == sorted([key, thumbnail_name(key)])
+    assert (tmp_path / key).read_bytes() == data
+    with Image.open(tmp_path / thumbnail_name(key)) as thumb:
+        assert thumb.format == "JPEG" and thumb.size == (40, 30)
+
+    with pytest.raises(ImageError):
+        store.save(b"<html>not an image</html>")
+
+
+def test_published_bounty_image_is_served_locally_with_immutable_caching(logged_in, monkeypatch):
+    client, user_id, db = logged_in, logged_in.user_id, app_module.db
+
+    monkeypatch.setattr(app_module.geocoder, "lookup", lambda key: "Hue, Vietnam")
+    downloads = []
+    monkeypatch.setattr(app_module.image_store, "download", lambda url: downloads.append(url) or png())
+    client.post('/order', data={"item_name": "lamp", "category": "misc", "price": "10", "reward": "3",
+                                "description": "d", "img_url": "https://img.example/lamp.png", "location": "hue",
+                                "idempotency_key": "lamp"})
+    app_module.job_queue.run_pending()
+
+    bounty = db.execute("SELECT * FROM bounties WHERE poster_id = ?", user_id)[0]
+    assert downloads == ["https://img.example/lamp.png"]
+    assert bounty["status"] == "pending" and bounty["image_key"]
+
+    thumb_path = f"/images/{thumbnail_name(bounty['image_key'])}"
+    assert thumb_path in client.get('/bounties').get_data(as_text=True)
+    resp = client.get(thumb_path)
+    assert resp.status_code == 200 and resp.mimetype == "image/jpeg"
+    assert resp.headers["Cache-Control"] == "public, max-age=31536000, immutable"
+    resp.close()
+    assert client.get('/images/missing.png').status_code == 404
+
+
+def test_cleanup_evicts_unreferenced_then_least_recently_served(tmp_path):
+    db = Database(f"sqlite:///{tmp_path / 'test.db'}")
+    migrate(db)
+    store = ImageStore(root=str(tmp_path / "images"), thumbnail_size=(4, 3))
+    poster = db.execute("INSERT INTO users (username, email, password_hash) VALUES ('p', 'p@x', 'h')")
+
+    keys = {}
+    for name, color in (("old", (1, 1, 1, 255)), ("recent", (2, 2, 2, 255)), ("orphan", (3, 3, 3, 255))):
+        bounty_id = bounty_state.create(db, poster, name, "misc", 100, 10, "", f"https://img.example/{name}", "Hue")
+        keys[name] = store.save(png(color=color))
+        assert bounty_state.set_image(db, bounty_id, f"https://img.example/{name}", keys[name], store.size(keys[name]))
+        if name == "orphan":
+            bounty_state.delete(db, bounty_id, poster)
+    db.execute("UPDATE image_files SET last_access = 100 WHERE name IN (?, ?)", keys["old"], keys["orphan"])
+    size = store.size(keys["old"])
+
+    plan, total = plan_eviction(db, max_total_bytes=size * 3, grace_seconds=60)
+    assert [(row["name"], reason) for row, reason in plan] == [(keys["orphan"], "unreferenced")]
+
+    plan, total = plan_eviction(db, max_total_bytes=size, grace_seconds=60)
+    assert [(row["name"], reason) for row, reason in plan] == [
+        (keys["orphan"], "unreferenced"), (keys["old"], "least recently used")]
+    assert total == size
+
+    for row, _ in plan:
+        evict(db, store, row)
+    assert sorted(os.listdir(store.root)) == sorted([keys["recent"], thumbnail_name(keys["recent"])])
+    assert db.execute("SELECT image_key FROM bounties WHERE item_name = 'old'")[0]["image_key"] is None
+    assert [row["name"] for row in db.execute("SELECT name FROM image_files")] == [keys["recent"]]
+
+
+def test_evict_keeps_an_image_relinked_after_planning(tmp_path):
+    db = Database(f"sqlite:///{tmp_path / 'test.db'}")
+    migrate(db)
+    store = ImageStore(root=str(tmp_path / "images"), thumbnail_size=(4, 3))
+    poster = db.execute("INSERT INTO users (username, email, password_hash) VALUES ('p', 'p@x', 'h')")
+    first = bounty_state.create(db, poster, "a", "misc", 100, 10, "", "https://img.example/a", "Hue")
+    key = store.save(png())
+    assert link(db, store, first, "https://img.example/a", key)
+    bounty_state.delete(db, first, poster)
+
+    (row, _), = plan_eviction(db, max_total_bytes=0, grace_seconds=-1)[0]
+    second = bounty_state.create(db, poster, "b", "misc", 100, 10, "", "https://img.example/b", "Hue")
+    assert link(db, store, second, "https://img.example/b", store.save(png()))
+    assert evict(db, store, row) is False
+    assert key in os.listdir(store.root)
+
+    # Once evicted, linking the same file again fails instead of pointing at nothing
+    bounty_state.delete(db, second, poster)
+    (row, _), = plan_eviction(db, max_total_bytes=0, grace_seconds=-1)[0]
+    assert evict(db, store, row) is True
+    third = bounty_state.create(db, poster, "c", "misc", 100, 10, "", "https://img.example/c", "Hue")
+    with pytest.raises(FileNotFoundError):
+        link(db, store, third, "https://img.example/c", key)
+    assert db.execute("SELECT image_key FROM bounties WHERE id = ?", third)[0]["image_key"] is None
+
+
+def test_access_log_forgets_images_past_the_resolution(monkeypatch):
+    writes = []
+
+    class FakeDb:
+        def execute(self, sql, *args):
+            writes.append(args[1])
+
+    clock = iter([100, 101, 102, 111, 112])
+    monkeypatch.setattr(images.time, "time", lambda: next(clock))
+    log = images.AccessLog(lambda: FakeDb(), resolution=10)
+    for name in ("a.jpg", "b.jpg", "a.jpg", "c.jpg", "a.jpg"):
+        log.touch(name)
+    assert writes == [images.image_hash(name) for name in ("a.jpg", "b.jpg", "c.jpg", "a.jpg")]
+    assert list(log._seen) == [images.image_hash("c.jpg"), images.image_hash("a.jpg")]
@@ -0,0 +1,53 @@
+import logging
+import threading
+import time
+
+import instrumentation
+from app import app
+from instrumentation import normalize_sql
+
+
+def test_normalize_sql_folds_literals():
+    assert normalize_sql("SELECT * FROM bounties\n WHERE id = 42 AND name = 'it''s' AND price > 1.5") == \
+        "SELECT * FROM bounties WHERE id = ? AND name = ? AND price > ?"
+    assert normalize_sql("SELECT id FROM users u WHERE u.id IN (1, 2, 3)") == "SELECT id FROM users u WHERE u.id IN (...)"
+    assert normalize_sql("SELECT bm25(bounties_fts, 10.0) FROM t2") == "SELECT bm25(bounties_fts, ?) FROM t2"
+
+
+def test_metrics_report_requests_queries_and_slow_requests(monkeypatch, caplog):
+    app.config['TESTING'] = True
+    client = app.test_client()
+    monkeypatch.setattr(instrumentation, "SLOW_REQUEST_SECONDS", 0)
+    with caplog.at_level(logging.WARNING, logger="instrumentation"):
+        client.get('/bounties')
+    assert any("slow request GET bounties -> 200" in r.getMessage() and "queries" in r.getMessage()
+               for r in caplog.records)
+
+    assert client.get('/metrics').status_code == 404
+    monkeypatch.setenv("METRICS_TOKEN", "scrape")
+    assert client.get('/metrics').status_code == 403
+    text = client.get('/metrics', headers={"Authorization": "Bearer scrape"}).get_data(as_text=True)
+    assert 'bountygo_http_request_duration_seconds_count{endpoint="bounties",method="GET",status="200"}' in text
+    assert 'bountygo_http_request_queries_bucket{endpoint="bounties",le="+Inf"}' in text
+    assert 'bountygo_db_query_seconds_count{statement="SELECT version, updated_at FROM table_versions WHERE name = ?"}' in text
+    assert "bountygo_db_pool_checkouts_total" in text
+
+
+def test_profiler_is_opt_in_and_samples_other_threads(monkeypatch):
+    client = app.test_client()
+    assert client.get('/metrics/profile?seconds=1').status_code == 404
+
+    stop = threading.Event()
+
+    def busy_worker():
+        while not stop.is_set():
+            time.sleep(0.001)
+
+    thread = threading.Thread(target=busy_worker)
+    thread.start()
+    try:
+        profile = instrumentation.sample_profile(0.1, interval=0.001)
+    finally:
+        stop.set()
+        thread.join()
+    assert "busy_worker (test_instrumentation.py:" in profile
@@ -0,0 +1,80 @@
+import pytest
+import requests
+
+import app as app_module
+from database import Database
+from jobs import JobQueue
+from migrations import migrate
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = Database(f"sqlite:///{tmp_path / 'test.db'}")
+    migrate(database)
+    return database
+
+
+def test_failed_jobs_back_off_then_give_up(db):
+    queue = JobQueue(lambda: db, workers=0, max_attempts=3)
+    calls, gave_up = [], []
+
+    @queue.handler("flaky", on_failure=lambda db, bounty_id: gave_up.append(bounty_id))
+    def flaky(db, bounty_id, succeed_on):
+        calls.append(bounty_id)
+        if len(calls) < succeed_on:
+            raise requests.exceptions.ConnectionError("upstream down")
+
+    queue.enqueue(db, "flaky", 1, succeed_on=2)
+    assert queue.run_pending() == 1
+    job = db.execute("SELECT * FROM jobs")[0]
+    assert job["status"] == "queued" and job["attempts"] == 1 and "ConnectionError" in job["last_error"]
+    assert queue.run_pending() == 0  # not due until the backoff passes
+
+    db.execute("UPDATE jobs SET run_after = 0")
+    assert queue.run_pending() == 1
+    assert db.execute("SELECT status FROM jobs")[0]["status"] == "done"
+
+    queue.enqueue(db, "flaky", 2, succeed_on=99)
+    for _ in range(3):
+        db.execute("UPDATE jobs SET run_after = 0 WHERE status = 'queued'")
+        queue.run_pending()
+    assert db.execute("SELECT status, attempts FROM jobs WHERE bounty_id = 2")[0] == {"status": "failed", "attempts": 3}
+    assert gave_up == [2]
+
+
+def test_finished_jobs_are_swept_after_the_retention_period(db):
+    queue = JobQueue(lambda: db, workers=0, retention=60, sweep_interval=0)
+    queue.handler("noop")(lambda db, bounty_id: None)
+    for bounty_id in (1, 2):
+        queue.enqueue(db, "noop", bounty_id)
+    queue.run_pending()
+    db.execute("UPDATE jobs SET finished_at = finished_at - 120 WHERE bounty_id = 1")
+    queue.enqueue(db, "noop", 3)
+    db.execute("UPDATE jobs SET run_after = run_after + 3600 WHERE bounty_id = 3")
+
+    queue.run_pending()
+    rows = db.execute("SELECT bounty_id, status FROM jobs ORDER BY id")
+    assert [(row["bounty_id"], row["status"]) for row in rows] == [(2, "done"), (3, "queued")]
+
+
+def test_order_is_listed_after_background_validation(logged_in, monkeypatch):
+    client, db = logged_in, app_module.db
+
+    monkeypatch.setattr(app_module.geocoder, "lookup", lambda key: "Hanoi, Vietnam" if key == "hanoi" else None)
+    form = {"item_name": "kettle", "category": "misc", "price": "10", "reward": "2",
+            "description": "d", "img_url": "https://img.example/k.jpg"}
+
+    resp = client.post('/order', data=dict(form, location="hanoi", idempotency_key="kettle-1"))
+    bounty_id = int(resp.headers['Location'].rsplit('/', 1)[1])
+    assert db.execute("SELECT status FROM bounties WHERE id = ?", bounty_id)[0]["status"] == "validating"
+    assert 'Verifying the delivery city' in client.get(f'/bounties/{bounty_id}').get_data(as_text=True)
+
+    app_module.job_queue.run_pending()
+    row = db.execute("SELECT status, dispatch_box FROM bounties WHERE id = ?", bounty_id)[0]
+    assert row == {"status": "pending", "dispatch_box": "Hanoi, Vietnam"}
+
+    resp = client.post('/order', data=dict(form, location="atlantis", idempotency_key="kettle-2"))
+    bounty_id = int(resp.headers['Location'].rsplit('/', 1)[1])
+    app_module.job_queue.run_pending()
+    assert db.execute("SELECT status FROM bounties WHERE id = ?", bounty_id)[0]["status"] == "rejected"
+    assert 'is not a city we could find' in client.get(f'/bounties/{bounty_id}').get_data(as_text=True)
@@ -0,0 +1,40 @@
+from metadata import MetadataExtractor, Rule, extract_metadata, register_site_rules, SITE_RULES
+
+
+def test_open_graph_wins_over_fallbacks():
+    html = ('<html><head><title> Plain </title><meta name="description" content="meta desc">'
+            '<meta property="og:description" content="og desc"><link rel="image_src" href="//cdn.example.com/a.jpg">'
+            '</head><body></body></html>')
+    assert extract_metadata(html, "https://shop.example.com/p/1") == {
+        "title": "Plain",
+        "image": "https://cdn.example.com/a.jpg",
+        "description": "og desc",
+    }
+
+
+def test_stops_once_every_field_is_resolved():
+    extractor = MetadataExtractor("https://shop.example.com/p/1")
+    extractor.feed('<head><meta property="og:title" content="T"><meta property="og:image" content="/i.png">')
+    assert not extractor.done
+    extractor.feed('<meta property="og:description" content="D">')
+    assert extractor.done
+
+
+def test_head_fallbacks_are_final_after_head_closes():
+    extractor = MetadataExtractor("https://shop.example.com/p/1")
+    extractor.feed('<head><title>T</title><meta name="image" content="/i.png"></head>')
+    assert extractor.done
+    assert extractor.result()["description"] is None
+
+
+def test_site_rules_read_the_body_until_matched():
+    html = '<head><title>Item</title></head><body><img class="big ux-image-magnifier-view__image" src="/x.jpg"></body>'
+    assert extract_metadata(html, "https://www.ebay.com/itm/1")["image"] == "https://www.ebay.com/x.jpg"
+    assert extract_metadata(html, "https://shop.example.com/itm/1")["image"] is None
+
+
+def test_register_site_rules(monkeypatch):
+    monkeypatch.setitem(SITE_RULES, "shop.example.", [])
+    register_site_rules("shop.example.", [Rule("image", "img", {"id": "hero"}, ("data-src", "src"), False)])
+    html = '<head></head><body><img id="hero" data-src="/hero.jpg"></body>'
+    assert extract_metadata(html, "https://shop.example.com/")["image"] == "https://shop.example.com/hero.jpg"
@@ -0,0 +1,43 @@
+import pytest
+
+import migrations
+import queryplans
+from database import Database
+
+
+@pytest.fixture
+def db(tmp_path):
+    return Database(f"sqlite:///{tmp_path / 'test.db'}")
+
+
+def test_money_columns_become_integer_cents(db, monkeypatch):
+    monkeypatch.setattr(migrations, "MIGRATIONS", [m for m in migrations.MIGRATIONS if m[0] <= 10])
+    migrations.migrate(db)
+    user = db.execute("INSERT INTO users (username, email, password_hash) VALUES ('u', 'u@x', 'h')")
+    for name in ("red camera", "blue camera", "green tea"):
+        db.execute("INSERT INTO bounties (poster_id, item_name, category, price, reward_fee, description, dispatch_box) "
+                   "VALUES (?, ?, 'misc', 1250, 300, 'desc', 'Hanoi')", user, name)
+    db.execute("INSERT INTO bounty_requests (bounty_id, traveler_id) VALUES (1, ?)", user)
+    db.execute("DELETE FROM bounties WHERE id = 3")
+    assert db.execute("SELECT price FROM bounties WHERE id = 1")[0]["price"] == 1250.0
+
+    monkeypatch.undo()
+    assert migrations.migrate(db) == [11, 12, 13, 14, 15, 16, 17]
+
+    rows = db.execute("SELECT id, typeof(price) AS price, typeof(reward_fee) AS reward FROM bounties ORDER BY id")
+    assert rows == [{"id": 1, "price": "integer", "reward": "integer"}, {"id": 2, "price": "integer", "reward": "integer"}]
+    assert db.execute("SELECT bounty_id FROM bounty_requests") == [{"bounty_id": 1}]
+    assert db.query("PRAGMA foreign_key_check") == []
+
+    # Search triggers are back and deleted ids are not reused
+    new = db.execute("INSERT INTO bounties (poster_id, item_name, category, price, reward_fee, description, dispatch_box) "
+                     "VALUES (?, 'black camera', 'misc', 1, 1, 'desc', 'Hanoi')", user)
+    assert new == 4
+    hits = db.execute("SELECT rowid FROM bounties_fts WHERE bounties_fts MATCH 'camera' ORDER BY rowid")
+    assert [row["rowid"] for row in hits] == [1, 2, 4]
+
+
+def test_hot_queries_are_index_backed(db):
+    migrations.migrate(db)
+    for name, (plan, scans) in queryplans.report(db).items():
+        assert not scans, f"{name}: {plan}"
@@ -0,0 +1,40 @@
+import pytest
+from werkzeug.security import generate_password_hash
+
+import app as app_module
+from passwords import HasherBusy, PasswordHasher
+
+
+def test_pool_verifies_and_upgrades_outdated_hashes():
+    hasher = PasswordHasher("pbkdf2:sha256:1000", workers=1)
+    stored = hasher.hash("secret")
+    assert stored.startswith("pbkdf2:sha256:1000$")
+    assert hasher.verify(stored, "secret") == (True, None)
+    assert hasher.verify(stored, "wrong") == (False, None)
+
+    old = generate_password_hash("secret", "pbkdf2:sha256:500")
+    matches, new_hash = hasher.verify(old, "secret")
+    assert matches and new_hash.startswith("pbkdf2:sha256:1000$")
+    assert hasher.verify(generate_password_hash("secret", "pbkdf2:sha256:500"), "wrong") == (False, None)
+
+
+def test_full_queue_raises_busy():
+    hasher = PasswordHasher("pbkdf2:sha256:1000", workers=1, queue=0, timeout=0.01)
+    hasher._slots.acquire()
+    with pytest.raises(HasherBusy):
+        hasher.hash("secret")
+
+
+def test_login_rehashes_and_rejects_unknown_users(client):
+    db = app_module.db
+    db.execute("DELETE FROM users WHERE username = 'rehash'")
+    old = generate_password_hash("secret", "pbkdf2:sha256:500")
+    db.execute("INSERT INTO users (username, email, password_hash) VALUES ('rehash', 'r@example.com', ?)", old)
+
+    form = {'username': 'rehash', 'email': 'r@example.com', 'password': 'secret'}
+    assert client.post('/login', data=form).status_code == 302
+    stored = db.execute("SELECT password_hash FROM users WHERE username = 'rehash'")[0]["password_hash"]
+    assert stored.startswith(app_module.passwords.method + "$")
+
+    assert client.post('/login', data=dict(form, username='nobody')).status_code == 400
+    assert client.post('/login', data=dict(form, password='wrong')).status_code == 400
@@ -0,0 +1,77 @@
+import sqlite3
+import time
+
+import pytest
+
+import bounty_state
+from database import Database
+from migrations import migrate
+from replicas import ReplicaRouter
+
+
+def copy(primary, path):
+    source, target = sqlite3.connect(primary), sqlite3.connect(path)
+    source.backup(target)
+    source.close()
+    target.close()
+
+
+@pytest.fixture
+def primary(tmp_path):
+    database = Database(f"sqlite:///{tmp_path / 'primary.db'}")
+    migrate(database)
+    database.path = str(tmp_path / 'primary.db')
+    return database
+
+
+def _post(db):
+    poster = db.execute("INSERT INTO users (username, email, password_hash) VALUES (?, ?, 'h')",
+                        f"u{time.monotonic_ns()}", f"{time.monotonic_ns()}@x")
+    return bounty_state.create(db, poster, "item", "misc", 100, 10, "desc", None, "Hanoi")
+
+
+def test_reads_go_to_a_fresh_replica_and_fall_back_when_it_lags(primary, tmp_path):
+    copy(primary.path, tmp_path / 'replica.db')
+    router = ReplicaRouter(primary, [f"sqlite:///{tmp_path / 'replica.db'}"], max_lag=0.05)
+    assert router.reader() is primary  # not checked yet
+
+    router.check()
+    replica = router.reader()
+    assert replica is not primary
+    # A user who just wrote reads their own change from the primary
+    assert router.reader(wrote_at=time.time()) is primary
+
+    bounty_id = _post(primary)
+    assert replica.execute("SELECT id FROM bounties WHERE id = ?", bounty_id) == []
+    copy(primary.path, tmp_path / 'replica.db')
+    router.check()
+    assert router.reader() is replica
+
+    # No writes since the copy, yet the heartbeat shows the replica falling behind
+    time.sleep(0.1)
+    router.check()
+    assert router.reader() is primary
+    assert router.replicas[0].lag > 0.05
+
+    copy(primary.path, tmp_path / 'replica.db')
+    router.check()
+    assert router.reader() is replica
+    assert replica.execute("SELECT id FROM bounties WHERE id = ?", bounty_id) == [{"id": bounty_id}]
+    assert 'bountygo_db_replica_healthy{replica="0"} 1' in router.metrics_text()
+
+
+def test_unreachable_replica_is_skipped(primary, tmp_path):
+    router = ReplicaRouter(primary, [f"sqlite:///{tmp_path / 'missing' / 'replica.db'}"])
+    router.check()
+    assert router.reader() is primary
+    assert not router.replicas[0].healthy and router.replicas[0].error
+
+
+def test_checks_run_in_the_background(primary, tmp_path):
+    copy(primary.path, tmp_path / 'replica.db')
+    router = ReplicaRouter(primary, [f"sqlite:///{tmp_path / 'replica.db'}"], check_interval=0.01)
+    router.start()
+    deadline = time.time() + 5
+    while not router.replicas[0].healthy and time.time() < deadline:
+        time.sleep(0.01)
+    assert router.reader() is not primary
@@ -0,0 +1,35 @@
+import time
+
+from limits import RateLimitItemPerMinute
+from limits.storage import storage_from_string
+from limits.strategies import FixedWindowRateLimiter
+
+from storage import SharedSessionCache, SharedStore
+
+
+def test_rate_limits_are_shared_between_workers(tmp_path):
+    uri = f"sqlite:///{tmp_path / 'state.db'}"
+    # Two storages on the same file stand in for two worker processes
+    limiters = [FixedWindowRateLimiter(storage_from_string(uri)) for _ in range(2)]
+    limit = RateLimitItemPerMinute(3)
+
+    assert [limiters[i % 2].hit(limit, "1.2.3.4") for i in range(4)] == [True, True, True, False]
+    assert limiters[0].hit(limit, "5.6.7.8")
+
+
+def test_counters_and_sessions_expire(tmp_path):
+    store = SharedStore(str(tmp_path / "state.db"), sweep_interval=0)
+    assert store.incr("c", 1, ttl=60) == 1
+    assert store.incr("c", 2, ttl=60) == 3
+    assert store.incr("gone", 5, ttl=-1) == 5
+    assert store.incr("gone", 1, ttl=60) == 1  # expired window restarts
+
+    sessions = SharedSessionCache(SharedStore(str(tmp_path / "state.db"), sweep_interval=0))
+    sessions.set("sid", {"user_id": 7}, timeout=60)
+    assert sessions.get("sid") == {"user_id": 7}
+    assert not sessions.add("sid", {"user_id": 8})
+
+    store.set("session:old", b"x", ttl=-1)
+    assert sessions.get("old") is None
+    assert store.sweep() == 1
+    assert store.get("c") == 3 and store.expires_at("c") > time.time()
@@ -0,0 +1,77 @@
+import pytest
+
+import bounty_state
+from database import Database
+from migrations import migrate
+from users import UserCache
+
+
+class CountingDb:
+
+    def __init__(self, db):
+        self.db = db
+        self.queries = 0
+
+    def execute(self, sql, *args):
+        self.queries += 1
+        return self.db.execute(sql, *args)
+
+
+@pytest.fixture
+def db(tmp_path):
+    database = Database(f"sqlite:///{tmp_path / 'test.db'}")
+    migrate(database)
+    return database
+
+
+def test_cache_reads_each_user_once_until_invalidated(db):
+    counting = CountingDb(db)
+    cache = UserCache(lambda: counting)
+    poster = db.execute("INSERT INTO users (username, email, password_hash) VALUES ('p', 'p@x', 'h')")
+
+    user = cache.get(poster)
+    assert user["username"] == "p" and "password_hash" not in user
+    user["username"] = "changed"
+    assert cache.get(poster)["username"] == "p"
+    assert cache.get(12345) is None
+    assert cache.get(12345) is None
+    assert counting.queries == 2
+
+    bounty_state.create(db, poster, "item", "misc", 100, 10, "desc", None, "Hanoi")
+    cache.handle("created", {"poster_id": poster})
+    assert cache.get(poster)["total_posted"] == 1
+    assert counting.queries == 3
+
+
+def test_expired_and_evicted_entries_are_reloaded(db):
+    counting = CountingDb(db)
+    cache = UserCache(lambda: counting, ttl=0, max_size=1)
+    a = db.execute("INSERT INTO users (username, email, password_hash) VALUES ('a', 'a@x', 'h')")
+    cache.get(a)
+    cache.get(a)
+    assert counting.queries == 2
+
+    cache.ttl = 60
+    b = db.execute("INSERT INTO users (username, email, password_hash) VALUES ('b', 'b@x', 'h')")
+    cache.get(b)
+    cache.get(a)
+    assert counting.queries == 4
+
+
+def test_completion_drops_only_the_poster_and_traveler(db, monkeypatch):
+    counting = CountingDb(db)
+    cache = UserCache(lambda: counting)
+    monkeypatch.setattr(bounty_state, "_listeners", [cache.handle])
+    poster, traveler, other = [db.execute("INSERT INTO users (username, email, password_hash) VALUES (?, ?, 'h')",
+                                          name, f"{name}@x") for name in ("p", "t", "o")]
+    bounty_id = bounty_state.create(db, poster, "item", "misc", 100, 10, "desc", None, "Hanoi")
+    bounty_state.claim(db, bounty_state.add_request(db, bounty_id, traveler), poster)
+    for user_id in (poster, traveler, other):
+        cache.get(user_id)
+    queries = counting.queries
+
+    assert bounty_state.complete(db, bounty_id, poster) == bounty_id
+    assert cache.get(poster)["completed_posted"] == 1
+    assert cache.get(traveler)["completed_orders"] == 1
+    cache.get(other)
+    assert counting.queries == queries + 2
@@ -0,0 +1,67 @@
+"""Cached lookups of users by id.
+
+``UserCache.get(user_id)`` returns the public columns of a users row (no
+password hash) from process memory, reading the table at most once per
+``USER_CACHE_TTL`` seconds per user. It listens to bounty_state events and
+drops the users whose counters a transition changed; writes made by other
+worker processes show up once the entry expires. app.py loads the signed-in
+user into ``g.user`` through it.
+
+``create`` registers a user with one insert; the unique username and email
+columns reject duplicates, so there is no need to look first.
+"""
+import os
+import threading
+import time
+
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "30"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+
+COLUMNS = "id, username, email, total_posted, completed_posted, total_claimed, completed_orders"
+
+_CREATE = """
+    INSERT INTO users (username, email, password_hash) VALUES ({username}, {email}, {password_hash})
+    ON CONFLICT DO NOTHING
+"""
+
+
+def create(db, username, email, password_hash):
+    """Insert a user and return the id; None if the username or email is taken."""
+    if db.supports_returning:
+        rows = db.query(_CREATE.format(username=":username", email=":email", password_hash=":password_hash")
+                        + " RETURNING id", username=username, email=email, password_hash=password_hash)
+        return rows[0]["id"] if rows else None
+    return db.execute(_CREATE.format(username="?", email="?", password_hash="?"), username, email, password_hash)
+
+
+class UserCache:
+
+    def __init__(self, get_db, ttl=USER_CACHE_TTL, max_size=USER_CACHE_SIZE):
+        self.get_db = get_db
+        self.ttl = ttl
+        self.max_size = max_size
+        self._users = {}  # id -> (expires_at, row or None)
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        """The user's row as a dict, or None if there is no such user."""
+        with self._lock:
+            cached = self._users.get(user_id)
+        if cached is None or cached[0] <= time.time():
+            rows = self.get_db().execute(f"SELECT {COLUMNS} FROM users WHERE id = ?", user_id)
+            cached = (time.time() + self.ttl, rows[0] if rows else None)
+            with self._lock:
+                self._users.pop(user_id, None)
+                while len(self._users) >= self.max_size:
+                    del self._users[next(iter(self._users))]
+                self._users[user_id] = cached
+        return dict(cached[1]) if cached[1] is not None else None
+
+    def invalidate(self, *user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._users.pop(user_id, None)
+
+    def handle(self, event, bounty):
+        """bounty_state.on_change listener."""
+        self.invalidate(bounty.get("poster_id"), bounty.get("traveler_id"))